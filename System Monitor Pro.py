@@ -1,75 +1,312 @@
-import psutil
 import time
+# Момент начала загрузки модуля: от него считается время холодного старта
+STARTED_AT = time.perf_counter()
+import psutil
+import numpy as np
+import argparse
 import logging
 import json
 import csv
 import platform
-import GPUtil
-from tkinter import filedialog, messagebox
+import math
+import signal
+import sys
 from datetime import datetime
-import customtkinter as ctk
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-from matplotlib.figure import Figure
-from tkinter import ttk
-from matplotlib import style
-from PIL import Image, ImageTk
 import threading
-import requests
+import asyncio
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FuturesTimeout
+import queue
+import heapq
+import itertools
 import os
-import boto3
+import select
+import socket
+import sqlite3
+import struct
+import zlib
+import gzip
+import shutil
+import tempfile
+import re
+import contextlib
+import hmac
+import ipaddress
+import importlib.util
+from collections import Counter, namedtuple, deque
+from operator import itemgetter
+from logging.handlers import RotatingFileHandler
+from types import MappingProxyType, SimpleNamespace
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Конфигурация: схема задаёт для каждого ключа значение по умолчанию и проверку,
+# которая приводит значение к нужному типу или бросает ConfigError. Загруженная
+# конфигурация неизменяема (MappingProxyType, списки - кортежи) и целиком
+# заменяется при перезагрузке файла
+CONFIG_PATH = "config.json"
+
+class ConfigError(ValueError):
+    pass
+
+def number(minimum=None, maximum=None, integer=False):
+    def check(value):
+        if isinstance(value, float) and integer and value.is_integer():
+            value = int(value)
+        if isinstance(value, bool) or not isinstance(value, int if integer else (int, float)):
+            raise ConfigError(f"expected {'an integer' if integer else 'a number'}, got {value!r}")
+        if minimum is not None and value < minimum:
+            raise ConfigError(f"must be at least {minimum}, got {value}")
+        if maximum is not None and value > maximum:
+            raise ConfigError(f"must be at most {maximum}, got {value}")
+        return value
+    return check
+
+def text(value):
+    if not isinstance(value, str):
+        raise ConfigError(f"expected a string, got {value!r}")
+    return value
+
+def choice(*options):
+    def check(value):
+        if value not in options:
+            raise ConfigError(f"expected one of {', '.join(options)}, got {value!r}")
+        return value
+    return check
+
+def text_list(value):
+    if not isinstance(value, list):
+        raise ConfigError(f"expected a list of strings, got {value!r}")
+    return tuple(text(item) for item in value)
+
+def number_map(minimum=None):
+    check_number = number(minimum)
+
+    def check(value):
+        if not isinstance(value, dict):
+            raise ConfigError(f"expected an object, got {value!r}")
+        return MappingProxyType({text(key): check_number(item) for key, item in value.items()})
+    return check
+
+percent = number(0, 100)
+port = number(0, 65535, integer=True)
+
+CONFIG_SCHEMA = {
+    "cpu_threshold": (80, percent),
+    "memory_threshold": (80, percent),
+    "disk_threshold": (80, percent),
+    "gpu_threshold": (80, percent),
+    "gpu_memory_threshold": (80, percent),
+    # Не чаще опроса очереди снимков из UI
+    "update_interval": (5000, number(100, integer=True)),
+    "max_processes": (10, number(0, integer=True)),
+    "max_connections": (10, number(0, integer=True)),
+    "theme": ("dark", choice("dark", "light")),
+    "language": ("en", choice("en", "ru")),
+    "telegram_bot_token": ("", text),
+    "telegram_chat_id": ("", text),
+    "google_sheets_api_key": ("", text),
+    "aws_access_key": ("", text),
+    "aws_secret_key": ("", text),
+    "collector_backend": ("auto", choice("auto", "psutil", "procfs")),
+    "history_size": (86400, number(1, integer=True)),
+    "chart_window": (600, number(1)),
+    "history_db": ("system_monitor.db", text),
+    "retention_raw_days": (2, number(0)),
+    "retention_1m_days": (30, number(0)),
+    "retention_1h_days": (365, number(0)),
+    "metrics_port": (0, port),
+    "metrics_host": ("0.0.0.0", text),
+    "exporter_top_processes": (10, number(0, integer=True)),
+    "gpu_backend": ("auto", choice("auto", "nvml", "gputil", "none", "fake")),
+    "alert_duration": (0, number(0)),
+    "alert_clear_margin": (5, number(0, 100)),
+    "alert_cooldown": (300, number(0)),
+    "telegram_api_url": ("https://api.telegram.org", text),
+    "webhook_urls": ([], text_list),
+    "notify_digest_window": (10, number(0)),
+    "notify_queue_size": (100, number(1, integer=True)),
+    "notify_max_retries": (5, number(0, integer=True)),
+    "log_max_bytes": (10485760, number(0, integer=True)),
+    "log_backup_count": (5, number(0, integer=True)),
+    "s3_bucket": ("", text),
+    "s3_prefix": ("system-monitor/", text),
+    "s3_endpoint_url": ("", text),
+    "s3_region": ("", text),
+    "ship_paths": (["system_monitor.log"], text_list),
+    "ship_state": ("system_monitor.ship.json", text),
+    "ship_interval": (0, number(0)),
+    "process_history_size": (17280, number(1, integer=True)),
+    "process_history_top_k": (10, number(1, integer=True)),
+    "process_history_window": (300, number(1)),
+    "process_history_max_series": (32, number(1, integer=True)),
+    "network_top_n": (10, number(1, integer=True)),
+    "mount_timeout": (1.0, number(0.01)),
+    "mount_refresh_interval": (60, number(1)),
+    "fleet_port": (0, port),
+    "fleet_host": ("0.0.0.0", text),
+    "fleet_token": ("", text),
+    "agent_name": ("", text),
+    "agent_batch_size": (5, number(1, integer=True)),
+    "agent_flush_interval": (5, number(0.1)),
+    "agent_keyframe_interval": (60, number(1, integer=True)),
+    "collector_intervals": ({"mounts": 30}, number_map(0)),
+    "collector_budgets": ({"processes": 0.5, "network": 0.5, "mounts": 0.5, "gpus": 0.25}, number_map(0)),
+    "background_collectors": ([], text_list),
+    "journal_dir": ("system_monitor.events", text),
+    "journal_segment_bytes": (1048576, number(1024, integer=True)),
+    "journal_segment_seconds": (86400, number(1)),
+    "journal_retention_days": (90, number(0)),
+    "journal_max_bytes": (104857600, number(0, integer=True)),
+    "notifications_page_size": (200, number(1, integer=True))
+}
+
+# Ключи, которые применяются на лету; остальные (порты, пути, размеры буферов,
+# бэкенды, язык) вступают в силу после перезапуска
+HOT_RELOAD_KEYS = {
+    "cpu_threshold", "memory_threshold", "disk_threshold", "gpu_threshold", "gpu_memory_threshold",
+    "update_interval", "max_processes", "max_connections", "theme", "chart_window",
+    "alert_duration", "alert_clear_margin", "alert_cooldown", "network_top_n",
+    "collector_intervals", "collector_budgets", "background_collectors", "notifications_page_size",
+    "exporter_top_processes"
+}
+
+def parse_config(raw, strict=False):
+    # Возвращает (конфигурация, предупреждения). Неизвестные ключи только предупреждают;
+    # неверные значения при strict отклоняют файл, иначе заменяются значениями по умолчанию
+    if not isinstance(raw, dict):
+        raise ConfigError("expected a JSON object")
+    values = {}
+    errors = []
+    for key, (default, check) in CONFIG_SCHEMA.items():
+        try:
+            values[key] = check(raw[key]) if key in raw else check(default)
+        except ConfigError as e:
+            errors.append(f"{key}: {e}")
+            values[key] = check(default)
+    if errors and strict:
+        raise ConfigError("; ".join(errors))
+    warnings = [f"{error}, using the default" for error in errors]
+    warnings += [f"{key}: unknown key, ignored" for key in raw if key not in CONFIG_SCHEMA]
+    return MappingProxyType(values), warnings
+
+def config_to_json(values):
+    return {
+        key: dict(value) if isinstance(value, MappingProxyType) else list(value) if isinstance(value, tuple) else value
+        for key, value in values.items()
+    }
+
+def write_json_atomic(path, data, indent=None):
+    # Запись через временный файл в том же каталоге: читатель видит либо старый, либо новый файл целиком
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f, indent=indent)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+def save_config(values, path=CONFIG_PATH):
+    write_json_atomic(path, config_to_json(values), indent=4)
 
-# Настройка логирования
+def load_config(path=CONFIG_PATH, strict=False):
+    try:
+        with open(path, "r") as f:
+            return parse_config(json.load(f), strict)
+    except FileNotFoundError:
+        values, warnings = parse_config({})
+        save_config(values, path)
+        return values, warnings
+    except (json.JSONDecodeError, ConfigError) as e:
+        if strict:
+            raise ConfigError(str(e)) from e
+        values, _ = parse_config({})
+        return values, [f"{e}, using defaults for every key"]
+
+def set_config(values):
+    global config
+    config = values
+
+# Перезагрузка по изменению файла: раз в тик сравниваются mtime, размер и inode
+# (атомарная замена меняет inode). Файл с ошибками отклоняется целиком
+class ConfigWatcher:
+    def __init__(self, path=CONFIG_PATH):
+        self.path = path
+        self._stamp = self._stat()
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def poll(self):
+        stamp = self._stat()
+        if stamp is None or stamp == self._stamp:
+            return None
+        self._stamp = stamp
+        try:
+            values, warnings = load_config(self.path, strict=True)
+        except (OSError, ConfigError) as e:
+            logging.error(f"Ignoring invalid {self.path}, keeping the current config: {e}")
+            return None
+        for warning in warnings:
+            logging.warning(f"{self.path}: {warning}")
+        return values
+
+config, config_warnings = load_config()
+
+# Настройка логирования: журнал ротируется по размеру, сегменты .1 ... .N
+# досылаются в облако через LogShipper
 logging.basicConfig(
-    filename='system_monitor.log',
+    handlers=[RotatingFileHandler('system_monitor.log', maxBytes=config["log_max_bytes"], backupCount=config["log_backup_count"])],
     level=logging.INFO,
     format='%(asctime)s - %(message)s'
 )
+for warning in config_warnings:
+    logging.warning(f"{CONFIG_PATH}: {warning}")
 
-# Загрузка конфигурации из файла
-def load_config():
-    default_config = {
-        "cpu_threshold": 80,
-        "memory_threshold": 80,
-        "disk_threshold": 80,
-        "gpu_threshold": 80,
-        "gpu_memory_threshold": 80,
-        "update_interval": 5000,
-        "max_processes": 10,
-        "max_connections": 10,
-        "theme": "dark",
-        "language": "en",
-        "telegram_bot_token": "",
-        "telegram_chat_id": "",
-        "google_sheets_api_key": "",
-        "aws_access_key": "",
-        "aws_secret_key": ""
-    }
-    try:
-        with open("config.json", "r") as f:
-            config = json.load(f)
-            for key, value in default_config.items():
-                if key not in config:
-                    config[key] = value
-            return config
-    except FileNotFoundError:
-        with open("config.json", "w") as f:
-            json.dump(default_config, f, indent=4)
-        return default_config
-
-config = load_config()
-
-# Пороги для уведомлений
-CPU_THRESHOLD = config["cpu_threshold"]
-MEMORY_THRESHOLD = config["memory_threshold"]
-DISK_THRESHOLD = config["disk_threshold"]
-GPU_THRESHOLD = config["gpu_threshold"]
-GPU_MEMORY_THRESHOLD = config["gpu_memory_threshold"]
-UPDATE_INTERVAL = config["update_interval"]
-MAX_PROCESSES = config["max_processes"]
-MAX_CONNECTIONS = config["max_connections"]
-THEME = config["theme"]
+# Язык фиксируется при запуске: по переведённым названиям ищутся вкладки
 LANGUAGE = config["language"]
 
+# Интервал опроса очереди снимков из UI и бюджет времени UI-потока на один тик
+UI_POLL_INTERVAL = 100
+UI_TICK_BUDGET_MS = 50
+
+# Отметки холодного старта GUI (мс от начала загрузки модуля), выводятся по --startup-time
+STARTUP_MARKS = {}
+
+def mark_startup(stage):
+    STARTUP_MARKS[stage] = (time.perf_counter() - STARTED_AT) * 1000
+
+
+# Диапазоны истории для графиков и экспорта (секунды); "live" - буфер в памяти
+HISTORY_RANGES = {"live": None, "1h": 3600, "24h": 86400, "7d": 7 * 86400, "30d": 30 * 86400}
+# Максимум точек при чтении диапазона: по нему выбирается уровень агрегации
+MAX_RANGE_POINTS = 5000
+# Как часто перечитывать выбранный диапазон из хранилища (секунды)
+RANGE_REFRESH_INTERVAL = 30
+
+# Коллекторы, данные которых видны только на своей вкладке: пока вкладка скрыта, они не запускаются.
+# Скан процессов сюда не входит: на нём держатся история процессов и дерево с cgroup,
+# при скрытой вкладке пропускается только отрисовка таблиц
+TAB_COLLECTORS = {"network": ("network",)}
+
+# Виды вкладки процессов
+PROCESS_VIEWS = ("Top", "Tree", "Cgroups")
+
+# Фильтры вкладки уведомлений: метрики журнала событий и диапазон времени
+NOTIFICATION_FILTERS = {"All": None, "CPU": ("cpu",), "Memory": ("memory",), "Disk": ("disk",), "GPU": ("gpu", "gpu_memory")}
+NOTIFICATION_RANGES = {"all": None, **{name: span for name, span in HISTORY_RANGES.items() if span}}
+
+# Число ячеек в строке тепловой полосы ядер CPU
+HEAT_STRIP_COLUMNS = 32
+
 # Локализация
 translations = {
     "en": {
@@ -81,6 +318,8 @@ translations = {
         "temperature": "Temperature",
         "processes": "Processes",
         "network": "Network",
+        "disks": "Disks",
+        "fleet": "Fleet",
         "notifications": "Notifications",
         "settings": "Settings",
         "system_info": "System Info",
@@ -89,6 +328,7 @@ translations = {
         "clear_notifications": "Clear Notifications",
         "filter_notifications": "Filter Notifications",
         "terminate_process": "Terminate Process",
+        "terminate_tree": "Terminate Tree",
         "send_to_cloud": "Send to Cloud",
         "cpu_alert": "CPU Alert",
         "memory_alert": "Memory Alert",
@@ -109,6 +349,8 @@ translations = {
         "temperature": "Температура",
         "processes": "Процессы",
         "network": "Сеть",
+        "disks": "Диски",
+        "fleet": "Серверы",
         "notifications": "Уведомления",
         "settings": "Настройки",
         "system_info": "Информация о системе",
@@ -117,6 +359,7 @@ translations = {
         "clear_notifications": "Очистить уведомления",
         "filter_notifications": "Фильтровать уведомления",
         "terminate_process": "Завершить процесс",
+        "terminate_tree": "Завершить дерево",
         "send_to_cloud": "Отправить в облако",
         "cpu_alert": "Оповещение CPU",
         "memory_alert": "Оповещение памяти",
@@ -130,161 +373,3898 @@ translations = {
     }
 }
 
-def translate(key):
-    return translations[LANGUAGE].get(key, key)
+def translate(key):
+    return translations[LANGUAGE].get(key, key)
+
+# Источники данных: psutil работает везде, на Linux можно читать /proc напрямую
+PROCESS_SORT_KEYS = {
+    'cpu': lambda p: p['cpu'],
+    'memory': lambda p: p['memory'],
+    'io': lambda p: p['io'],
+    'threads': lambda p: p['threads']
+}
+
+# cgroup процесса: в v2 одна строка "0::/путь", в v1 берётся иерархия systemd
+# (по ней видны юниты и контейнеры) или первая из перечисленных
+def read_cgroup(path):
+    try:
+        with open(path) as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return None
+    paths = {}
+    for line in lines:
+        _, controllers, cgroup = line.split(":", 2)
+        paths[controllers] = cgroup
+    return paths.get("") or paths.get("name=systemd") or next(iter(paths.values()), None)
+
+TCP_STATES = {
+    '01': 'ESTABLISHED', '02': 'SYN_SENT', '03': 'SYN_RECV', '04': 'FIN_WAIT1',
+    '05': 'FIN_WAIT2', '06': 'TIME_WAIT', '07': 'CLOSE', '08': 'CLOSE_WAIT',
+    '09': 'LAST_ACK', '0A': 'LISTEN', '0B': 'CLOSING'
+}
+
+TCP_STATES_RAW = {key.encode(): value for key, value in TCP_STATES.items()}
+
+# Накопленные счётчики интерфейса (как в psutil.net_io_counters(pernic=True))
+NicCounters = namedtuple("NicCounters", [
+    "rx_bytes", "tx_bytes", "rx_packets", "tx_packets", "rx_errors", "tx_errors"
+])
+
+# Накопленные счётчики блочного устройства; время - в миллисекундах.
+# queue_time (взвешенное время в очереди) есть только в /proc/diskstats
+DiskCounters = namedtuple("DiskCounters", [
+    "reads", "writes", "read_bytes", "write_bytes", "read_time", "write_time", "busy_time", "queue_time"
+])
+
+CpuTimes = namedtuple("CpuTimes", [
+    "user", "nice", "system", "idle", "iowait", "irq", "softirq", "steal", "guest", "guest_nice"
+])
+
+# Таблица процессов: объекты psutil.Process кэшируются между тиками,
+# чтобы cpu_percent считался по дельте, а не возвращал 0.0 для нового объекта
+class ProcessTable:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cache = {}
+        self.rows = []
+
+    def _read(self, proc):
+        with proc.oneshot():
+            memory_info = proc.memory_info()
+            try:
+                io = proc.io_counters()
+                io_bytes = (io.read_bytes + io.write_bytes) / (1024 ** 2)
+            except (psutil.AccessDenied, AttributeError, NotImplementedError):
+                io_bytes = 0.0
+            return {
+                'pid': proc.pid,
+                'ppid': proc.ppid(),
+                'name': proc.name(),
+                'cpu': proc.cpu_percent(),
+                'memory': memory_info.rss / (1024 ** 2),
+                'io': io_bytes,
+                'threads': proc.num_threads(),
+                'create_time': proc.create_time()
+            }
+
+    def _handle(self, pid):
+        proc = self._cache.get(pid)
+        try:
+            # is_running() сверяет create_time: PID мог быть переиспользован другим процессом
+            if proc is None or not proc.is_running():
+                proc = psutil.Process(pid)
+                self._cache[pid] = proc
+            return proc
+        except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+            self._cache.pop(pid, None)
+            return None
+
+    def refresh(self):
+        with self._lock:
+            pids = set(psutil.pids())
+            for pid in list(self._cache):
+                if pid not in pids:
+                    del self._cache[pid]
+            rows = []
+            for pid in pids:
+                proc = self._handle(pid)
+                if proc is None:
+                    continue
+                try:
+                    rows.append(self._read(proc))
+                except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+                    self._cache.pop(pid, None)
+            self.rows = rows
+            return rows
+
+class CollectorBackend:
+    name = "base"
+
+    def cpu_times(self):
+        raise NotImplementedError
+
+    def memory(self):
+        raise NotImplementedError
+
+    def processes(self):
+        raise NotImplementedError
+
+    def tcp_sockets(self):
+        # Кортежи (локальный адрес, удалённый IP или None, удалённый порт, состояние, PID)
+        raise NotImplementedError
+
+    def interfaces(self):
+        raise NotImplementedError
+
+    def disk_io(self):
+        raise NotImplementedError
+
+    def temperature(self):
+        raise NotImplementedError
+
+    def num_fds(self, pid):
+        raise NotImplementedError
+
+    def cgroup(self, pid):
+        # psutil не даёт cgroup процесса: на Linux путь читается из /proc напрямую
+        return read_cgroup(os.path.join("/proc", str(pid), "cgroup"))
+
+class PsutilBackend(CollectorBackend):
+    name = "psutil"
+
+    def __init__(self):
+        self.process_table = ProcessTable()
+
+    def cpu_times(self):
+        return psutil.cpu_times(percpu=True)
+
+    def memory(self):
+        mem = psutil.virtual_memory()
+        return {
+            'percent': mem.percent,
+            'used': mem.used / (1024 ** 2),
+            'total': mem.total / (1024 ** 2)
+        }
+
+    def processes(self):
+        return self.process_table.refresh()
+
+    def num_fds(self, pid):
+        try:
+            return psutil.Process(pid).num_fds()
+        except (psutil.Error, AttributeError):
+            return None
+
+    def tcp_sockets(self):
+        return [
+            (
+                f"{conn.laddr.ip}:{conn.laddr.port}",
+                conn.raddr.ip if conn.raddr else None,
+                conn.raddr.port if conn.raddr else 0,
+                conn.status,
+                conn.pid
+            )
+            for conn in psutil.net_connections(kind='tcp')
+        ]
+
+    def interfaces(self):
+        return {
+            name: NicCounters(c.bytes_recv, c.bytes_sent, c.packets_recv, c.packets_sent, c.errin, c.errout)
+            for name, c in psutil.net_io_counters(pernic=True).items()
+        }
+
+    def disk_io(self):
+        return {
+            name: DiskCounters(
+                c.read_count, c.write_count, c.read_bytes, c.write_bytes,
+                c.read_time, c.write_time, getattr(c, 'busy_time', 0), None
+            )
+            for name, c in (psutil.disk_io_counters(perdisk=True) or {}).items()
+        }
+
+    def temperature(self):
+        try:
+            temps = psutil.sensors_temperatures()
+            if temps and 'coretemp' in temps:
+                return temps['coretemp'][0].current
+            elif temps and 'k10temp' in temps:
+                return temps['k10temp'][0].current
+            return None
+        except Exception as e:
+            logging.error(f"Error getting CPU temperature: {e}")
+            return None
+
+# Прямое чтение /proc: файлы читаются в один переиспользуемый буфер и разбираются целиком
+class ProcfsBackend(CollectorBackend):
+    name = "procfs"
+
+    def __init__(self, root="/proc", hwmon_root="/sys/class/hwmon"):
+        self.root = root
+        self.hwmon_root = hwmon_root
+        self.clock_ticks = os.sysconf("SC_CLK_TCK")
+        self.page_size = os.sysconf("SC_PAGE_SIZE")
+        self._buffer = bytearray(64 * 1024)
+        self._proc_times = {}
+        self._hosts = {}
+        self._boot_time = None
+
+    @staticmethod
+    def available(root="/proc"):
+        return platform.system() == "Linux" and os.path.exists(os.path.join(root, "stat"))
+
+    def _read(self, path):
+        fd = os.open(os.path.join(self.root, path), os.O_RDONLY)
+        try:
+            total = 0
+            while True:
+                with memoryview(self._buffer) as view, view[total:] as tail:
+                    count = os.readv(fd, [tail])
+                if count == 0:
+                    return bytes(self._buffer[:total])
+                total += count
+                if total == len(self._buffer):
+                    self._buffer.extend(bytes(len(self._buffer)))
+        finally:
+            os.close(fd)
+
+    @property
+    def boot_time(self):
+        # btime из /proc/stat: от него считается время запуска процессов, как и в psutil
+        if self._boot_time is None:
+            for line in self._read("stat").split(b"\n"):
+                if line.startswith(b"btime "):
+                    self._boot_time = float(line.split()[1])
+                    break
+            else:
+                self._boot_time = psutil.boot_time()
+        return self._boot_time
+
+    def cpu_times(self):
+        result = []
+        for line in self._read("stat").split(b"\n"):
+            if line.startswith(b"cpu") and line[3:4].isdigit():
+                values = [int(value) / self.clock_ticks for value in line.split()[1:11]]
+                result.append(CpuTimes(*(values + [0.0] * (10 - len(values)))))
+            elif result:
+                break
+        return result
+
+    def memory(self):
+        fields = {}
+        for line in self._read("meminfo").split(b"\n"):
+            key, _, rest = line.partition(b":")
+            if rest:
+                fields[key] = int(rest.split()[0]) * 1024
+        total = fields[b"MemTotal"]
+        free = fields.get(b"MemFree", 0)
+        cached = fields.get(b"Cached", 0) + fields.get(b"SReclaimable", 0)
+        buffers = fields.get(b"Buffers", 0)
+        available = fields.get(b"MemAvailable", free + buffers + cached)
+        used = total - free - buffers - cached
+        if used < 0:
+            used = total - free
+        return {
+            'percent': round((total - available) / total * 100, 1),
+            'used': used / (1024 ** 2),
+            'total': total / (1024 ** 2)
+        }
+
+    def _io_bytes(self, pid):
+        try:
+            data = self._read(f"{pid}/io")
+        except OSError:
+            return 0.0
+        total = 0
+        for line in data.split(b"\n"):
+            if line.startswith(b"read_bytes:") or line.startswith(b"write_bytes:"):
+                total += int(line.split()[1])
+        return total / (1024 ** 2)
+
+    def processes(self):
+        now = time.monotonic()
+        seen = {}
+        rows = []
+        for entry in os.listdir(self.root):
+            if not entry.isdigit():
+                continue
+            try:
+                stat = self._read(f"{entry}/stat")
+            except OSError:
+                continue
+            # Имя процесса может содержать пробелы и скобки, поэтому ищем последнюю ')'
+            end = stat.rindex(b")")
+            name = stat[stat.index(b"(") + 1:end].decode(errors="replace")
+            fields = stat[end + 2:].split()
+            ticks = int(fields[11]) + int(fields[12])
+            pid = int(entry)
+            # starttime отличает переиспользованный PID
+            key = (pid, fields[19])
+            previous = self._proc_times.get(key)
+            cpu = 0.0
+            if previous and now > previous[1]:
+                cpu = (ticks - previous[0]) / self.clock_ticks / (now - previous[1]) * 100
+            seen[key] = (ticks, now)
+            rows.append({
+                'pid': pid,
+                'ppid': int(fields[1]),
+                'name': name,
+                'cpu': round(cpu, 1),
+                'memory': int(fields[21]) * self.page_size / (1024 ** 2),
+                'io': self._io_bytes(entry),
+                'threads': int(fields[17]),
+                'create_time': self.boot_time + int(fields[19]) / self.clock_ticks
+            })
+        self._proc_times = seen
+        return rows
+
+    def num_fds(self, pid):
+        # Каталог fd чужих процессов без прав недоступен: это не сбой бэкенда
+        try:
+            return len(os.listdir(os.path.join(self.root, str(pid), "fd")))
+        except (PermissionError, FileNotFoundError):
+            return None
+
+    def cgroup(self, pid):
+        return read_cgroup(os.path.join(self.root, str(pid), "cgroup"))
+
+    @staticmethod
+    def _decode_address(address):
+        host, port = address.split(b":")
+        packed = bytes.fromhex(host.decode())
+        # Адрес хранится как последовательность 32-битных слов в порядке байтов хоста (little-endian)
+        packed = b"".join(packed[i:i + 4][::-1] for i in range(0, len(packed), 4))
+        family = socket.AF_INET if len(packed) == 4 else socket.AF_INET6
+        return socket.inet_ntop(family, packed), int(port, 16)
+
+    def socket_inodes(self):
+        inodes = {}
+        for entry in os.listdir(self.root):
+            if not entry.isdigit():
+                continue
+            fd_dir = os.path.join(self.root, entry, "fd")
+            try:
+                fds = os.listdir(fd_dir)
+            except OSError:
+                continue
+            for fd in fds:
+                try:
+                    link = os.readlink(os.path.join(fd_dir, fd))
+                except OSError:
+                    continue
+                if link.startswith("socket:["):
+                    inodes[int(link[8:-1])] = int(entry)
+        return inodes
+
+    def _address(self, raw):
+        # Удалённые хосты повторяются у тысяч сокетов: разобранные адреса кэшируются
+        host, _, port = raw.partition(b":")
+        ip = self._hosts.get(host)
+        if ip is None:
+            if len(self._hosts) >= 65536:
+                self._hosts.clear()
+            ip = self._hosts[host] = self._decode_address(raw)[0]
+        return ip, int(port, 16)
+
+    def tcp_sockets(self):
+        entries = []
+        for path in ("net/tcp", "net/tcp6"):
+            try:
+                data = self._read(path)
+            except OSError:
+                continue
+            for line in data.split(b"\n")[1:]:
+                parts = line.split()
+                if len(parts) < 10:
+                    continue
+                entries.append((parts[1], parts[2], TCP_STATES_RAW.get(parts[3]), int(parts[9])))
+        # Карта inode -> PID строится один раз на вызов, а не для каждого соединения
+        inodes = self.socket_inodes() if entries else {}
+        sockets = []
+        for local, remote, state, inode in entries:
+            local_ip, local_port = self._address(local)
+            remote_ip, remote_port = self._address(remote)
+            sockets.append((f"{local_ip}:{local_port}", remote_ip if remote_port else None, remote_port, state, inodes.get(inode)))
+        return sockets
+
+    def interfaces(self):
+        counters = {}
+        # Первые две строки /proc/net/dev - заголовок
+        for line in self._read("net/dev").split(b"\n")[2:]:
+            name, _, rest = line.partition(b":")
+            fields = rest.split()
+            if len(fields) < 16:
+                continue
+            counters[name.strip().decode()] = NicCounters(
+                int(fields[0]), int(fields[8]), int(fields[1]), int(fields[9]), int(fields[2]), int(fields[10])
+            )
+        return counters
+
+    def disk_io(self):
+        counters = {}
+        for line in self._read("diskstats").split(b"\n"):
+            fields = line.split()
+            if len(fields) < 14:
+                continue
+            # Секторы в /proc/diskstats всегда по 512 байт
+            counters[fields[2].decode()] = DiskCounters(
+                int(fields[3]), int(fields[7]), int(fields[5]) * 512, int(fields[9]) * 512,
+                int(fields[6]), int(fields[10]), int(fields[12]), int(fields[13])
+            )
+        return counters
+
+    def temperature(self):
+        if not os.path.isdir(self.hwmon_root):
+            return None
+        try:
+            sensors = {}
+            for entry in os.listdir(self.hwmon_root):
+                with open(os.path.join(self.hwmon_root, entry, "name")) as f:
+                    sensors[f.read().strip()] = entry
+            for name in ('coretemp', 'k10temp'):
+                if name in sensors:
+                    with open(os.path.join(self.hwmon_root, sensors[name], "temp1_input")) as f:
+                        return int(f.read()) / 1000
+            return None
+        except (OSError, ValueError) as e:
+            logging.error(f"Error getting CPU temperature: {e}")
+            return None
+
+def select_backend(name):
+    if name == "procfs" or (name == "auto" and ProcfsBackend.available()):
+        try:
+            return ProcfsBackend()
+        except (OSError, ValueError, AttributeError) as e:
+            logging.error(f"procfs backend is unavailable, using psutil: {e}")
+    return _psutil_backend
+
+_psutil_backend = PsutilBackend()
+_backend = select_backend(config["collector_backend"])
+
+def _collect(method, *args):
+    try:
+        return getattr(_backend, method)(*args)
+    except (OSError, ValueError, IndexError, KeyError) as e:
+        if _backend is _psutil_backend:
+            raise
+        logging.error(f"{_backend.name} backend failed in {method}, falling back to psutil: {e}")
+        return getattr(_psutil_backend, method)(*args)
+
+# Загрузка CPU считается по разнице двух снимков cpu_times, без блокирующего ожидания
+class CpuSampler:
+    # Время гостевых ОС уже учтено в user/nice (как в psutil.cpu_percent)
+    excluded_fields = ('guest', 'guest_nice')
+    idle_fields = ('idle', 'iowait')
+    split_fields = ('user', 'system', 'iowait', 'steal')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._previous = _collect("cpu_times")
+        self._last = {
+            'percent': 0.0,
+            'per_cpu': [0.0] * len(self._previous),
+            'user': 0.0,
+            'system': 0.0,
+            'iowait': 0.0,
+            'steal': 0.0
+        }
+
+    def _deltas(self, previous, current):
+        deltas = {}
+        for field in current._fields:
+            if field not in self.excluded_fields:
+                deltas[field] = max(0.0, getattr(current, field) - getattr(previous, field))
+        return deltas
+
+    def sample(self):
+        with self._lock:
+            current = _collect("cpu_times")
+            per_cpu = []
+            totals = {}
+            for previous, times in zip(self._previous, current):
+                deltas = self._deltas(previous, times)
+                total = sum(deltas.values())
+                busy = total - sum(deltas.get(field, 0.0) for field in self.idle_fields)
+                per_cpu.append(busy / total * 100 if total > 0 else 0.0)
+                for field, value in deltas.items():
+                    totals[field] = totals.get(field, 0.0) + value
+            total = sum(totals.values())
+            # Слишком частый вызов: счётчики ещё не изменились, возвращаем прошлый результат
+            if total <= 0:
+                return self._last
+            self._previous = current
+            idle = sum(totals.get(field, 0.0) for field in self.idle_fields)
+            result = {
+                'percent': round((total - idle) / total * 100, 1),
+                'per_cpu': [round(value, 1) for value in per_cpu]
+            }
+            for field in self.split_fields:
+                result[field] = round(totals.get(field, 0.0) / total * 100, 1)
+            self._last = result
+            return result
+
+_cpu_sampler = CpuSampler()
+
+# Скорости интерфейсов (байт/с, пакетов/с) по разнице накопленных счётчиков между тиками
+class NetworkSampler:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._previous = _collect("interfaces")
+        self._time = time.monotonic()
+
+    def sample(self):
+        with self._lock:
+            now = time.monotonic()
+            current = _collect("interfaces")
+            elapsed = now - self._time
+            if elapsed <= 0:
+                elapsed = float("inf")
+            rates = {}
+            for name, counters in current.items():
+                previous = self._previous.get(name, counters)
+                # Счётчики обнуляются при пересоздании интерфейса: отрицательная разница - ноль
+                deltas = NicCounters(*(max(0, value - old) / elapsed for value, old in zip(counters, previous)))
+                rates[name] = {
+                    'rx': deltas.rx_bytes,
+                    'tx': deltas.tx_bytes,
+                    'rx_packets': deltas.rx_packets,
+                    'tx_packets': deltas.tx_packets,
+                    'errors': deltas.rx_errors + deltas.tx_errors,
+                    'rx_total': counters.rx_bytes,
+                    'tx_total': counters.tx_bytes
+                }
+            self._previous = current
+            self._time = now
+            return rates
+
+_network_sampler = NetworkSampler()
+
+# Функции для получения данных системы
+def get_cpu_stats():
+    return _cpu_sampler.sample()
+
+def get_cpu_usage():
+    return get_cpu_stats()['percent']
+
+def get_memory_usage():
+    return _collect("memory")
+
+def get_disk_usage():
+    disk = psutil.disk_usage('/')
+    return {
+        'percent': disk.percent,
+        'used': disk.used / (1024 ** 3),
+        'total': disk.total / (1024 ** 3)
+    }
+
+# Сетевые файловые системы: их statvfs может зависнуть, поэтому ёмкость
+# всех разделов запрашивается в фоновых потоках с таймаутом
+NETWORK_FSTYPES = {"nfs", "nfs4", "cifs", "smbfs", "smb3", "sshfs", "fuse.sshfs", "9p", "glusterfs", "ceph", "fuse.ceph", "davfs"}
+# Виртуальные устройства без собственного ввода-вывода
+DISK_DEVICE_SKIP = ("loop", "ram")
+
+class MountTable:
+    def __init__(self, timeout=1.0, refresh_interval=60.0):
+        self.timeout = timeout
+        self.refresh_interval = refresh_interval
+        self._mounts = None
+        self._loaded = 0.0
+        self._pending = {}
+        self._last = {}
+        # На Linux /proc/self/mounts сообщает об изменении таблицы монтирования
+        # через POLLPRI, поэтому список перечитывается только после mount/umount
+        self._poll = None
+        try:
+            self._file = open("/proc/self/mounts", "rb")
+            self._file.read()
+            self._poll = select.poll()
+            self._poll.register(self._file, select.POLLPRI | select.POLLERR)
+        except (OSError, AttributeError):
+            self._poll = None
+
+    def _changed(self):
+        if self._mounts is None:
+            return True
+        if self._poll is None:
+            return time.monotonic() - self._loaded >= self.refresh_interval
+        if not self._poll.poll(0):
+            return False
+        self._file.seek(0)
+        self._file.read()
+        return True
+
+    def partitions(self):
+        if self._changed():
+            mounts = {}
+            for part in psutil.disk_partitions(all=False) + [
+                part for part in psutil.disk_partitions(all=True) if part.fstype in NETWORK_FSTYPES
+            ]:
+                mounts.setdefault(part.mountpoint, (part.device, part.fstype))
+            self._mounts = [(mountpoint, device, fstype) for mountpoint, (device, fstype) in mounts.items()]
+            self._loaded = time.monotonic()
+        return self._mounts
+
+    @staticmethod
+    def _statvfs(mountpoint):
+        # Отдельный daemon-поток: зависший вызов не держит пул и не мешает завершению программы
+        future = Future()
+
+        def run():
+            try:
+                future.set_result(psutil.disk_usage(mountpoint))
+            except Exception as e:
+                future.set_exception(e)
+
+        threading.Thread(target=run, name="statvfs", daemon=True).start()
+        return future
+
+    def usage(self):
+        mounts = self.partitions()
+        submitted = set()
+        for mountpoint, _, _ in mounts:
+            # Пока прошлый запрос к точке монтирования не завершился, новый не отправляется
+            if mountpoint not in self._pending:
+                self._pending[mountpoint] = self._statvfs(mountpoint)
+                submitted.add(mountpoint)
+        deadline = time.monotonic() + self.timeout
+        result = []
+        for mountpoint, device, fstype in mounts:
+            future = self._pending[mountpoint]
+            # Зависший с прошлых тиков запрос не ждём повторно
+            timeout = max(0.0, deadline - time.monotonic()) if mountpoint in submitted else 0.0
+            try:
+                disk = future.result(timeout=timeout)
+            except FuturesTimeout:
+                # Ответа нет: показываем последнее известное значение с пометкой stale
+                disk = self._last.get(mountpoint)
+                stale = True
+            except Exception as e:
+                del self._pending[mountpoint]
+                logging.error(f"Error getting disk usage for {mountpoint}: {e}")
+                continue
+            else:
+                del self._pending[mountpoint]
+                self._last[mountpoint] = disk
+                stale = False
+            if disk is None:
+                continue
+            result.append({
+                'mount': mountpoint,
+                'device': device,
+                'fstype': fstype,
+                'percent': disk.percent,
+                'used': disk.used / (1024 ** 3),
+                'total': disk.total / (1024 ** 3),
+                'stale': stale
+            })
+        return result
+
+_mount_table = MountTable(config["mount_timeout"], config["mount_refresh_interval"])
+
+# IOPS, пропускная способность, await и загрузка устройств по разнице счётчиков между тиками
+class DiskSampler:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._previous = _collect("disk_io")
+        self._time = time.monotonic()
+
+    def sample(self):
+        with self._lock:
+            now = time.monotonic()
+            current = _collect("disk_io")
+            elapsed = now - self._time
+            rates = {}
+            for name, counters in current.items():
+                if name.startswith(DISK_DEVICE_SKIP):
+                    continue
+                previous = self._previous.get(name, counters)
+                deltas = DiskCounters(*(
+                    None if value is None else max(0, value - (old or 0)) for value, old in zip(counters, previous)
+                ))
+                operations = deltas.reads + deltas.writes
+                rates[name] = {
+                    'reads': deltas.reads / elapsed if elapsed > 0 else 0.0,
+                    'writes': deltas.writes / elapsed if elapsed > 0 else 0.0,
+                    'read_bytes': deltas.read_bytes / elapsed if elapsed > 0 else 0.0,
+                    'write_bytes': deltas.write_bytes / elapsed if elapsed > 0 else 0.0,
+                    # await - среднее время обслуживания запроса (мс), как в iostat
+                    'await': (deltas.read_time + deltas.write_time) / operations if operations else 0.0,
+                    'util': min(100.0, deltas.busy_time / (elapsed * 10)) if elapsed > 0 else 0.0,
+                    'queue': deltas.queue_time / (elapsed * 1000) if elapsed > 0 and deltas.queue_time is not None else None
+                }
+            self._previous = current
+            self._time = now
+            return rates
+
+_disk_sampler = DiskSampler()
+
+def get_mounts():
+    return _mount_table.usage()
+
+def get_disk_io():
+    return _disk_sampler.sample()
+
+def get_cpu_temperature():
+    return _collect("temperature")
+
+# Источники данных GPU. NVML опрашивается внутри процесса через закэшированные
+# дескрипторы устройств; GPUtil запускает nvidia-smi на каждый вызов и остаётся запасным вариантом
+class GpuBackend:
+    name = "none"
+
+    def devices(self):
+        return []
+
+class NvmlGpuBackend(GpuBackend):
+    name = "nvml"
+
+    def __init__(self):
+        import pynvml
+        self.nvml = pynvml
+        pynvml.nvmlInit()
+        self.handles = []
+        for index in range(pynvml.nvmlDeviceGetCount()):
+            handle = pynvml.nvmlDeviceGetHandleByIndex(index)
+            name = pynvml.nvmlDeviceGetName(handle)
+            self.handles.append((index, name.decode() if isinstance(name, bytes) else name, handle))
+
+    def _processes(self, handle):
+        processes = {}
+        for query in (self.nvml.nvmlDeviceGetComputeRunningProcesses, self.nvml.nvmlDeviceGetGraphicsRunningProcesses):
+            try:
+                for proc in query(handle):
+                    used = proc.usedGpuMemory or 0
+                    processes[proc.pid] = processes.get(proc.pid, 0) + used / (1024 ** 2)
+            except self.nvml.NVMLError:
+                continue
+        return [{'pid': pid, 'memory': memory} for pid, memory in processes.items()]
+
+    def devices(self):
+        devices = []
+        for index, name, handle in self.handles:
+            try:
+                utilization = self.nvml.nvmlDeviceGetUtilizationRates(handle)
+                memory = self.nvml.nvmlDeviceGetMemoryInfo(handle)
+                try:
+                    temperature = self.nvml.nvmlDeviceGetTemperature(handle, self.nvml.NVML_TEMPERATURE_GPU)
+                except self.nvml.NVMLError:
+                    temperature = None
+            except self.nvml.NVMLError as e:
+                logging.error(f"Error getting info for GPU {index}: {e}")
+                continue
+            devices.append({
+                'index': index,
+                'name': name,
+                'usage': float(utilization.gpu),
+                'memory_used': memory.used / (1024 ** 2),
+                'memory_total': memory.total / (1024 ** 2),
+                'temperature': temperature,
+                'processes': self._processes(handle)
+            })
+        return devices
+
+# GPUtil запускает nvidia-smi на каждый опрос, поэтому это только запасной вариант без NVML
+class GputilGpuBackend(GpuBackend):
+    name = "gputil"
+
+    def __init__(self):
+        import GPUtil
+        self.gputil = GPUtil
+        # Пробный опрос при выборе бэкенда: без nvidia-smi GPUtil молча возвращает пустой список
+        if not GPUtil.getGPUs():
+            raise RuntimeError("GPUtil found no GPUs (is nvidia-smi installed?)")
+
+    def devices(self):
+        return [{
+            'index': i,
+            'name': gpu.name,
+            'usage': gpu.load * 100,
+            'memory_used': gpu.memoryUsed,
+            'memory_total': gpu.memoryTotal,
+            'temperature': gpu.temperature,
+            'processes': []
+        } for i, gpu in enumerate(self.gputil.getGPUs())]
+
+# Синтетические устройства для проверки на машинах без GPU
+class FakeGpuBackend(GpuBackend):
+    name = "fake"
+
+    def __init__(self, count=2, memory_total=16384):
+        self.count = count
+        self.memory_total = memory_total
+
+    def devices(self):
+        now = time.time()
+        devices = []
+        for index in range(self.count):
+            load = (math.sin(now / 30 + index) + 1) / 2
+            devices.append({
+                'index': index,
+                'name': f"Fake GPU {index}",
+                'usage': round(load * 100, 1),
+                'memory_used': round(load * self.memory_total, 1),
+                'memory_total': self.memory_total,
+                'temperature': round(40 + load * 40, 1),
+                'processes': [{'pid': os.getpid(), 'memory': round(load * 512, 1)}]
+            })
+        return devices
+
+def select_gpu_backend(name):
+    # Бэкенд проверяется один раз при выборе; если не работает ни NVML, ни GPUtil,
+    # причина пишется в журнал однократно, а опрос GPU дальше ничего не делает
+    if name == "none":
+        return GpuBackend()
+    if name == "fake":
+        return FakeGpuBackend()
+    reasons = []
+    if name in ("auto", "nvml"):
+        try:
+            return NvmlGpuBackend()
+        except Exception as e:
+            reasons.append(f"NVML: {e}")
+            if name == "nvml":
+                logging.error(f"NVML is unavailable, trying GPUtil: {e}")
+    try:
+        backend = GputilGpuBackend()
+    except Exception as e:
+        reasons.append(f"GPUtil: {e}")
+        logging.warning(f"GPU metrics are disabled, no GPU backend is available ({'; '.join(reasons)})")
+        return GpuBackend()
+    if reasons:
+        logging.info("Using GPUtil for GPU metrics; it runs nvidia-smi on every poll, install nvidia-ml-py to avoid that")
+    return backend
+
+_gpu_backend = None
+
+def get_gpus():
+    global _gpu_backend
+    try:
+        # Бэкенд создаётся при первом опросе, чтобы не загружать NVML/GPUtil при старте
+        if _gpu_backend is None:
+            _gpu_backend = select_gpu_backend(config["gpu_backend"])
+        return _gpu_backend.devices()
+    except Exception as e:
+        logging.error(f"Error getting GPU info: {e}")
+        return []
+
+def get_gpu_usage():
+    gpus = get_gpus()
+    return gpus[0] if gpus else None
+
+def gpu_average(gpus):
+    if not gpus:
+        return None
+    return sum(gpu['usage'] for gpu in gpus) / len(gpus)
+
+def get_processes():
+    return _collect("processes")
+
+def get_top_processes(key='cpu', limit=None, rows=None):
+    limit = config["max_processes"] if limit is None else limit
+    rows = _collect("processes") if rows is None else rows
+    # 0 - показать все процессы (таблица виртуализирована)
+    if limit <= 0:
+        return sorted(rows, key=PROCESS_SORT_KEYS[key], reverse=True)
+    # heapq.nlargest: O(N log K) вместо полной сортировки
+    return heapq.nlargest(limit, rows, key=PROCESS_SORT_KEYS[key])
+
+def aggregate_connections(sockets, limit):
+    # Подсчёт через Counter по itemgetter идёт в C, без словаря на каждый сокет
+    states = Counter(map(itemgetter(3), sockets))
+    by_pid = Counter(map(itemgetter(4), sockets))
+    by_remote = Counter(map(itemgetter(1), sockets))
+    by_remote.pop(None, None)
+    return {
+        'total': len(sockets),
+        'states': dict(states),
+        # Имена процессов подставляет движок сбора: у него уже есть полный список процессов
+        'by_pid': [(pid, None, count) for pid, count in by_pid.most_common(limit)],
+        'by_remote': by_remote.most_common(limit)
+    }
+
+def get_network():
+    # Одна таблица сокетов на тик: из неё строятся и агрегаты, и список соединений
+    sockets = _collect("tcp_sockets")
+    network = aggregate_connections(sockets, config["network_top_n"])
+    network['interfaces'] = _network_sampler.sample()
+    established = (sock for sock in sockets if sock[3] == 'ESTABLISHED')
+    if config["max_connections"] > 0:
+        established = itertools.islice(established, config["max_connections"])
+    network['connections'] = [
+        {
+            'local_address': local,
+            'remote_address': f"{remote_ip}:{remote_port}" if remote_ip else "N/A",
+            'status': state,
+            'pid': pid
+        }
+        for local, remote_ip, remote_port, state, pid in established
+    ]
+    return network
+
+# Движок оповещений: правило срабатывает, только если значение держится выше порога
+# duration секунд, снимается после падения ниже clear (гистерезис), повторно об одном
+# и том же ключе не сообщает чаще, чем раз в cooldown секунд
+AlertRule = namedtuple("AlertRule", ["metric", "title", "label", "threshold", "clear", "duration", "cooldown"])
+AlertEvent = namedtuple("AlertEvent", ["timestamp", "key", "metric", "severity", "title", "message", "value", "threshold"])
+
+def build_alert_rules():
+    margin = config["alert_clear_margin"]
+    duration = config["alert_duration"]
+    cooldown = config["alert_cooldown"]
+    return [
+        AlertRule("cpu", "cpu_alert", "CPU usage", config["cpu_threshold"], config["cpu_threshold"] - margin, duration, cooldown),
+        AlertRule("memory", "memory_alert", "Memory usage", config["memory_threshold"], config["memory_threshold"] - margin, duration, cooldown),
+        AlertRule("disk", "disk_alert", "Disk {mount} usage", config["disk_threshold"], config["disk_threshold"] - margin, duration, cooldown),
+        AlertRule("gpu", "gpu_alert", "GPU {index} usage", config["gpu_threshold"], config["gpu_threshold"] - margin, duration, cooldown),
+        AlertRule("gpu_memory", "gpu_memory_alert", "GPU {index} memory usage", config["gpu_memory_threshold"], config["gpu_memory_threshold"] - margin, duration, cooldown)
+    ]
+
+def alert_values(snapshot, metric):
+    # Значения метрики из снимка: [(ключ, подпись, значение)]
+    if metric == "cpu":
+        return [("cpu", {}, snapshot.cpu)] if snapshot.cpu is not None else []
+    if metric == "disk" and snapshot.mounts:
+        # Порог проверяется для каждого раздела; устаревшие значения не поднимают оповещений
+        return [(f"disk:{mount['mount']}", {"mount": mount['mount']}, mount['percent']) for mount in snapshot.mounts if not mount['stale']]
+    if metric == "disk":
+        return [("disk:/", {"mount": "/"}, snapshot.disk['percent'])] if snapshot.disk else []
+    if metric == "memory":
+        return [("memory", {}, snapshot.memory['percent'])] if snapshot.memory else []
+    values = []
+    for gpu in snapshot.gpus or ():
+        if metric == "gpu":
+            values.append((f"gpu:{gpu['index']}", {"index": gpu['index']}, gpu['usage']))
+        elif gpu['memory_total']:
+            values.append((f"gpu_memory:{gpu['index']}", {"index": gpu['index']}, round(gpu['memory_used'] / gpu['memory_total'] * 100, 1)))
+    return values
+
+class AlertEngine:
+    def __init__(self, rules):
+        self.rules = rules
+        # Состояние по ключу: начало превышения, активно ли, было ли оповещение, время последнего оповещения
+        self._state = {}
+
+    def set_rules(self, rules):
+        self.rules = rules
+
+    def evaluate(self, snapshot):
+        now = snapshot.timestamp.timestamp()
+        events = []
+        seen = set()
+        for rule in self.rules:
+            for key, labels, value in alert_values(snapshot, rule.metric):
+                seen.add(key)
+                state = self._state.setdefault(key, {"since": None, "firing": False, "announced": False, "notified": None})
+                label = rule.label.format(**labels)
+                if state["firing"]:
+                    if value < rule.clear:
+                        # О снятии сообщаем, только если о срабатывании было оповещение (не подавлено cooldown)
+                        if state["announced"]:
+                            events.append(AlertEvent(now, key, rule.metric, "resolved", translate(rule.title),
+                                                     f"{label} is back to normal: {value}%", value, rule.clear))
+                        state.update(since=None, firing=False, announced=False)
+                        continue
+                    # Подавленное cooldown оповещение досылается, только пока значение выше порога:
+                    # между clear и threshold действует гистерезис
+                    if state["announced"] or value <= rule.threshold:
+                        continue
+                elif value <= rule.threshold:
+                    state["since"] = None
+                    continue
+                else:
+                    if state["since"] is None:
+                        state["since"] = now
+                    if now - state["since"] < rule.duration:
+                        continue
+                    state["firing"] = True
+                if state["notified"] is not None and now - state["notified"] < rule.cooldown:
+                    continue
+                state.update(announced=True, notified=now)
+                events.append(AlertEvent(now, key, rule.metric, "warning", translate(rule.title),
+                                         f"{label} is high: {value}%", value, rule.threshold))
+        # Состояние пропавших разделов и GPU сбрасывается: вернувшееся устройство начинает с чистого листа
+        for key in self._state.keys() - seen:
+            del self._state[key]
+        return events
+
+# Доставка оповещений в отдельном потоке: движок только кладёт событие в очередь
+class NotificationDispatcher:
+    def __init__(self, maxsize=1000):
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.sinks = []
+        self.dropped = 0
+        self._thread = threading.Thread(target=self._run, name="notifications", daemon=True)
+
+    def add_sink(self, sink):
+        self.sinks.append(sink)
+
+    def start(self):
+        self._thread.start()
+
+    def submit(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+            logging.warning(f"Notification queue is full, dropped: {event.title}: {event.message}")
+
+    def _run(self):
+        while True:
+            event = self.queue.get()
+            for sink in self.sinks:
+                try:
+                    sink(event)
+                except Exception as e:
+                    logging.error(f"Error delivering notification: {e}")
+
+# Доставка оповещений в Telegram и webhooks. Цикл asyncio живёт в своём потоке;
+# у каждого получателя своя ограниченная очередь: всплеск событий собирается в один
+# дайджест, неудачная отправка повторяется с экспоненциальной задержкой, а при
+# переполнении очереди новые события отбрасываются, не задерживая поток сбора
+class NotificationTarget:
+    name = "target"
+
+    def __init__(self):
+        import requests
+        self.requests = requests
+        # Одна сессия на получателя: соединения keep-alive переиспользуются между отправками
+        self.session = requests.Session()
+
+    def send(self, events):
+        raise NotImplementedError
+
+    def post(self, url, payload):
+        response = self.session.post(url, json=payload, timeout=10)
+        # 429 и 5xx повторяем, остальные ошибки клиента - нет
+        if response.status_code == 429 or response.status_code >= 500:
+            raise ConnectionError(f"{self.name} returned HTTP {response.status_code}")
+        response.raise_for_status()
+
+class TelegramTarget(NotificationTarget):
+    name = "telegram"
+
+    def __init__(self, token, chat_id, api_url):
+        super().__init__()
+        self.url = f"{api_url.rstrip('/')}/bot{token}/sendMessage"
+        self.chat_id = chat_id
+
+    def send(self, events):
+        if len(events) == 1:
+            text = f"{events[0].title}: {events[0].message}"
+        else:
+            lines = [f"{len(events)} alerts on {platform.node()}:"]
+            lines += [f"{datetime.fromtimestamp(e.timestamp):%H:%M:%S} {e.title}: {e.message}" for e in events]
+            text = "\n".join(lines)
+        self.post(self.url, {"chat_id": self.chat_id, "text": text})
+
+class WebhookTarget(NotificationTarget):
+    name = "webhook"
+
+    def __init__(self, url):
+        super().__init__()
+        self.url = url
+
+    def send(self, events):
+        self.post(self.url, {"host": platform.node(), "alerts": [event._asdict() for event in events]})
+
+class AsyncNotifier:
+    def __init__(self, targets, queue_size=100, digest_window=10.0, max_batch=50, max_retries=5, backoff=1.0, max_backoff=60.0):
+        self.targets = targets
+        self.queue_size = queue_size
+        self.digest_window = digest_window
+        self.max_batch = max_batch
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.dropped = 0
+        self.delivered = 0
+        self.loop = asyncio.new_event_loop()
+        self._queues = {}
+        self._ready = threading.Event()
+        # Блокирующие HTTP-вызовы выполняются в пуле, по одному потоку на получателя
+        self._executor = ThreadPoolExecutor(max_workers=max(1, len(targets)), thread_name_prefix="notifier")
+        self._thread = threading.Thread(target=self._run, name="notifier", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        self._ready.wait()
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout=5)
+        self._executor.shutdown(wait=False)
+
+    def submit(self, event):
+        # Вызывается из любого потока и никогда не блокирует
+        self.loop.call_soon_threadsafe(self._enqueue, event)
+
+    def _enqueue(self, event):
+        for target, events in self._queues.items():
+            try:
+                events.put_nowait(event)
+            except asyncio.QueueFull:
+                self.dropped += 1
+                logging.warning(f"{target.name} notification queue is full, dropped: {event.title}: {event.message}")
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        for target in self.targets:
+            self._queues[target] = asyncio.Queue(maxsize=self.queue_size)
+            self.loop.create_task(self._deliver(target, self._queues[target]))
+        self.loop.call_soon(self._ready.set)
+        self.loop.run_forever()
+
+    async def _batch(self, events):
+        batch = [await events.get()]
+        deadline = self.loop.time() + self.digest_window
+        while len(batch) < self.max_batch:
+            timeout = deadline - self.loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(events.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _deliver(self, target, events):
+        while True:
+            batch = await self._batch(events)
+            delay = self.backoff
+            for attempt in range(1, self.max_retries + 1):
+                try:
+                    await self.loop.run_in_executor(self._executor, target.send, batch)
+                    self.delivered += len(batch)
+                    break
+                except Exception as e:
+                    if attempt == self.max_retries or isinstance(e, target.requests.HTTPError):
+                        logging.error(f"Giving up on {target.name} notification of {len(batch)} alerts: {e}")
+                        break
+                    logging.warning(f"{target.name} notification failed (attempt {attempt}), retrying in {delay:.1f} s: {e}")
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, self.max_backoff)
+
+def start_notifier():
+    targets = []
+    try:
+        if config["telegram_bot_token"] and config["telegram_chat_id"]:
+            targets.append(TelegramTarget(config["telegram_bot_token"], config["telegram_chat_id"], config["telegram_api_url"]))
+        for url in config["webhook_urls"]:
+            targets.append(WebhookTarget(url))
+    except ImportError as e:
+        logging.error(f"Remote notifications are unavailable: {e}")
+        return None
+    if not targets:
+        return None
+    notifier = AsyncNotifier(
+        targets,
+        queue_size=config["notify_queue_size"],
+        digest_window=config["notify_digest_window"],
+        max_retries=config["notify_max_retries"]
+    )
+    notifier.start()
+    return notifier
+
+def log_alert(event):
+    level = logging.INFO if event.severity == "resolved" else logging.WARNING
+    logging.log(level, f"{event.title}: {event.message}")
+
+def desktop_alert(event):
+    if event.severity != "resolved":
+        notify(event.title, event.message)
+
+# Журнал событий: записи AlertEvent хранятся строками NDJSON (массив полей) в активном
+# сегменте. Сегмент закрывается по размеру или возрасту, сжимается gzip и попадает
+# в индекс: время первой и последней записи и число записей по каждой метрике.
+# Запрос страницы пропускает сегменты по индексу и распаковывает только те, где лежит
+# сама страница или граница диапазона времени. Старые сегменты удаляются по сроку
+# хранения и общему размеру
+class EventJournal:
+    active_name = "current.ndjson"
+    index_name = "index.json"
+    cache_size = 4
+
+    def __init__(self, path, segment_bytes, segment_seconds, retention, max_bytes):
+        self.path = path
+        self.segment_bytes = segment_bytes
+        self.segment_seconds = segment_seconds
+        self.retention = retention
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._cache = {}
+        os.makedirs(path, exist_ok=True)
+        self.segments = self._load_index()
+        self.active = self._load_active()
+        self.active_metrics = Counter(event.metric for event in self.active)
+        self.active_bytes = os.path.getsize(self._file(self.active_name)) if self.active else 0
+        self._stream = open(self._file(self.active_name), "a")
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    @staticmethod
+    def _decode(line):
+        try:
+            return AlertEvent(*json.loads(line))
+        except (ValueError, TypeError):
+            # Оборванная при сбое последняя строка
+            return None
+
+    def _read_lines(self, stream):
+        return [event for event in map(self._decode, stream) if event is not None]
+
+    def _load_active(self):
+        try:
+            with open(self._file(self.active_name)) as f:
+                text = f.read()
+        except FileNotFoundError:
+            return []
+        if text and not text.endswith("\n"):
+            # Строка, оборванная при сбое, закрывается, чтобы следующая запись не склеилась с ней
+            with open(self._file(self.active_name), "a") as f:
+                f.write("\n")
+        return self._read_lines(text.splitlines())
+
+    def _describe(self, name, events):
+        return {
+            "name": name,
+            "start": events[0].timestamp,
+            "end": events[-1].timestamp,
+            "count": len(events),
+            "metrics": dict(Counter(event.metric for event in events)),
+            "bytes": os.path.getsize(self._file(name))
+        }
+
+    def _load_index(self):
+        try:
+            with open(self._file(self.index_name)) as f:
+                indexed = {segment["name"]: segment for segment in json.load(f)}
+        except (FileNotFoundError, ValueError):
+            indexed = {}
+        # Сегменты, сжатые перед сбоем, но не попавшие в индекс, описываются заново
+        segments = []
+        for name in os.listdir(self.path):
+            if not name.endswith(".ndjson.gz"):
+                continue
+            if name not in indexed:
+                try:
+                    with gzip.open(self._file(name), "rt") as f:
+                        events = self._read_lines(f)
+                except (OSError, EOFError):
+                    continue
+                if not events:
+                    continue
+                indexed[name] = self._describe(name, events)
+            segments.append(indexed[name])
+        segments.sort(key=itemgetter("start"))
+        return segments
+
+    def append(self, event):
+        line = json.dumps(list(event)) + "\n"
+        with self._lock:
+            if self.active and (
+                self.active_bytes + len(line) > self.segment_bytes
+                or event.timestamp - self.active[0].timestamp >= self.segment_seconds
+            ):
+                self._rotate(event.timestamp)
+            self._stream.write(line)
+            self._stream.flush()
+            self.active.append(event)
+            self.active_metrics[event.metric] += 1
+            self.active_bytes += len(line)
+
+    def _rotate(self, now):
+        self._stream.close()
+        events = self.active
+        name = f"{int(events[0].timestamp * 1000)}-{int(events[-1].timestamp * 1000)}.ndjson.gz"
+        # Сжатие во временный файл и rename: в каталоге не бывает недописанных сегментов
+        fd, temp_path = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        with os.fdopen(fd, "wb") as raw, open(self._file(self.active_name), "rb") as source:
+            with gzip.GzipFile(fileobj=raw, mode="wb") as compressed:
+                shutil.copyfileobj(source, compressed)
+            raw.flush()
+            os.fsync(raw.fileno())
+        os.replace(temp_path, self._file(name))
+        self.segments.append(self._describe(name, events))
+        self._expire(now)
+        write_json_atomic(self._file(self.index_name), self.segments)
+        self._stream = open(self._file(self.active_name), "w")
+        self.active = []
+        self.active_metrics = Counter()
+        self.active_bytes = 0
+
+    def _expire(self, now):
+        total = sum(segment["bytes"] for segment in self.segments)
+        while self.segments and (
+            (self.retention and self.segments[0]["end"] < now - self.retention)
+            or (self.max_bytes and total > self.max_bytes)
+        ):
+            segment = self.segments.pop(0)
+            total -= segment["bytes"]
+            try:
+                os.remove(self._file(segment["name"]))
+            except FileNotFoundError:
+                pass
+
+    def _segment_events(self, name):
+        # Сжатые сегменты неизменны: последние прочитанные держатся в памяти.
+        # Кэш трогает только читающий поток, удалённый сегмент из него просто вытесняется
+        events = self._cache.pop(name, None)
+        if events is None:
+            try:
+                with gzip.open(self._file(name), "rt") as f:
+                    events = self._read_lines(f)
+            except (OSError, EOFError):
+                # Сегмент удалён по сроку хранения между снятием индекса и чтением
+                events = []
+        self._cache[name] = events
+        while len(self._cache) > self.cache_size:
+            del self._cache[next(iter(self._cache))]
+        return events
+
+    def query(self, metrics=None, start=None, end=None, offset=0, limit=100):
+        # Страница событий от новых к старым и общее число подходящих событий
+        start = -math.inf if start is None else start
+        end = math.inf if end is None else end
+        with self._lock:
+            parts = [(None, list(self.active), dict(self.active_metrics))]
+            parts += [(segment["name"], segment, segment["metrics"]) for segment in reversed(self.segments)]
+
+        def matches(event):
+            return start <= event.timestamp <= end and (metrics is None or event.metric in metrics)
+
+        page = []
+        total = 0
+        for name, source, counts in parts:
+            if name is None:
+                first, last = (source[0].timestamp, source[-1].timestamp) if source else (0.0, 0.0)
+            else:
+                first, last = source["start"], source["end"]
+            if not counts or last < start or first > end:
+                continue
+            # Сегмент целиком в диапазоне: число совпадений известно из индекса
+            count = None
+            if start <= first and last <= end:
+                count = sum(counts.values()) if metrics is None else sum(counts.get(metric, 0) for metric in metrics)
+            if count is not None and (total + count <= offset or len(page) >= limit):
+                total += count
+                continue
+            events = source if name is None else self._segment_events(name)
+            matched = [event for event in reversed(events) if matches(event)]
+            skip = max(0, offset - total)
+            page.extend(matched[skip:skip + limit - len(page)])
+            total += len(matched)
+        return page, total
+
+    def close(self):
+        with self._lock:
+            self._stream.close()
+
+def open_event_journal():
+    try:
+        return EventJournal(
+            config["journal_dir"],
+            config["journal_segment_bytes"],
+            config["journal_segment_seconds"],
+            config["journal_retention_days"] * 86400,
+            config["journal_max_bytes"]
+        )
+    except OSError as e:
+        logging.error(f"Error opening event journal: {e}")
+        return None
+
+# История метрик: кольцевой буфер фиксированной ёмкости на массивах NumPy.
+# Каждое значение пишется дважды (в i и i + capacity), поэтому последние
+# len() значений всегда лежат в памяти подряд и отдаются как view без копирования
+class MetricHistory:
+    columns = ("cpu", "memory", "disk", "gpu")
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._times = np.full(2 * capacity, np.nan)
+        self._values = np.full((len(self.columns), 2 * capacity), np.nan)
+        self._index = 0
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def append(self, timestamp, **values):
+        i = self._index
+        row = [np.nan if values.get(name) is None else values[name] for name in self.columns]
+        self._times[i] = self._times[i + self.capacity] = timestamp
+        self._values[:, i] = self._values[:, i + self.capacity] = row
+        self._index = (i + 1) % self.capacity
+        self._size = min(self._size + 1, self.capacity)
+
+    def _window(self):
+        end = self._index + self.capacity
+        return end - self._size, end
+
+    def _view(self, array):
+        view = array.view()
+        view.flags.writeable = False
+        return view
+
+    def times(self):
+        start, end = self._window()
+        return self._view(self._times[start:end])
+
+    def column(self, name):
+        start, end = self._window()
+        return self._view(self._values[self.columns.index(name), start:end])
+
+# История по процессам: общая шкала времени и по строке float32 на каждый
+# отслеживаемый PID. В историю попадают только процессы из top-K по пиковому
+# значению (CPU, RSS) за скользящее окно; когда серий становится max_series,
+# вытесняется серия, дольше всех не входившая в top-K. Имена интернируются,
+# поэтому сотни серий одного "python" хранят одну строку
+class ProcessHistory:
+    fields = ("cpu", "memory", "io", "fds", "threads")
+
+    def __init__(self, capacity, top_k=10, window=300, max_series=32, rank=("cpu", "memory"), buckets=6):
+        self.capacity = capacity
+        self.top_k = top_k
+        self.window = window
+        self.rank = rank
+        self.bucket_width = window / buckets
+        self._lock = threading.Lock()
+        self._times = np.full(capacity, np.nan)
+        self._values = np.full((max_series, capacity, len(self.fields)), np.nan, dtype=np.float32)
+        self._index = 0
+        self._size = 0
+        self._names = {}
+        # pid -> [номер строки в _values, имя, время последнего попадания в top-K]
+        self._series = {}
+        self._free = list(range(max_series - 1, -1, -1))
+        # Пики за окно считаются по корзинам: текущая обновляется каждый тик,
+        # максимум по закрытым пересчитывается только при смене корзины
+        self._buckets = deque()
+        self._closed = {}
+
+    def __len__(self):
+        return self._size
+
+    def _intern(self, name):
+        return self._names.setdefault(name, name)
+
+    def _bucket(self, timestamp):
+        start = timestamp - timestamp % self.bucket_width
+        if not self._buckets or self._buckets[-1][0] != start:
+            while self._buckets and self._buckets[0][0] <= start - self.window:
+                self._buckets.popleft()
+            self._closed = {}
+            for _, peaks in self._buckets:
+                for pid, values in peaks.items():
+                    previous = self._closed.get(pid)
+                    self._closed[pid] = values if previous is None else [max(a, b) for a, b in zip(previous, values)]
+            self._buckets.append((start, {}))
+        return self._buckets[-1][1]
+
+    def _allocate(self, pid, name, admitted):
+        if not self._free:
+            # Вытесняется серия, дольше всех не входившая в top-K
+            candidates = [key for key in self._series if key not in admitted]
+            if not candidates:
+                return None
+            self._release(min(candidates, key=lambda key: self._series[key][2]))
+        slot = self._free.pop()
+        self._series[pid] = [slot, name, 0.0]
+        return slot
+
+    def _release(self, pid):
+        slot = self._series.pop(pid)[0]
+        self._values[slot] = np.nan
+        self._free.append(slot)
+
+    def record(self, timestamp, rows, fds=None):
+        with self._lock:
+            i = self._index
+            self._times[i] = timestamp
+            self._values[:, i] = np.nan
+            bucket = self._bucket(timestamp)
+            live = {}
+            for row in rows:
+                pid = row['pid']
+                live[pid] = row
+                values = [row[name] for name in self.rank]
+                previous = bucket.get(pid)
+                bucket[pid] = values if previous is None else [max(a, b) for a, b in zip(previous, values)]
+            admitted = set()
+            for n in range(len(self.rank)):
+                admitted.update(heapq.nlargest(
+                    self.top_k, live,
+                    key=lambda pid: max(bucket[pid][n], self._closed[pid][n] if pid in self._closed else 0.0)
+                ))
+            for pid in admitted:
+                name = self._intern(live[pid]['name'])
+                series = self._series.get(pid)
+                if series is not None and series[1] is not name:
+                    # PID переиспользован другим процессом
+                    self._release(pid)
+                    series = None
+                if series is None and self._allocate(pid, name, admitted) is None:
+                    continue
+                self._series[pid][2] = timestamp
+            for pid, (slot, name, _) in list(self._series.items()):
+                row = live.get(pid)
+                if row is None:
+                    continue
+                if self._intern(row['name']) is not name:
+                    self._release(pid)
+                    continue
+                count = fds(pid) if fds is not None else None
+                self._values[slot, i] = (
+                    row['cpu'], row['memory'], row['io'],
+                    np.nan if count is None else count, row['threads']
+                )
+            self._index = (i + 1) % self.capacity
+            self._size = min(self._size + 1, self.capacity)
+
+    def tracked(self):
+        with self._lock:
+            return {pid: name for pid, (_, name, _) in self._series.items()}
+
+    def series(self, pid):
+        # Копия в хронологическом порядке; io - скорость (MB/s) по разнице накопленных байт
+        with self._lock:
+            series = self._series.get(pid)
+            if series is None:
+                return None
+            order = (self._index - self._size + np.arange(self._size)) % self.capacity
+            times = self._times[order]
+            values = self._values[series[0]][order].astype(float)
+        columns = {name: values[:, n] for n, name in enumerate(self.fields)}
+        rate = np.full(len(times), np.nan)
+        if len(times) > 1:
+            rate[1:] = np.diff(columns["io"]) / np.diff(times)
+        columns["io"] = rate
+        return times, columns
+
+def open_process_history():
+    return ProcessHistory(
+        config["process_history_size"],
+        top_k=config["process_history_top_k"],
+        window=config["process_history_window"],
+        max_series=config["process_history_max_series"]
+    )
+
+# Дерево процессов и группы cgroup. Структура (родители, дети, cgroup) обновляется
+# только для появившихся, исчезнувших и сменивших родителя PID; cgroup читается
+# один раз для нового процесса. Суммы CPU/RSS/IO по поддеревьям считаются за один
+# проход в обратном прямом порядке обхода (дети раньше родителей), сам порядок
+# пересчитывается лишь при изменении структуры
+ProcessNode = namedtuple("ProcessNode", [
+    "pid", "ppid", "name", "create_time", "cpu", "memory", "io", "cgroup", "total_cpu", "total_memory", "total_io", "descendants"
+])
+
+# Идентификаторы контейнеров в путях cgroup: docker, containerd, CRI-O, podman
+CONTAINER_CGROUP = re.compile(r"(docker|cri-containerd|crio|libpod)[-/]([0-9a-f]{12})[0-9a-f]*(?:\.scope)?$")
+
+def cgroup_label(path):
+    if not path or path == "/":
+        return "/"
+    match = CONTAINER_CGROUP.search(path)
+    if match:
+        return f"{match.group(1)} {match.group(2)}"
+    return path.rsplit("/", 1)[-1]
+
+def cgroup_parent(path):
+    parent = path.rsplit("/", 1)[0]
+    return parent or "/"
+
+class ProcessTree:
+    def __init__(self):
+        self.parents = {}
+        self.children = {}
+        self.cgroups = {}
+        # Накопленный IO (МБ) и момент замера: скорость считается по разнице
+        self._io = {}
+        self._order = None
+        self._roots = ()
+
+    def _attach(self, pid, ppid):
+        self.parents[pid] = ppid
+        # PID 0 в Windows и macOS считает родителем себя: такая петля в дерево не попадает
+        if ppid != pid:
+            self.children.setdefault(ppid, set()).add(pid)
+
+    def _detach(self, pid):
+        siblings = self.children.get(self.parents.pop(pid))
+        if siblings is not None:
+            siblings.discard(pid)
+
+    def _walk(self, roots, current):
+        # Прямой порядок без рекурсии. Процессы, недостижимые из корней (цикл родителей
+        # при гонке с ядром), становятся дополнительными корнями: каждый процесс попадает
+        # в обход ровно один раз. Возвращает порядок обхода и корни
+        order = []
+        visited = set()
+        walked = []
+        for root in itertools.chain(roots, current):
+            if root in visited:
+                continue
+            walked.append(root)
+            stack = [root]
+            while stack:
+                pid = stack.pop()
+                if pid in visited:
+                    continue
+                visited.add(pid)
+                order.append(pid)
+                stack.extend(self.children.get(pid, ()))
+        return order, walked
+
+    def update(self, rows, cgroup=None):
+        now = time.monotonic()
+        current = {row['pid']: row for row in rows}
+        changed = False
+        for pid in self.parents.keys() - current.keys():
+            self._detach(pid)
+            self.children.pop(pid, None)
+            self.cgroups.pop(pid, None)
+            self._io.pop(pid, None)
+            changed = True
+        for pid, row in current.items():
+            ppid = row.get('ppid') or 0
+            if pid not in self.parents:
+                self._attach(pid, ppid)
+                self.cgroups[pid] = cgroup(pid) if cgroup is not None else None
+                changed = True
+            elif self.parents[pid] != ppid:
+                self._detach(pid)
+                self._attach(pid, ppid)
+                changed = True
+        if changed or self._order is None:
+            roots = [pid for pid in current if self.parents[pid] == pid or self.parents[pid] not in current]
+            order, self._roots = self._walk(roots, current)
+            self._order = order[::-1]
+        roots = self._roots
+        root_set = set(roots)
+
+        io_rates = {}
+        for pid, row in current.items():
+            previous = self._io.get(pid)
+            io_rates[pid] = max(0.0, (row['io'] - previous[0]) / (now - previous[1])) if previous and now > previous[1] else 0.0
+            self._io[pid] = (row['io'], now)
+        totals = {pid: [row['cpu'], row['memory'], io_rates[pid], 0] for pid, row in current.items()}
+        # Каждый процесс встречается в порядке обхода один раз; корни (в том числе разорванные
+        # циклы и PID 0 со ссылкой на себя) ничего не передают вверх, поэтому суммы не удваиваются
+        for pid in self._order:
+            if pid in root_set:
+                continue
+            parent = totals.get(self.parents[pid])
+            if parent is not None:
+                total = totals[pid]
+                parent[0] += total[0]
+                parent[1] += total[1]
+                parent[2] += total[2]
+                parent[3] += total[3] + 1
+
+        nodes = {}
+        own = {}
+        for pid, row in current.items():
+            total = totals[pid]
+            path = self.cgroups.get(pid)
+            nodes[pid] = ProcessNode(pid, self.parents[pid], row['name'], row.get('create_time'), row['cpu'], row['memory'], io_rates[pid], path,
+                                     total[0], total[1], total[2], total[3])
+            if path:
+                group = own.setdefault(path, [0.0, 0.0, 0.0, 0])
+                group[0] += row['cpu']
+                group[1] += row['memory']
+                group[2] += io_rates[pid]
+                group[3] += 1
+        # Сумма группы переносится на все её предки: проход по группам, а не по процессам
+        groups = {}
+        for path, usage in own.items():
+            while path:
+                group = groups.setdefault(path, {'cpu': 0.0, 'memory': 0.0, 'io': 0.0, 'processes': 0})
+                group['cpu'] += usage[0]
+                group['memory'] += usage[1]
+                group['io'] += usage[2]
+                group['processes'] += usage[3]
+                path = None if path == "/" else cgroup_parent(path)
+
+        by_cpu = lambda pid: -totals[pid][0]
+        children = {
+            pid: tuple(sorted((kid for kid in kids if kid not in root_set), key=by_cpu))
+            for pid, kids in self.children.items() if kids and pid in current
+        }
+        tree = {
+            'nodes': MappingProxyType(nodes),
+            'children': MappingProxyType(children),
+            'roots': tuple(sorted(roots, key=by_cpu))
+        }
+        return MappingProxyType(tree), groups
+
+def subtree_pids(tree, pid):
+    # Процесс и все его потомки из снимка дерева, дети раньше родителей (порядок завершения)
+    order = []
+    seen = set()
+    stack = [pid]
+    while stack:
+        current = stack.pop()
+        if current in seen:
+            continue
+        seen.add(current)
+        order.append(current)
+        stack.extend(tree['children'].get(current, ()))
+    return order[::-1]
+
+def verified_process(pid, create_time):
+    # Процесс из снимка, если PID ещё принадлежит ему; иначе None (PID занят другим процессом).
+    # Время запуска сверяется с допуском в один тик часов: procfs и psutil считают его по-разному
+    proc = psutil.Process(pid)
+    if create_time is None or abs(proc.create_time() - create_time) > 0.01:
+        return None
+    return proc
+
+# Постоянное хранилище метрик в SQLite (WAL): сырые точки и агрегаты по минутам и часам.
+# Записи копятся в памяти и сбрасываются пачками в одной транзакции
+class MetricStore:
+    columns = MetricHistory.columns
+    tiers = (("raw", 1), ("1m", 60), ("1h", 3600))
+    compact_interval = 600
+
+    def __init__(self, path, retention, batch_size=60, flush_interval=5.0):
+        self.path = path
+        self.retention = retention
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._pending = []
+        self._pending_rollups = {tier: [] for tier, _ in self.tiers[1:]}
+        self._buckets = {}
+        self._last_flush = time.monotonic()
+        self._last_compact = 0.0
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        columns = ", ".join(f"{name} REAL" for name in self.columns)
+        self._conn.execute(f"CREATE TABLE IF NOT EXISTS samples_raw (ts REAL PRIMARY KEY, {columns})")
+        rollup_columns = ", ".join(
+            f"{name}_min REAL, {name}_max REAL, {name}_sum REAL, {name}_count INTEGER" for name in self.columns
+        )
+        for tier, _ in self.tiers[1:]:
+            self._conn.execute(f"CREATE TABLE IF NOT EXISTS samples_{tier} (ts REAL PRIMARY KEY, {rollup_columns})")
+        self._conn.commit()
+
+    def _rollup_sql(self, tier):
+        names = ["ts"]
+        updates = []
+        for name in self.columns:
+            names += [f"{name}_min", f"{name}_max", f"{name}_sum", f"{name}_count"]
+            # Неполный интервал мог быть записан до перезапуска: объединяем, а не перезаписываем
+            updates += [
+                f"{name}_min = min(coalesce({name}_min, excluded.{name}_min), coalesce(excluded.{name}_min, {name}_min))",
+                f"{name}_max = max(coalesce({name}_max, excluded.{name}_max), coalesce(excluded.{name}_max, {name}_max))",
+                f"{name}_sum = coalesce({name}_sum, 0) + coalesce(excluded.{name}_sum, 0)",
+                f"{name}_count = {name}_count + excluded.{name}_count"
+            ]
+        placeholders = ", ".join("?" * len(names))
+        return (f"INSERT INTO samples_{tier} ({', '.join(names)}) VALUES ({placeholders}) "
+                f"ON CONFLICT(ts) DO UPDATE SET {', '.join(updates)}")
+
+    @staticmethod
+    def _bucket_row(start, accumulators):
+        row = [start]
+        for low, high, total, count in accumulators:
+            row += [low, high, total if count else None, count]
+        return row
+
+    def append(self, timestamp, **values):
+        row = [None if values.get(name) is None or values[name] != values[name] else values[name] for name in self.columns]
+        with self._lock:
+            self._pending.append([timestamp] + row)
+            for tier, width in self.tiers[1:]:
+                start = timestamp - timestamp % width
+                bucket = self._buckets.get(tier)
+                if bucket is None or bucket[0] != start:
+                    if bucket is not None:
+                        self._pending_rollups[tier].append(self._bucket_row(*bucket))
+                    bucket = (start, [[None, None, 0.0, 0] for _ in self.columns])
+                    self._buckets[tier] = bucket
+                for accumulator, value in zip(bucket[1], row):
+                    if value is None:
+                        continue
+                    accumulator[0] = value if accumulator[0] is None else min(accumulator[0], value)
+                    accumulator[1] = value if accumulator[1] is None else max(accumulator[1], value)
+                    accumulator[2] += value
+                    accumulator[3] += 1
+            if len(self._pending) >= self.batch_size or time.monotonic() - self._last_flush >= self.flush_interval:
+                self._flush()
+
+    def _flush(self, final=False):
+        if final:
+            for tier, bucket in self._buckets.items():
+                self._pending_rollups[tier].append(self._bucket_row(*bucket))
+            self._buckets = {}
+        with self._conn:
+            if self._pending:
+                placeholders = ", ".join("?" * (len(self.columns) + 1))
+                self._conn.executemany(f"INSERT OR REPLACE INTO samples_raw VALUES ({placeholders})", self._pending)
+            for tier, rows in self._pending_rollups.items():
+                if rows:
+                    self._conn.executemany(self._rollup_sql(tier), rows)
+        self._pending = []
+        self._pending_rollups = {tier: [] for tier in self._pending_rollups}
+        self._last_flush = time.monotonic()
+        if self._last_flush - self._last_compact >= self.compact_interval:
+            self._compact()
+
+    def _compact(self):
+        now = time.time()
+        with self._conn:
+            for tier, _ in self.tiers:
+                self._conn.execute(f"DELETE FROM samples_{tier} WHERE ts < ?", (now - self.retention[tier],))
+        self._conn.execute("PRAGMA incremental_vacuum")
+        self._last_compact = time.monotonic()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def close(self):
+        with self._lock:
+            self._flush(final=True)
+            self._conn.close()
+
+    def finest_tier(self, start):
+        # Самый подробный уровень, который ещё хранит данные с момента start
+        # Допуск в ширину интервала: диапазон "30d" при хранении 30 дней не должен уходить на уровень выше
+        now = time.time()
+        for tier, width in self.tiers:
+            if now - self.retention[tier] <= start + width:
+                return tier
+        return self.tiers[-1][0]
+
+    def tier_for_range(self, start, end, max_points=MAX_RANGE_POINTS):
+        for tier, width in self.tiers:
+            if (end - start) / width <= max_points:
+                return tier
+        return self.tiers[-1][0]
+
+    def query(self, start, end, metrics=None, tier=None, aggregate="avg", chunk_size=1000):
+        # Генератор: строки читаются из отдельного соединения порциями, вся выборка в память не загружается
+        metrics = metrics or self.columns
+        tier = tier or self.tier_for_range(start, end)
+        if tier == "raw":
+            fields = list(metrics)
+        elif aggregate == "avg":
+            fields = [f"{name}_sum / nullif({name}_count, 0)" for name in metrics]
+        else:
+            fields = [f"{name}_{aggregate}" for name in metrics]
+        conn = sqlite3.connect(self.path)
+        try:
+            cursor = conn.execute(
+                f"SELECT ts, {', '.join(fields)} FROM samples_{tier} WHERE ts >= ? AND ts <= ? ORDER BY ts",
+                (start, end)
+            )
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            conn.close()
+
+    def load_range(self, start, end, metrics=None):
+        metrics = metrics or self.columns
+        rows = np.array(list(self.query(start, end, metrics)), dtype=float).reshape(-1, len(metrics) + 1)
+        return rows[:, 0], {name: rows[:, i + 1] for i, name in enumerate(metrics)}
+
+def open_metric_store():
+    retention = {
+        "raw": config["retention_raw_days"] * 86400,
+        "1m": config["retention_1m_days"] * 86400,
+        "1h": config["retention_1h_days"] * 86400
+    }
+    try:
+        return MetricStore(config["history_db"], retention)
+    except sqlite3.Error as e:
+        logging.error(f"Error opening metric store: {e}")
+        return None
+
+# Потоковый экспорт истории: строки (время, метрики...) читаются порциями по
+# EXPORT_CHUNK_ROWS и сразу пишутся в файл, поэтому расход памяти не зависит
+# от длины выбранного диапазона. Формат выбирается по расширению файла
+EXPORT_CHUNK_ROWS = 65536
+# Суффиксы, которым нужны необязательные пакеты
+EXPORT_DEPENDENCIES = {".parquet": "pyarrow", ".arrow": "pyarrow", ".zst": "zstandard"}
+
+def export_dependency(path):
+    for suffix, module in EXPORT_DEPENDENCIES.items():
+        if path.endswith(suffix):
+            return module
+    return None
+
+def export_supported(path):
+    # find_spec только ищет пакет, не импортируя его, и не замедляет старт
+    module = export_dependency(path)
+    return module is None or importlib.util.find_spec(module) is not None
+
+def check_export_path(path):
+    # Проверка до открытия файла: неподдерживаемый формат не оставляет пустой файл
+    if not path.endswith((".parquet", ".arrow", ".csv", ".csv.gz", ".csv.zst", ".ndjson", ".ndjson.gz", ".ndjson.zst")):
+        raise ValueError(f"Unsupported export format: {path}")
+    if not export_supported(path):
+        module = export_dependency(path)
+        raise ValueError(f"Exporting {os.path.basename(path)} requires the {module} package: pip install {module}")
+
+# Диалог сохранения предлагает только форматы, для которых установлены пакеты
+EXPORT_FORMATS = tuple(
+    (label, extension) for label, extension in (
+        ("Parquet", ".parquet"),
+        ("Arrow IPC", ".arrow"),
+        ("CSV", ".csv"),
+        ("CSV (gzip)", ".csv.gz"),
+        ("CSV (zstd)", ".csv.zst"),
+        ("NDJSON", ".ndjson"),
+        ("NDJSON (gzip)", ".ndjson.gz"),
+        ("NDJSON (zstd)", ".ndjson.zst")
+    )
+    if export_supported(extension)
+)
+
+def open_export_stream(path):
+    # Текстовый поток с прозрачным сжатием по суффиксу .gz / .zst
+    if path.endswith(".gz"):
+        return gzip.open(path, "wt", newline="")
+    if path.endswith(".zst"):
+        import zstandard
+        return zstandard.open(path, "wt", newline="")
+    return open(path, "w", newline="")
+
+class ExportWriter:
+    def __init__(self, path, metrics):
+        self.path = path
+        self.metrics = metrics
+
+    def write(self, times, columns):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+class CsvExportWriter(ExportWriter):
+    headings = {"cpu": "CPU (%)", "memory": "Memory (%)", "disk": "Disk (%)", "gpu": "GPU (%)"}
+
+    def __init__(self, path, metrics):
+        super().__init__(path, metrics)
+        self.stream = open_export_stream(path)
+        self.writer = csv.writer(self.stream)
+        self.writer.writerow(["Time"] + [self.headings[name] for name in metrics])
+
+    def write(self, times, columns):
+        values = [column.tolist() for column in columns]
+        self.writer.writerows(
+            [datetime.fromtimestamp(timestamp)] + ["N/A" if column[i] != column[i] else column[i] for column in values]
+            for i, timestamp in enumerate(times.tolist())
+        )
+
+    def close(self):
+        self.stream.close()
+
+class NdjsonExportWriter(ExportWriter):
+    def __init__(self, path, metrics):
+        super().__init__(path, metrics)
+        self.stream = open_export_stream(path)
+
+    def write(self, times, columns):
+        values = [column.tolist() for column in columns]
+        for i, timestamp in enumerate(times.tolist()):
+            record = {"time": datetime.fromtimestamp(timestamp).isoformat()}
+            for name, column in zip(self.metrics, values):
+                record[name] = None if column[i] != column[i] else column[i]
+            self.stream.write(json.dumps(record) + "\n")
+
+    def close(self):
+        self.stream.close()
+
+class ArrowExportWriter(ExportWriter):
+    # Каждая порция становится отдельной группой строк Parquet или батчем Arrow IPC
+    def __init__(self, path, metrics):
+        super().__init__(path, metrics)
+        import pyarrow
+        self.pa = pyarrow
+        self.schema = pyarrow.schema(
+            [("time", pyarrow.timestamp("ms", tz="UTC"))] + [(name, pyarrow.float64()) for name in metrics]
+        )
+        if path.endswith(".parquet"):
+            import pyarrow.parquet
+            self.writer = pyarrow.parquet.ParquetWriter(path, self.schema, compression="zstd")
+        else:
+            import pyarrow.ipc
+            self.writer = pyarrow.ipc.new_file(path, self.schema)
+
+    def write(self, times, columns):
+        pa = self.pa
+        arrays = [pa.array((times * 1000).astype(np.int64), type=pa.timestamp("ms", tz="UTC"))]
+        # NaN (пропуск измерения) записывается как null
+        arrays += [pa.array(column, type=pa.float64(), from_pandas=True) for column in columns]
+        self.writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+def export_writer(path, metrics):
+    check_export_path(path)
+    if path.endswith((".parquet", ".arrow")):
+        return ArrowExportWriter(path, metrics)
+    if path.endswith((".ndjson", ".ndjson.gz", ".ndjson.zst")):
+        return NdjsonExportWriter(path, metrics)
+    return CsvExportWriter(path, metrics)
+
+def export_history(rows, path, metrics, chunk_size=EXPORT_CHUNK_ROWS):
+    # rows - итератор кортежей (время, значения metrics...); возвращает число строк
+    writer = export_writer(path, metrics)
+    count = 0
+    try:
+        while True:
+            chunk = list(itertools.islice(rows, chunk_size))
+            if not chunk:
+                break
+            # None (пропуск) становится NaN
+            block = np.array(chunk, dtype=float).reshape(-1, len(metrics) + 1)
+            writer.write(block[:, 0], [block[:, i + 1] for i in range(len(metrics))])
+            count += len(chunk)
+    finally:
+        writer.close()
+    return count
+
+def store_rows(store, start, end, metrics):
+    # Сначала на диск уходят ещё не записанные сэмплы, затем читается самый подробный доступный уровень
+    store.flush()
+    return store.query(start, end, metrics, tier=store.finest_tier(start), chunk_size=EXPORT_CHUNK_ROWS)
+
+def run_export(path, range_name, metrics=None):
+    check_export_path(path)
+    metrics = list(metrics or MetricHistory.columns)
+    unknown = set(metrics) - set(MetricHistory.columns)
+    if unknown:
+        raise ValueError(f"Unknown metrics: {', '.join(sorted(unknown))}")
+    store = open_metric_store()
+    if store is None:
+        raise RuntimeError(f"Cannot open metric store {config['history_db']}")
+    try:
+        end = time.time()
+        started = time.perf_counter()
+        count = export_history(store_rows(store, end - HISTORY_RANGES[range_name], end, metrics), path, metrics)
+    finally:
+        store.close()
+    logging.info(f"Exported {count} rows ({range_name}) to {path} in {time.perf_counter() - started:.1f} s")
+    return count
+
+# Цвет ячейки тепловой полосы: зелёный -> жёлтый -> красный (шаг 10%)
+def heat_color(percent):
+    level = min(max(percent, 0.0), 100.0) // 10 * 10 / 100
+    if level < 0.5:
+        red, green = int(510 * level), 200
+    else:
+        red, green = 255, int(200 * (1 - level) * 2)
+    return f"#{red:02x}{green:02x}30"
+
+# Фоновый сбор данных: коллекторы работают в отдельном потоке,
+# а UI получает готовые неизменяемые снимки через ограниченную очередь
+Snapshot = namedtuple("Snapshot", [
+    "timestamp", "cpu", "cpu_stats", "memory", "disk", "mounts", "disk_io", "gpu", "gpus", "temperature",
+    "processes", "process_tree", "cgroups", "connections", "network", "durations", "schedule"
+])
+
+# Поля, которые не покидают процесс: дерево всех процессов слишком велико для NDJSON и агентов
+LOCAL_FIELDS = ("process_tree",)
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+# Планировщик коллекторов: движок тикает с update_interval, каждый коллектор запускается
+# раз в every тиков (collector_intervals, секунды). Коллектор, вышедший за свой бюджет
+# (collector_budgets, секунды), вдвое реже опрашивается, пока снова не уложится в половину бюджета
+MAX_BACKOFF = 8
+SCHEDULE_WINDOW = 20
+
+class CollectorSchedule:
+    def __init__(self, every=1, budget=None):
+        self.every = every
+        self.budget = budget
+        self.backoff = 1
+        self.due = 0
+        self.cost = 0.0
+        self.last_started = None
+        # Фактические интервалы между запусками и ожидаемые для них значения
+        self.gaps = deque(maxlen=SCHEDULE_WINDOW)
+
+    @property
+    def period(self):
+        return self.every * self.backoff
+
+    def ran(self, tick, started, duration, tick_interval):
+        if self.last_started is not None:
+            self.gaps.append((started - self.last_started, self.period * tick_interval))
+        self.last_started = started
+        self.cost = duration
+        if self.budget and duration > self.budget:
+            self.slow_down()
+        elif self.budget and duration < self.budget / 2 and self.backoff > 1:
+            self.backoff //= 2
+        self.due = tick + self.period
+
+    def slow_down(self):
+        self.backoff = min(self.backoff * 2, MAX_BACKOFF)
+
+    def pause(self, tick):
+        # После паузы коллектор запускается сразу, а разрыв не считается дрожанием
+        self.due = tick
+        self.last_started = None
+        self.gaps.clear()
+
+    def stats(self, tick_interval, paused=False):
+        rate = jitter = None
+        elapsed = sum(gap for gap, _ in self.gaps)
+        if elapsed > 0:
+            rate = round(len(self.gaps) / elapsed, 3)
+            jitter = round(sum(abs(gap - target) for gap, target in self.gaps) / len(self.gaps), 4)
+        return {
+            'interval': self.period * tick_interval,
+            'rate': rate,
+            'jitter': jitter,
+            'cost': round(self.cost, 4),
+            'backoff': self.backoff,
+            'paused': paused,
+        }
+
+# Первый снимок GUI: только дешёвые коллекторы, чтобы окно отрисовалось, не дожидаясь
+# первого прохода по процессам, сокетам, разделам и инициализации GPU
+FIRST_PAINT_COLLECTORS = ("cpu_stats", "memory", "disk")
+
+class CollectorEngine:
+    collectors = (
+        ("cpu_stats", get_cpu_stats),
+        ("memory", get_memory_usage),
+        ("disk", get_disk_usage),
+        ("mounts", get_mounts),
+        ("disk_io", get_disk_io),
+        ("gpus", get_gpus),
+        ("temperature", get_cpu_temperature),
+        ("processes", get_processes),
+        ("network", get_network),
+    )
+
+    def __init__(self, interval, maxsize=1, store=None, alerts=None, dispatcher=None, process_history=None, process_tree=None,
+                 intervals=None, budgets=None, first_paint=False, watcher=None):
+        self.interval = interval / 1000
+        self.first_paint = first_paint
+        # Новая конфигурация подхватывается только между тиками: весь тик видит один снимок config
+        self.watcher = watcher
+        self.config = config
+        self.store = store
+        self.process_history = process_history
+        self.process_tree = process_tree
+        self._tree = (None, None)
+        self.alerts = alerts
+        self.dispatcher = dispatcher
+        self.snapshots = queue.Queue(maxsize=maxsize)
+        # Последний снимок для экспортёров: читается без извлечения из очереди UI
+        self.last_snapshot = None
+        self.histograms = {name: Histogram() for name, _ in self.collectors}
+        self.intervals = config["collector_intervals"] if intervals is None else intervals
+        budgets = config["collector_budgets"] if budgets is None else budgets
+        self.schedules = {name: CollectorSchedule(budget=budgets.get(name)) for name, _ in self.collectors}
+        self._reschedule()
+        # Коллекторы скрытых вкладок не запускаются; не успевшие к тику отдают прошлое значение
+        self.paused = frozenset()
+        self.tick = 0
+        self._values = {}
+        # Ошибка последнего тика (None, если тик прошёл) и число сбоев подряд
+        self.last_error = None
+        self.failures = 0
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="collector", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout=5)
+        if self.store is not None:
+            self.store.close()
+
+    def set_interval(self, interval):
+        self.interval = max(interval, UI_POLL_INTERVAL) / 1000
+        self._reschedule()
+
+    def _reschedule(self):
+        for name, schedule in self.schedules.items():
+            seconds = self.intervals.get(name)
+            schedule.every = max(1, round(seconds / self.interval)) if seconds else 1
+
+    def wake(self):
+        self._wake.set()
+
+    def reload_config(self):
+        values = self.watcher.poll()
+        if values is None:
+            return
+        changed = [key for key in CONFIG_SCHEMA if values[key] != self.config[key]]
+        set_config(values)
+        self.config = values
+        self.intervals = values["collector_intervals"]
+        for name, schedule in self.schedules.items():
+            schedule.budget = values["collector_budgets"].get(name)
+        self.set_interval(values["update_interval"])
+        if self.alerts is not None:
+            self.alerts.set_rules(build_alert_rules())
+        logging.info(f"Reloaded {self.watcher.path}: {', '.join(changed) or 'no changes'}")
+        restart = [key for key in changed if key not in HOT_RELOAD_KEYS]
+        if restart:
+            logging.warning(f"{self.watcher.path}: changes to {', '.join(restart)} need a restart")
+
+    def set_paused(self, names):
+        names = frozenset(names)
+        resumed = self.paused - names
+        self.paused = names
+        # Открытая вкладка не ждёт следующего тика
+        if resumed:
+            self._wake.set()
+
+    def schedule_stats(self):
+        paused = self.paused
+        return {name: schedule.stats(self.interval, name in paused) for name, schedule in self.schedules.items()}
+
+    def collect(self, only=None):
+        # only - разовый сбор части коллекторов вне расписания (первая отрисовка)
+        tick = self.tick
+        if only is None:
+            self.tick += 1
+        paused = self.paused
+        values = {}
+        durations = {}
+        started = {}
+        for name, collector in self.collectors:
+            schedule = self.schedules[name]
+            if only is not None and name not in only:
+                values[name] = None
+                continue
+            if name in paused:
+                schedule.pause(tick)
+                self._values.pop(name, None)
+                values[name] = None
+                continue
+            if tick < schedule.due:
+                values[name] = self._values.get(name)
+                continue
+            started[name] = time.perf_counter()
+            try:
+                values[name] = collector()
+            except Exception as e:
+                logging.error(f"Error in collector {name}: {e}")
+                values[name] = None
+            self._values[name] = values[name]
+            durations[name] = time.perf_counter() - started[name]
+        # Закэшированные значения не меняются: соединения и имена процессов собираются в копии
+        network = values["network"]
+        values["connections"] = None
+        if network:
+            network = values["network"] = dict(network)
+            values["connections"] = network.pop('connections')
+            if values["processes"] is not None:
+                names = {row['pid']: row['name'] for row in values["processes"]}
+                network['by_pid'] = [(pid, names.get(pid), count) for pid, _, count in network['by_pid']]
+        # История и дерево строятся по всем процессам, в снимок попадает только top-N
+        if values["processes"] is None:
+            self._tree = (None, None)
+        else:
+            if "processes" in durations:
+                history_started = time.perf_counter()
+                if self.process_history is not None:
+                    self.process_history.record(time.time(), values["processes"], lambda pid: _collect("num_fds", pid))
+                if self.process_tree is not None:
+                    self._tree = self.process_tree.update(values["processes"], lambda pid: _collect("cgroup", pid))
+                durations["processes"] += time.perf_counter() - history_started
+            values["processes"] = get_top_processes(rows=values["processes"])
+        values["process_tree"], values["cgroups"] = self._tree
+        for name, duration in durations.items():
+            self.histograms[name].observe(duration)
+            if only is None:
+                self.schedules[name].ran(tick, started[name], duration, self.interval)
+        if only is None:
+            self.relieve_overrun(tick, durations)
+        values["cpu"] = values["cpu_stats"]["percent"] if values["cpu_stats"] else None
+        values["gpu"] = values["gpus"][0] if values["gpus"] else None
+        return Snapshot(
+            timestamp=datetime.now(),
+            durations=MappingProxyType(durations),
+            schedule=_freeze(self.schedule_stats()),
+            **{name: _freeze(value) for name, value in values.items()}
+        )
+
+    def relieve_overrun(self, tick, durations):
+        # Тик не уложился в интервал: реже опрашивается самый дорогой коллектор с бюджетом,
+        # если он ещё не замедлился из-за собственного бюджета
+        if sum(durations.values()) <= self.interval:
+            return
+        budgeted = [name for name in durations if self.schedules[name].budget]
+        if not budgeted:
+            return
+        name = max(budgeted, key=durations.get)
+        schedule = self.schedules[name]
+        if durations[name] <= schedule.budget and schedule.backoff < MAX_BACKOFF:
+            schedule.slow_down()
+            schedule.due = tick + schedule.period
+            logging.warning(f"Collector tick took {sum(durations.values()) * 1000:.0f} ms, {name} now runs every {schedule.period} ticks")
+
+    def record(self, snapshot):
+        try:
+            self.store.append(
+                snapshot.timestamp.timestamp(),
+                cpu=snapshot.cpu,
+                memory=snapshot.memory['percent'] if snapshot.memory else None,
+                disk=snapshot.disk['percent'] if snapshot.disk else None,
+                gpu=gpu_average(snapshot.gpus)
+            )
+        except sqlite3.Error as e:
+            logging.error(f"Error writing metric store: {e}")
+
+    def publish(self, snapshot):
+        # Очередь ограничена: если UI не успевает, старый снимок вытесняется новым
+        while True:
+            try:
+                self.snapshots.put_nowait(snapshot)
+                return
+            except queue.Full:
+                try:
+                    self.snapshots.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def latest(self):
+        snapshot = None
+        while True:
+            try:
+                snapshot = self.snapshots.get_nowait()
+            except queue.Empty:
+                return snapshot
+
+    def _tick(self):
+        if self.watcher is not None:
+            self.reload_config()
+        snapshot = self.collect()
+        if self.store is not None:
+            self.record(snapshot)
+        self.last_snapshot = snapshot
+        if self.alerts is not None:
+            for event in self.alerts.evaluate(snapshot):
+                self.dispatcher.submit(event)
+        self.publish(snapshot)
+
+    def _run(self):
+        if self.first_paint:
+            try:
+                self.publish(self.collect(FIRST_PAINT_COLLECTORS))
+            except Exception:
+                logging.exception("First paint collection failed")
+        while not self._stop.is_set():
+            started = time.monotonic()
+            # Сбой тика не останавливает поток: ошибка логируется (повтор той же — один раз),
+            # видна в строке состояния UI, а следующий тик идёт по расписанию
+            try:
+                self._tick()
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+                if error != self.last_error:
+                    logging.exception("Collection tick failed")
+                self.last_error = error
+                self.failures += 1
+            else:
+                if self.last_error is not None:
+                    logging.info(f"Collection recovered after {self.failures} failed ticks")
+                self.last_error = None
+                self.failures = 0
+            self._wake.wait(max(0.0, self.interval - (time.monotonic() - started)))
+            self._wake.clear()
+
+# Экспорт метрик в формате Prometheus/OpenMetrics: /metrics отдаёт последний готовый
+# снимок движка и никогда не запускает сбор сам, поэтому число скрейперов не влияет на нагрузку
+class Histogram:
+    buckets = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
 
-# Функции для получения данных системы
-def get_cpu_usage():
-    return psutil.cpu_percent(interval=1)
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
 
-def get_memory_usage():
-    mem = psutil.virtual_memory()
-    return {
-        'percent': mem.percent,
-        'used': mem.used / (1024 ** 2),
-        'total': mem.total / (1024 ** 2)
-    }
+    def observe(self, value):
+        with self._lock:
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+                    break
+            self.count += 1
+            self.sum += value
 
-def get_disk_usage():
-    disk = psutil.disk_usage('/')
-    return {
-        'percent': disk.percent,
-        'used': disk.used / (1024 ** 3),
-        'total': disk.total / (1024 ** 3)
-    }
+    def state(self):
+        with self._lock:
+            cumulative = []
+            total = 0
+            for count in self.counts:
+                total += count
+                cumulative.append(total)
+            return cumulative, self.count, self.sum
 
-def get_cpu_temperature():
-    try:
-        temps = psutil.sensors_temperatures()
-        if temps and 'coretemp' in temps:
-            return temps['coretemp'][0].current
-        elif temps and 'k10temp' in temps:
-            return temps['k10temp'][0].current
+def _label_value(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _metric_line(name, value, labels=None):
+    if labels:
+        rendered = ",".join(f'{key}="{_label_value(label)}"' for key, label in labels.items())
+        return f"{name}{{{rendered}}} {value}"
+    return f"{name} {value}"
+
+def exported_processes(snapshot, limit):
+    # Не больше limit процессов по CPU и limit по RSS, независимо от размера таблицы в UI:
+    # число рядов с метками pid/name не растёт вместе с числом процессов
+    if not limit:
+        return []
+    if snapshot.process_tree is not None:
+        rows = [(node.pid, node.name, node.cpu, node.memory) for node in snapshot.process_tree['nodes'].values()]
+    else:
+        rows = [(proc['pid'], proc['name'], proc['cpu'], proc['memory']) for proc in snapshot.processes or ()]
+    top = {row[0]: row for row in heapq.nlargest(limit, rows, key=itemgetter(2))}
+    top.update((row[0], row) for row in heapq.nlargest(limit, rows, key=itemgetter(3)))
+    return sorted(top.values())
+
+def render_prometheus(snapshot, histograms):
+    lines = []
+
+    def family(kind, name, help_text, samples):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for value, labels in samples:
+            lines.append(_metric_line(name, value, labels))
+
+    def gauge(name, help_text, samples):
+        family("gauge", name, help_text, samples)
+
+    if snapshot is not None:
+        gauge("system_monitor_last_collection_timestamp_seconds", "Time of the last completed collection.",
+              [(snapshot.timestamp.timestamp(), None)])
+        if snapshot.cpu is not None:
+            gauge("system_monitor_cpu_percent", "Aggregate CPU utilisation.", [(snapshot.cpu, None)])
+        if snapshot.cpu_stats:
+            gauge("system_monitor_cpu_core_percent", "Per-core CPU utilisation.",
+                  [(value, {"core": i}) for i, value in enumerate(snapshot.cpu_stats['per_cpu'])])
+            gauge("system_monitor_cpu_mode_percent", "Share of CPU time per mode.",
+                  [(snapshot.cpu_stats[mode], {"mode": mode}) for mode in CpuSampler.split_fields])
+        if snapshot.temperature is not None:
+            gauge("system_monitor_cpu_temperature_celsius", "CPU temperature.", [(snapshot.temperature, None)])
+        if snapshot.memory:
+            gauge("system_monitor_memory_percent", "Memory utilisation.", [(snapshot.memory['percent'], None)])
+            gauge("system_monitor_memory_used_bytes", "Used memory.", [(snapshot.memory['used'] * 1024 ** 2, None)])
+            gauge("system_monitor_memory_total_bytes", "Total memory.", [(snapshot.memory['total'] * 1024 ** 2, None)])
+        if snapshot.disk:
+            gauge("system_monitor_disk_percent", "Disk utilisation of /.", [(snapshot.disk['percent'], None)])
+            gauge("system_monitor_disk_used_bytes", "Used disk space of /.", [(snapshot.disk['used'] * 1024 ** 3, None)])
+            gauge("system_monitor_disk_total_bytes", "Total disk space of /.", [(snapshot.disk['total'] * 1024 ** 3, None)])
+        if snapshot.mounts:
+            mounts = [(mount, {"mount": mount['mount'], "device": mount['device'], "fstype": mount['fstype']}) for mount in snapshot.mounts]
+            gauge("system_monitor_filesystem_used_bytes", "Used space per mounted filesystem.",
+                  [(mount['used'] * 1024 ** 3, labels) for mount, labels in mounts])
+            gauge("system_monitor_filesystem_size_bytes", "Size of each mounted filesystem.",
+                  [(mount['total'] * 1024 ** 3, labels) for mount, labels in mounts])
+            gauge("system_monitor_filesystem_stale", "1 if the last capacity check of the mount timed out.",
+                  [(int(mount['stale']), labels) for mount, labels in mounts])
+        if snapshot.disk_io:
+            devices = snapshot.disk_io.items()
+            gauge("system_monitor_disk_reads_per_second", "Completed reads per second.", [(io['reads'], {"device": name}) for name, io in devices])
+            gauge("system_monitor_disk_writes_per_second", "Completed writes per second.", [(io['writes'], {"device": name}) for name, io in devices])
+            gauge("system_monitor_disk_read_bytes_per_second", "Bytes read per second.", [(io['read_bytes'], {"device": name}) for name, io in devices])
+            gauge("system_monitor_disk_written_bytes_per_second", "Bytes written per second.", [(io['write_bytes'], {"device": name}) for name, io in devices])
+            gauge("system_monitor_disk_await_seconds", "Average time per completed request over the last tick.",
+                  [(io['await'] / 1000, {"device": name}) for name, io in devices])
+            gauge("system_monitor_disk_utilisation_percent", "Share of time the device was busy.", [(io['util'], {"device": name}) for name, io in devices])
+            gauge("system_monitor_disk_queue_length", "Average number of requests in flight.",
+                  [(io['queue'], {"device": name}) for name, io in devices if io['queue'] is not None])
+        if snapshot.gpus:
+            devices = [(gpu, {"gpu": gpu['index'], "name": gpu['name']}) for gpu in snapshot.gpus]
+            gauge("system_monitor_gpu_percent", "GPU utilisation.", [(gpu['usage'], labels) for gpu, labels in devices])
+            gauge("system_monitor_gpu_memory_used_bytes", "Used GPU memory.",
+                  [(gpu['memory_used'] * 1024 ** 2, labels) for gpu, labels in devices])
+            gauge("system_monitor_gpu_memory_total_bytes", "Total GPU memory.",
+                  [(gpu['memory_total'] * 1024 ** 2, labels) for gpu, labels in devices])
+            gauge("system_monitor_gpu_temperature_celsius", "GPU temperature.",
+                  [(gpu['temperature'], labels) for gpu, labels in devices if gpu['temperature'] is not None])
+            gauge("system_monitor_gpu_process_memory_bytes", "GPU memory used by each process.",
+                  [(proc['memory'] * 1024 ** 2, {"gpu": gpu['index'], "pid": proc['pid']}) for gpu, _ in devices for proc in gpu['processes']])
+        processes = exported_processes(snapshot, config["exporter_top_processes"])
+        if processes:
+            gauge("system_monitor_process_cpu_percent", "CPU utilisation of the top processes by CPU or RSS.",
+                  [(cpu, {"pid": pid, "name": name}) for pid, name, cpu, _ in processes])
+            gauge("system_monitor_process_resident_memory_bytes", "Resident memory of the top processes by CPU or RSS.",
+                  [(memory * 1024 ** 2, {"pid": pid, "name": name}) for pid, name, _, memory in processes])
+        if snapshot.cgroups:
+            # Суммы включают вложенные группы, как в иерархии cgroup
+            groups = sorted(snapshot.cgroups.items())
+            gauge("system_monitor_cgroup_cpu_percent", "CPU utilisation of the processes in each cgroup subtree.",
+                  [(group['cpu'], {"cgroup": path}) for path, group in groups])
+            gauge("system_monitor_cgroup_resident_memory_bytes", "Resident memory of the processes in each cgroup subtree.",
+                  [(group['memory'] * 1024 ** 2, {"cgroup": path}) for path, group in groups])
+            gauge("system_monitor_cgroup_io_bytes_per_second", "IO rate of the processes in each cgroup subtree.",
+                  [(group['io'] * 1024 ** 2, {"cgroup": path}) for path, group in groups])
+            gauge("system_monitor_cgroup_processes", "Number of processes in each cgroup subtree.",
+                  [(group['processes'], {"cgroup": path}) for path, group in groups])
+        if snapshot.network:
+            network = snapshot.network
+            interfaces = network['interfaces'].items()
+            family("counter", "system_monitor_network_receive_bytes_total", "Bytes received per interface.",
+                   [(nic['rx_total'], {"interface": name}) for name, nic in interfaces])
+            family("counter", "system_monitor_network_transmit_bytes_total", "Bytes sent per interface.",
+                   [(nic['tx_total'], {"interface": name}) for name, nic in interfaces])
+            gauge("system_monitor_network_receive_bytes_per_second", "Receive rate per interface over the last tick.",
+                  [(nic['rx'], {"interface": name}) for name, nic in interfaces])
+            gauge("system_monitor_network_transmit_bytes_per_second", "Transmit rate per interface over the last tick.",
+                  [(nic['tx'], {"interface": name}) for name, nic in interfaces])
+            gauge("system_monitor_network_errors_per_second", "Receive and transmit errors per interface over the last tick.",
+                  [(nic['errors'], {"interface": name}) for name, nic in interfaces])
+            gauge("system_monitor_tcp_connections", "TCP sockets by state.",
+                  [(count, {"state": state}) for state, count in network['states'].items()])
+            gauge("system_monitor_tcp_connections_by_process", "TCP sockets of the processes holding the most sockets.",
+                  [(count, {"pid": "" if pid is None else pid, "name": name or ""}) for pid, name, count in network['by_pid']])
+            gauge("system_monitor_tcp_connections_by_remote", "TCP sockets to the most connected remote hosts.",
+                  [(count, {"remote": remote}) for remote, count in network['by_remote']])
+
+        if snapshot.schedule:
+            schedule = snapshot.schedule.items()
+            gauge("system_monitor_collector_interval_seconds", "Target interval of each collector including backoff.",
+                  [(stats['interval'], {"collector": name}) for name, stats in schedule])
+            gauge("system_monitor_collector_rate_hertz", "Achieved collection rate over the recent runs.",
+                  [(stats['rate'], {"collector": name}) for name, stats in schedule if stats['rate'] is not None])
+            gauge("system_monitor_collector_jitter_seconds", "Mean deviation of the actual interval from the target.",
+                  [(stats['jitter'], {"collector": name}) for name, stats in schedule if stats['jitter'] is not None])
+            gauge("system_monitor_collector_backoff", "Backoff factor applied after budget overruns.",
+                  [(stats['backoff'], {"collector": name}) for name, stats in schedule])
+            gauge("system_monitor_collector_paused", "1 if the collector is paused because its tab is hidden.",
+                  [(int(stats['paused']), {"collector": name}) for name, stats in schedule])
+
+    name = "system_monitor_collector_duration_seconds"
+    lines.append(f"# HELP {name} Time spent in each collector per tick.")
+    lines.append(f"# TYPE {name} histogram")
+    for collector, histogram in histograms.items():
+        cumulative, count, total = histogram.state()
+        for bound, value in zip(Histogram.buckets, cumulative):
+            lines.append(_metric_line(f"{name}_bucket", value, {"collector": collector, "le": bound}))
+        lines.append(_metric_line(f"{name}_bucket", count, {"collector": collector, "le": "+Inf"}))
+        lines.append(_metric_line(f"{name}_sum", total, {"collector": collector}))
+        lines.append(_metric_line(f"{name}_count", count, {"collector": collector}))
+    return "\n".join(lines) + "\n"
+
+class MetricsExporter:
+    def __init__(self, engine, port, host="0.0.0.0"):
+        self.engine = engine
+        # Текст кэшируется на снимок: одновременные скрейпы не форматируют его заново
+        self._cache = (None, None)
+        self._lock = threading.Lock()
+        exporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = exporter.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(target=self.server.serve_forever, name="metrics-exporter", daemon=True)
+
+    def render(self):
+        snapshot = self.engine.last_snapshot
+        with self._lock:
+            cached_snapshot, text = self._cache
+            # Гистограммы меняются вместе со снимком, поэтому кэш по снимку корректен
+            if text is None or cached_snapshot is not snapshot:
+                text = render_prometheus(snapshot, self.engine.histograms)
+                self._cache = (snapshot, text)
+            return text
+
+    def start(self):
+        self._thread.start()
+        logging.info(f"Metrics exporter listening on {self.server.server_address[0]}:{self.server.server_address[1]}")
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+def start_exporter(engine, port):
+    if not port:
         return None
-    except Exception as e:
-        logging.error(f"Error getting CPU temperature: {e}")
+    try:
+        exporter = MetricsExporter(engine, port, config["metrics_host"])
+    except OSError as e:
+        logging.error(f"Error starting metrics exporter on port {port}: {e}")
         return None
+    exporter.start()
+    return exporter
 
-def get_gpu_usage():
+# Удалённый режим: агент отправляет снимки на центральный сборщик по TCP.
+# Кадр - заголовок FRAME_HEADER и JSON, сжатый zlib. В кадре пачка снимков,
+# каждый - разница с предыдущим (неизменившиеся ключи не передаются), а
+# полный снимок (keyframe) отправляется после подключения и раз в keyframe_interval
+FRAME_MAGIC = b"SMPF"
+FRAME_VERSION = 1
+FRAME_HEADER = struct.Struct("!4sBBHI")
+FRAME_HELLO = 0
+FRAME_BATCH = 1
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+# Ключ со списком удалённых ключей в разнице словарей
+DELETED_KEYS = "~"
+
+def encode_frame(kind, body, count=1):
+    payload = zlib.compress(json.dumps(body, separators=(",", ":")).encode())
+    return FRAME_HEADER.pack(FRAME_MAGIC, FRAME_VERSION, kind, count, len(payload)) + payload
+
+def decode_header(header):
+    magic, version, kind, count, size = FRAME_HEADER.unpack(header)
+    if magic != FRAME_MAGIC or version != FRAME_VERSION:
+        raise ValueError(f"Unsupported frame {magic!r} v{version}")
+    if size > MAX_FRAME_SIZE:
+        raise ValueError(f"Frame of {size} bytes exceeds {MAX_FRAME_SIZE}")
+    return kind, count, size
+
+def decode_payload(payload):
+    # Ограничение на распакованный размер: защита от zip-бомбы
+    decompressor = zlib.decompressobj()
+    data = decompressor.decompress(payload, 8 * MAX_FRAME_SIZE)
+    if decompressor.unconsumed_tail:
+        raise ValueError("Frame payload is too large")
+    return json.loads(data)
+
+def diff_state(previous, current):
+    delta = {}
+    for key, value in current.items():
+        old = previous.get(key, DELETED_KEYS)
+        if isinstance(value, dict) and isinstance(old, dict):
+            nested = diff_state(old, value)
+            if nested:
+                delta[key] = nested
+        elif old != value:
+            delta[key] = value
+    removed = [key for key in previous if key not in current]
+    if removed:
+        delta[DELETED_KEYS] = removed
+    return delta
+
+def apply_delta(state, delta):
+    for key, value in delta.items():
+        if key == DELETED_KEYS:
+            for removed in value:
+                state.pop(removed, None)
+        elif isinstance(value, dict) and isinstance(state.get(key), dict):
+            apply_delta(state[key], value)
+        else:
+            state[key] = value
+    return state
+
+def snapshot_from_dict(sample):
+    values = {name: _freeze(sample.get(name)) for name in Snapshot._fields}
+    values["timestamp"] = datetime.fromisoformat(sample["timestamp"])
+    return Snapshot(**values)
+
+class RemoteAgent:
+    def __init__(self, address, name, token="", batch_size=5, flush_interval=5.0, keyframe_interval=60, buffer_size=1000, timeout=10.0):
+        self.address = address
+        self.name = name
+        self.token = token
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.keyframe_interval = keyframe_interval
+        self.buffer_size = buffer_size
+        self.timeout = timeout
+        self.sent_frames = 0
+        self.sent_bytes = 0
+        self.dropped = 0
+        self._samples = queue.Queue(maxsize=buffer_size)
+        self._socket = None
+        self._previous = None
+        self._since_keyframe = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="agent", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join(timeout=self.timeout)
+        if self._socket is not None:
+            self._socket.close()
+
+    def submit(self, snapshot):
+        # Пока сборщик недоступен, копятся последние buffer_size снимков
+        sample = snapshot_to_dict(snapshot)
+        while True:
+            try:
+                self._samples.put_nowait(sample)
+                return
+            except queue.Full:
+                try:
+                    self._samples.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def _connect(self):
+        self._socket = socket.create_connection(self.address, timeout=self.timeout)
+        self._socket.sendall(encode_frame(FRAME_HELLO, {"name": self.name, "token": self.token}))
+        # Новое соединение начинается с полного снимка
+        self._previous = None
+        logging.info(f"Agent {self.name} connected to {self.address[0]}:{self.address[1]}")
+
+    def _encode(self, batch):
+        items = []
+        for sample in batch:
+            if self._previous is None or self._since_keyframe >= self.keyframe_interval:
+                items.append({"k": 1, "d": sample})
+                self._since_keyframe = 0
+            else:
+                items.append({"d": diff_state(self._previous, sample)})
+            self._since_keyframe += 1
+            self._previous = sample
+        return encode_frame(FRAME_BATCH, items, len(items))
+
+    def _send(self, batch):
+        if self._socket is None:
+            self._connect()
+        frame = self._encode(batch)
+        self._socket.sendall(frame)
+        self.sent_frames += 1
+        self.sent_bytes += len(frame)
+
+    def _run(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        delay = 1.0
+        while not self._stop.is_set() or (batch and self._socket is not None):
+            try:
+                batch.append(self._samples.get(timeout=max(0.0, min(0.5, deadline - time.monotonic()))))
+            except queue.Empty:
+                pass
+            # При остановке досылаются все накопленные снимки
+            while self._stop.is_set() and not self._samples.empty():
+                batch.append(self._samples.get_nowait())
+            if not batch or (len(batch) < self.batch_size and time.monotonic() < deadline and not self._stop.is_set()):
+                continue
+            try:
+                self._send(batch)
+                batch = []
+                delay = 1.0
+                deadline = time.monotonic() + self.flush_interval
+            except OSError as e:
+                logging.warning(f"Agent {self.name} cannot reach {self.address[0]}:{self.address[1]}, retrying in {delay:.0f} s: {e}")
+                if self._socket is not None:
+                    self._socket.close()
+                    self._socket = None
+                batch = batch[-self.buffer_size:]
+                if self._stop.wait(delay):
+                    return
+                delay = min(delay * 2, 60.0)
+
+# Состояние хоста на сборщике: последние снимки и статистика соединения
+class FleetHost:
+    def __init__(self, name, history):
+        self.name = name
+        self.address = None
+        self.connected = False
+        self.last_seen = 0.0
+        self.frames = 0
+        self.bytes = 0
+        self.snapshots = deque(maxlen=history)
+
+    @property
+    def latest(self):
+        return self.snapshots[-1] if self.snapshots else None
+
+class FleetCollector:
+    def __init__(self, host="0.0.0.0", port=0, token="", history=1000):
+        self.host = host
+        self.port = port
+        self.token = token
+        self.history = history
+        self.hosts = {}
+        self._lock = threading.Lock()
+        self.loop = asyncio.new_event_loop()
+        self._ready = threading.Event()
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name="fleet-collector", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        self._ready.wait()
+        if self._error is not None:
+            raise self._error
+        logging.info(f"Fleet collector listening on {self.host}:{self.port}")
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout=5)
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        try:
+            server = self.loop.run_until_complete(asyncio.start_server(self._handle, self.host, self.port))
+        except OSError as e:
+            self._error = e
+            self._ready.set()
+            return
+        self.port = server.sockets[0].getsockname()[1]
+        self._ready.set()
+        self.loop.run_forever()
+
+    def snapshot_hosts(self):
+        with self._lock:
+            return list(self.hosts.values())
+
+    def snapshots_since(self, name, timestamp=None):
+        with self._lock:
+            host = self.hosts.get(name)
+            if host is None:
+                return []
+            return [snapshot for snapshot in host.snapshots if timestamp is None or snapshot.timestamp > timestamp]
+
+    async def _read_frame(self, reader):
+        kind, count, size = decode_header(await reader.readexactly(FRAME_HEADER.size))
+        payload = await reader.readexactly(size)
+        return kind, decode_payload(payload), FRAME_HEADER.size + size
+
+    def _valid_hello(self, hello):
+        if not isinstance(hello, dict) or not isinstance(hello.get("name"), str) or not isinstance(hello.get("token", ""), str):
+            return False
+        # Сравнение за постоянное время не выдаёт токен по задержке ответа
+        return hmac.compare_digest(hello.get("token", "").encode(), self.token.encode())
+
+    async def _handle(self, reader, writer):
+        peer = writer.get_extra_info("peername")
+        host = None
+        try:
+            kind, hello, _ = await self._read_frame(reader)
+            if kind != FRAME_HELLO or not self._valid_hello(hello):
+                logging.warning(f"Rejected fleet agent from {peer}: bad hello")
+                return
+            with self._lock:
+                host = self.hosts.get(hello["name"])
+                if host is None:
+                    host = self.hosts[hello["name"]] = FleetHost(hello["name"], self.history)
+                host.address = peer
+                host.connected = True
+            logging.info(f"Fleet agent {host.name} connected from {peer}")
+            state = {}
+            while True:
+                kind, items, size = await self._read_frame(reader)
+                if kind != FRAME_BATCH:
+                    continue
+                if not isinstance(items, list):
+                    raise ValueError("batch is not a list")
+                snapshots = []
+                for item in items:
+                    if not isinstance(item, dict) or not isinstance(item.get("d"), dict):
+                        raise ValueError("malformed batch item")
+                    if item.get("k"):
+                        state = item["d"]
+                    else:
+                        apply_delta(state, item["d"])
+                    snapshots.append(snapshot_from_dict(state))
+                with self._lock:
+                    host.snapshots.extend(snapshots)
+                    host.frames += 1
+                    host.bytes += size
+                    host.last_seen = time.time()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            logging.warning(f"Dropping fleet agent {peer}: {e}")
+        finally:
+            if host is not None:
+                with self._lock:
+                    host.connected = False
+                logging.info(f"Fleet agent {host.name} disconnected")
+            writer.close()
+
+def parse_address(value, default_host="127.0.0.1"):
+    host, _, port = value.rpartition(":")
+    return host or default_host, int(port)
+
+def start_agent(address, name=None):
+    agent = RemoteAgent(
+        parse_address(address),
+        name or config["agent_name"] or platform.node(),
+        token=config["fleet_token"],
+        batch_size=config["agent_batch_size"],
+        flush_interval=config["agent_flush_interval"],
+        keyframe_interval=config["agent_keyframe_interval"]
+    )
+    agent.start()
+    return agent
+
+def is_loopback(host):
+    if host == "localhost":
+        return True
     try:
-        gpus = GPUtil.getGPUs()
-        if gpus:
-            gpu = gpus[0]
-            return {
-                'usage': gpu.load * 100,
-                'memory_used': gpu.memoryUsed,
-                'memory_total': gpu.memoryTotal,
-                'temperature': gpu.temperature
-            }
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+def start_fleet_collector(port):
+    if not port:
         return None
-    except Exception as e:
-        logging.error(f"Error getting GPU info: {e}")
+    # Без токена любой в сети может выдать себя за агента: слушать разрешено только на loopback
+    if not config["fleet_token"] and not is_loopback(config["fleet_host"]):
+        logging.error(f"Fleet collector not started: set fleet_token to accept agents on {config['fleet_host']}")
+        return None
+    collector = FleetCollector(config["fleet_host"], port, config["fleet_token"])
+    try:
+        collector.start()
+    except OSError as e:
+        logging.error(f"Error starting fleet collector on port {port}: {e}")
         return None
+    return collector
+
+# Сравнение источников данных на синтетическом /proc с заданным числом процессов
+BENCHMARK_PROCESS_COUNTS = (1000, 10000, 50000)
 
-def get_top_processes():
-    processes = []
-    for proc in psutil.process_iter(['pid', 'name', 'cpu_percent', 'memory_info']):
+def build_fake_procfs(root, count):
+    with open(os.path.join(root, "stat"), "w") as f:
+        f.write("cpu  100 0 100 1000 0 0 0 0 0 0\ncpu0 100 0 100 1000 0 0 0 0 0 0\nbtime 1700000000\n")
+    with open(os.path.join(root, "meminfo"), "w") as f:
+        f.write("MemTotal: 16000000 kB\nMemFree: 8000000 kB\nMemAvailable: 12000000 kB\nBuffers: 100000 kB\nCached: 2000000 kB\n")
+    for pid in range(1, count + 1):
+        directory = os.path.join(root, str(pid))
+        os.mkdir(directory)
+        name = f"proc{pid % 1000}"
+        rest = " ".join(["0"] * 30)
+        with open(os.path.join(directory, "stat"), "w") as f:
+            f.write(f"{pid} ({name}) S 1 {pid} {pid} 0 -1 4194304 100 0 0 0 {pid % 500} {pid % 300} 0 0 20 0 {pid % 8 + 1} 0 {pid * 10} 10000000 {pid % 2000 + 100} 18446744073709551615 {rest}\n")
+        with open(os.path.join(directory, "statm"), "w") as f:
+            f.write(f"2441 {pid % 2000 + 100} 100 10 0 300 0\n")
+        with open(os.path.join(directory, "status"), "w") as f:
+            f.write(f"Name:\t{name}\nState:\tS (sleeping)\nPPid:\t1\nThreads:\t{pid % 8 + 1}\n")
+        with open(os.path.join(directory, "io"), "w") as f:
+            f.write(f"rchar: 0\nwchar: 0\nsyscr: 0\nsyscw: 0\nread_bytes: {pid * 4096}\nwrite_bytes: 0\ncancelled_write_bytes: 0\n")
+
+def benchmark_backends(counts=BENCHMARK_PROCESS_COUNTS, repeat=3):
+    results = []
+    print(f"{'processes':>10} {'psutil ms':>12} {'procfs ms':>12} {'speedup':>8}")
+    for count in counts:
+        root = tempfile.mkdtemp(prefix="fake-proc-")
+        procfs_path = psutil.PROCFS_PATH
         try:
-            processes.append({
-                'pid': proc.info['pid'],
-                'name': proc.info['name'],
-                'cpu': proc.info['cpu_percent'],
-                'memory': proc.info['memory_info'].rss / (1024 ** 2)
-            })
-        except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
-            pass
-    processes.sort(key=lambda x: x['cpu'], reverse=True)
-    return processes[:MAX_PROCESSES]
-
-def get_network_connections():
-    connections = psutil.net_connections(kind='inet')
-    net_conns = []
-    for conn in connections:
-        if conn.status == 'ESTABLISHED':
-            net_conns.append({
-                'local_address': f"{conn.laddr.ip}:{conn.laddr.port}",
-                'remote_address': f"{conn.raddr.ip}:{conn.raddr.port}" if conn.raddr else "N/A",
-                'status': conn.status,
-                'pid': conn.pid
-            })
-    return net_conns[:MAX_CONNECTIONS]
-
-def check_thresholds(cpu, memory, disk, gpu=None):
-    alerts = []
-    if cpu > CPU_THRESHOLD:
-        alerts.append((translate("cpu_alert"), f"CPU usage is high: {cpu}%"))
-    if memory > MEMORY_THRESHOLD:
-        alerts.append((translate("memory_alert"), f"Memory usage is high: {memory}%"))
-    if disk > DISK_THRESHOLD:
-        alerts.append((translate("disk_alert"), f"Disk usage is high: {disk}%"))
-    if gpu:
-        if gpu['usage'] > GPU_THRESHOLD:
-            alerts.append((translate("gpu_alert"), f"GPU usage is high: {gpu['usage']}%"))
-        if (gpu['memory_used'] / gpu['memory_total']) * 100 > GPU_MEMORY_THRESHOLD:
-            alerts.append((translate("gpu_memory_alert"), f"GPU memory usage is high: {gpu['memory_used']} MB / {gpu['memory_total']} MB"))
-    return alerts
+            build_fake_procfs(root, count)
+            psutil.PROCFS_PATH = root
+            timings = {}
+            for backend in (PsutilBackend(), ProcfsBackend(root)):
+                # Первый проход заполняет кэши, измеряем установившийся режим
+                backend.processes()
+                best = None
+                for _ in range(repeat):
+                    started = time.perf_counter()
+                    rows = backend.processes()
+                    elapsed = (time.perf_counter() - started) * 1000
+                    best = elapsed if best is None else min(best, elapsed)
+                if len(rows) != count:
+                    logging.warning(f"{backend.name} backend returned {len(rows)} of {count} processes")
+                timings[backend.name] = best
+        finally:
+            psutil.PROCFS_PATH = procfs_path
+            shutil.rmtree(root, ignore_errors=True)
+        results.append({'processes': count, **timings})
+        print(f"{count:>10} {timings['psutil']:>12.1f} {timings['procfs']:>12.1f} {timings['psutil'] / timings['procfs']:>7.1f}x")
+    return results
+
+# Набор бенчмарков для сравнения между коммитами: коллекторы на синтетической нагрузке
+# (psutil подменяется фиктивными процессами и сокетами) и отрисовка графиков на Agg
+# при разной длине истории. Результат - JSON со временем каждой стадии
+BENCHMARK_LOADS = (100, 1000, 10000, 100000)
+BENCHMARK_GPU_COUNTS = (1, 8, 64)
+BENCHMARK_HISTORY_SIZES = (10, 1000, 100000, 1000000)
+
+class FakeProcess:
+    def __init__(self, pid):
+        self.pid = pid
+        self._name = f"proc{pid % 1000}"
+
+    def oneshot(self):
+        return contextlib.nullcontext()
+
+    def is_running(self):
+        return True
+
+    def memory_info(self):
+        return SimpleNamespace(rss=(self.pid % 2000 + 100) * 4096)
+
+    def io_counters(self):
+        return SimpleNamespace(read_bytes=self.pid * 4096, write_bytes=0)
+
+    def name(self):
+        return self._name
+
+    def ppid(self):
+        # Синтетическое дерево: у каждого процесса до десяти детей
+        return self.pid // 10
+
+    def cpu_percent(self):
+        return self.pid % 100 / 10
+
+    def num_threads(self):
+        return self.pid % 8 + 1
+
+    def create_time(self):
+        return 1700000000.0 + self.pid
+
+def fake_sockets(count):
+    states = ("ESTABLISHED", "ESTABLISHED", "ESTABLISHED", "TIME_WAIT", "LISTEN")
+    return [
+        SimpleNamespace(
+            laddr=SimpleNamespace(ip="127.0.0.1", port=1024 + i % 60000),
+            raddr=SimpleNamespace(ip=f"10.0.{i % 200}.1", port=443) if i % 5 != 4 else (),
+            status=states[i % len(states)],
+            pid=i % 1000 + 1
+        )
+        for i in range(count)
+    ]
+
+def measure(function, repeat):
+    # Первый вызов прогревает кэши и сэмплеры, в результат идут повторные
+    function()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return {'best_ms': round(timings[0], 3), 'median_ms': round(timings[len(timings) // 2], 3), 'runs': repeat}
+
+def benchmark_collectors(loads=BENCHMARK_LOADS, repeat=5):
+    global _backend, _gpu_backend
+    from unittest import mock
+    results = [{'stage': name, 'load': None, **measure(collector, repeat)} for name, collector in (
+        ("cpu_stats", get_cpu_stats), ("memory", get_memory_usage), ("disk", get_disk_usage), ("temperature", get_cpu_temperature)
+    )]
+    backend, gpu_backend = _backend, _gpu_backend
+    try:
+        for count in loads:
+            # Свежий бэкенд psutil: кэш процессов не должен переживать смену нагрузки
+            _backend = PsutilBackend()
+            pids = list(range(1, count + 1))
+            sockets = fake_sockets(count)
+            with mock.patch.object(psutil, "pids", return_value=pids), \
+                    mock.patch.object(psutil, "Process", FakeProcess), \
+                    mock.patch.object(psutil, "net_connections", return_value=sockets):
+                rows = get_processes()
+                results.append({'stage': "processes", 'load': count, **measure(get_processes, repeat)})
+                results.append({'stage': "top_processes", 'load': count, **measure(lambda: get_top_processes(rows=rows), repeat)})
+                results.append({'stage': "network", 'load': count, **measure(get_network, repeat)})
+        for count in BENCHMARK_GPU_COUNTS:
+            _gpu_backend = FakeGpuBackend(count)
+            results.append({'stage': "gpus", 'load': count, **measure(get_gpus, repeat)})
+    finally:
+        _backend, _gpu_backend = backend, gpu_backend
+    return results
+
+def benchmark_render(sizes=BENCHMARK_HISTORY_SIZES, repeat=5):
+    load_chart_modules()
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    results = []
+    for size in sizes:
+        history = MetricHistory(size)
+        now = time.time()
+        for i in range(size):
+            value = 50 + 40 * math.sin(i / 50)
+            history.append(now - (size - i) * 0.1, cpu=value, memory=value / 2, disk=60.0, gpu=None if i % 100 == 0 else value)
+        figure = Figure(figsize=(10, 8), dpi=100)
+        canvas = FigureCanvasAgg(figure)
+        renderer = ChartRenderer(canvas, [
+            (figure.add_subplot(411), "cpu", "CPU (%)", "cyan"),
+            (figure.add_subplot(412), "memory", "Memory (%)", "lime"),
+            (figure.add_subplot(413), "disk", "Disk (%)", "magenta"),
+            (figure.add_subplot(414), "gpu", "GPU (%)", "orange")
+        ])
+        # Окно охватывает всю историю: прореживание работает на полном объёме
+        renderer.set_window(size * 0.1 + 1)
+        columns = {name: history.column(name) for name in MetricHistory.columns}
+
+        def full():
+            renderer.backgrounds = None
+            renderer.update(history.times(), columns)
+
+        results.append({'stage': "render_full", 'load': size, **measure(full, repeat)})
+        results.append({'stage': "render_blit", 'load': size, **measure(lambda: renderer.update(history.times(), columns), repeat)})
+    return results
+
+def run_benchmarks(path, repeat=5):
+    results = benchmark_collectors(repeat=repeat) + benchmark_render(repeat=repeat)
+    print(f"{'stage':<16} {'load':>8} {'best ms':>10} {'median ms':>10}")
+    for result in results:
+        load = "" if result['load'] is None else result['load']
+        print(f"{result['stage']:<16} {load:>8} {result['best_ms']:>10.2f} {result['median_ms']:>10.2f}")
+    report = {
+        'timestamp': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'psutil': psutil.__version__,
+        'results': results
+    }
+    if path == "-":
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+    return report
+
+# Инкрементальная отправка журналов в S3-совместимое хранилище. Для каждого
+# файла запоминается отправленное смещение по inode, поэтому переименование
+# при ротации (.log -> .log.1 -> .log.2) не приводит к повторной отправке.
+# Новые байты сжимаются потоком во временный файл и уходят multipart-загрузкой
+# через один и тот же клиент boto3
+SHIP_READ_SIZE = 1024 * 1024
+
+class LogShipper:
+    def __init__(self, bucket, prefix="", paths=("system_monitor.log",), state_path="system_monitor.ship.json",
+                 endpoint_url=None, region=None, access_key=None, secret_key=None, part_size=8 * 1024 * 1024, progress=None):
+        self.bucket = bucket
+        self.prefix = prefix
+        self.paths = list(paths)
+        self.state_path = state_path
+        self.endpoint_url = endpoint_url or None
+        self.region = region or None
+        self.access_key = access_key or None
+        self.secret_key = secret_key or None
+        self.part_size = part_size
+        self.progress = progress
+        self._client = None
+        self._transfer = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.offsets = self._load_state()
+        # zstd, если установлен zstandard, иначе gzip из стандартной библиотеки
+        try:
+            import zstandard
+            self._zstd = zstandard.ZstdCompressor()
+            self.suffix = ".zst"
+        except ImportError:
+            self._zstd = None
+            self.suffix = ".gz"
+
+    @property
+    def client(self):
+        if self._client is None:
+            import boto3
+            from boto3.s3.transfer import TransferConfig
+            self._client = boto3.client(
+                "s3",
+                endpoint_url=self.endpoint_url,
+                region_name=self.region,
+                aws_access_key_id=self.access_key,
+                aws_secret_access_key=self.secret_key
+            )
+            self._transfer = TransferConfig(multipart_threshold=self.part_size, multipart_chunksize=self.part_size)
+        return self._client
+
+    def _load_state(self):
+        try:
+            with open(self.state_path) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _save_state(self):
+        # Запись через временный файл: после сбоя остаётся либо старое, либо новое состояние
+        write_json_atomic(self.state_path, self.offsets)
+
+    def segments(self, path):
+        # Сначала самые старые ротированные сегменты, в конце активный файл
+        directory = os.path.dirname(os.path.abspath(path))
+        base = os.path.basename(path)
+        rotated = []
+        for name in os.listdir(directory):
+            suffix = name[len(base) + 1:]
+            if name.startswith(base + ".") and suffix.isdigit():
+                rotated.append((int(suffix), os.path.join(directory, name)))
+        return [segment for _, segment in sorted(rotated, reverse=True)] + [path]
+
+    def object_key(self, path, inode, offset):
+        stamp = datetime.now().strftime("%Y%m%dT%H%M%S")
+        return f"{self.prefix}{platform.node()}/{os.path.basename(path)}/{stamp}-{inode}-{offset}{self.suffix}"
+
+    def _compress(self, f, start, end, buffer):
+        writer = self._zstd.stream_writer(buffer, closefd=False) if self._zstd else gzip.GzipFile(fileobj=buffer, mode="wb")
+        f.seek(start)
+        remaining = end - start
+        while remaining:
+            chunk = f.read(min(SHIP_READ_SIZE, remaining))
+            if not chunk:
+                break
+            writer.write(chunk)
+            remaining -= len(chunk)
+        writer.close()
+
+    def _upload(self, buffer, key):
+        size = buffer.tell()
+        buffer.seek(0)
+        sent = 0
+        started = time.perf_counter()
+        lock = threading.Lock()
+
+        # boto3 вызывает callback из своих потоков по мере отправки частей
+        def callback(count):
+            nonlocal sent
+            with lock:
+                sent += count
+                rate = sent / max(time.perf_counter() - started, 1e-6) / (1024 ** 2)
+                if self.progress is not None:
+                    self.progress(key, sent, size, rate)
+
+        client = self.client
+        client.upload_fileobj(buffer, self.bucket, key, Config=self._transfer, Callback=callback)
+        return size
+
+    def ship(self):
+        # Возвращает сводку отправки или None, если отправка уже идёт в другом потоке
+        if not self._lock.acquire(blocking=False):
+            return None
+        try:
+            started = time.perf_counter()
+            summary = {"objects": 0, "bytes": 0, "compressed": 0}
+            seen = set()
+            for path in self.paths:
+                for segment in self.segments(path):
+                    try:
+                        f = open(segment, "rb")
+                    except FileNotFoundError:
+                        continue
+                    with f:
+                        # Размер и inode берутся у открытого дескриптора: ротация после open не мешает
+                        stat = os.fstat(f.fileno())
+                        inode = f"{stat.st_dev}:{stat.st_ino}"
+                        seen.add(inode)
+                        offset = self.offsets.get(inode, 0)
+                        if offset > stat.st_size:
+                            # inode достался новому файлу
+                            offset = 0
+                        if offset == stat.st_size:
+                            continue
+                        with tempfile.SpooledTemporaryFile(max_size=self.part_size) as buffer:
+                            self._compress(f, offset, stat.st_size, buffer)
+                            summary["compressed"] += self._upload(buffer, self.object_key(path, stat.st_ino, offset))
+                    summary["objects"] += 1
+                    summary["bytes"] += stat.st_size - offset
+                    self.offsets[inode] = stat.st_size
+                    self._save_state()
+            # Смещения удалённых сегментов больше не нужны
+            self.offsets = {inode: offset for inode, offset in self.offsets.items() if inode in seen}
+            self._save_state()
+            summary["seconds"] = time.perf_counter() - started
+            summary["throughput"] = summary["compressed"] / max(summary["seconds"], 1e-6) / (1024 ** 2)
+            if summary["objects"]:
+                logging.info(
+                    f"Shipped {summary['bytes']} bytes of logs as {summary['objects']} objects "
+                    f"({summary['compressed']} bytes compressed) in {summary['seconds']:.1f} s, {summary['throughput']:.2f} MB/s"
+                )
+            return summary
+        finally:
+            self._lock.release()
+
+    def start(self, interval):
+        self._thread = threading.Thread(target=self._run, args=(interval,), name="log-shipper", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def _run(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                self.ship()
+            except Exception as e:
+                logging.error(f"Error shipping logs: {e}")
+
+def open_log_shipper(progress=None):
+    if not config["s3_bucket"]:
+        return None
+    return LogShipper(
+        config["s3_bucket"],
+        prefix=config["s3_prefix"],
+        paths=config["ship_paths"],
+        state_path=config["ship_state"],
+        endpoint_url=config["s3_endpoint_url"],
+        region=config["s3_region"],
+        access_key=config["aws_access_key"],
+        secret_key=config["aws_secret_key"],
+        progress=progress
+    )
+
+# Графический интерфейс загружается только при запуске окна: в режиме --daemon
+# ни tkinter, ни customtkinter, ни matplotlib не импортируются
+def load_chart_modules():
+    global Figure, style, FuncFormatter
+    from matplotlib.figure import Figure
+    from matplotlib import style
+    from matplotlib.ticker import FuncFormatter
+
+def load_gui_modules():
+    global ctk, ttk, filedialog, messagebox, FigureCanvasTkAgg
+    import customtkinter as ctk
+    from tkinter import filedialog, messagebox, ttk
+    from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+    load_chart_modules()
+
+# Фоновый режим без интерфейса: те же коллекторы и пороги, результаты пишутся в лог и NDJSON
+DAEMON_STARTUP_BUDGET_MS = 500
+
+def _thaw(value):
+    if isinstance(value, MappingProxyType):
+        return {k: _thaw(v) for k, v in value.items()}
+    if isinstance(value, tuple):
+        return [_thaw(v) for v in value]
+    return value
+
+def snapshot_to_dict(snapshot):
+    sample = {name: _thaw(getattr(snapshot, name)) for name in Snapshot._fields if name not in LOCAL_FIELDS}
+    sample["timestamp"] = snapshot.timestamp.isoformat()
+    return sample
+
+def resident_memory():
+    return psutil.Process().memory_info().rss / (1024 ** 2)
+
+def run_daemon(output=None, samples=None, metrics_port=None, agent_address=None, agent_name=None):
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stop.set())
+    dispatcher = NotificationDispatcher()
+    # Без журнала событий оповещения остаются хотя бы в текстовом логе
+    journal = open_event_journal()
+    dispatcher.add_sink(journal.append if journal is not None else log_alert)
+    notifier = start_notifier()
+    if notifier is not None:
+        dispatcher.add_sink(notifier.submit)
+    dispatcher.start()
+    engine = CollectorEngine(config["update_interval"], store=open_metric_store(), alerts=AlertEngine(build_alert_rules()),
+                             dispatcher=dispatcher, process_tree=ProcessTree(), watcher=ConfigWatcher())
+    engine.start()
+    exporter = start_exporter(engine, config["metrics_port"] if metrics_port is None else metrics_port)
+    shipper = open_log_shipper()
+    if shipper is not None and config["ship_interval"] > 0:
+        shipper.start(config["ship_interval"])
+    agent = start_agent(agent_address, agent_name) if agent_address else None
+    startup = (time.perf_counter() - STARTED_AT) * 1000
+    logging.info(f"Daemon started in {startup:.0f} ms, RSS {resident_memory():.1f} MB")
+    if startup > DAEMON_STARTUP_BUDGET_MS:
+        logging.warning(f"Daemon cold start took {startup:.0f} ms (budget {DAEMON_STARTUP_BUDGET_MS} ms)")
+    stream = None
+    if output == "-":
+        stream = sys.stdout
+    elif output:
+        stream = open(output, "a")
+    count = 0
+    try:
+        while not stop.is_set() and (samples is None or count < samples):
+            try:
+                snapshot = engine.snapshots.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            count += 1
+            mem = snapshot.memory['percent'] if snapshot.memory else 0.0
+            disk = snapshot.disk['percent'] if snapshot.disk else 0.0
+            logging.info(f"CPU {snapshot.cpu}% - Memory {mem}% - Disk {disk}%")
+            if stream is not None:
+                stream.write(json.dumps(snapshot_to_dict(snapshot)) + "\n")
+                stream.flush()
+            if agent is not None:
+                agent.submit(snapshot)
+    finally:
+        if agent is not None:
+            agent.stop()
+            logging.info(f"Agent sent {agent.sent_frames} frames, {agent.sent_bytes} bytes, dropped {agent.dropped} samples")
+        if exporter is not None:
+            exporter.stop()
+        engine.stop()
+        if notifier is not None:
+            notifier.stop()
+        if shipper is not None:
+            shipper.stop()
+        if journal is not None:
+            journal.close()
+        if stream is not None and stream is not sys.stdout:
+            stream.close()
+        logging.info(f"Daemon stopped after {count} samples, RSS {resident_memory():.1f} MB")
 
 def notify(title, message):
+    # Без plyer оповещение остаётся в журнале и на вкладке уведомлений, модальное окно не открывается
     try:
         import plyer
         plyer.notification.notify(title=title, message=message)
-    except ImportError:
-        messagebox.showwarning(title, message)
+    except Exception as e:
+        logging.info(f"Desktop notification unavailable ({e}): {title}: {message}")
+
+# Прореживание до ширины графика в пикселях: для каждого столбца пикселей
+# остаются минимум и максимум, поэтому пики не теряются
+def decimate_minmax(x, y, width):
+    count = len(x)
+    if count <= 2 * width:
+        return x, y
+    step = -(-count // width)
+    head = count % step
+    bins_x = x[head:].reshape(-1, step)
+    bins_y = y[head:].reshape(-1, step)
+    # fmin/fmax пропускают NaN, а полностью пустой столбец остаётся NaN (разрыв линии)
+    low = np.fmin.reduce(bins_y, axis=1)
+    high = np.fmax.reduce(bins_y, axis=1)
+    decimated_x = np.repeat(bins_x[:, 0], 2)
+    decimated_y = np.column_stack((low, high)).ravel()
+    return np.concatenate((x[:head], decimated_x)), np.concatenate((y[:head], decimated_y))
+
+def format_age(seconds, position=None):
+    age = -seconds
+    if age < 1:
+        return "now"
+    if age < 120:
+        return f"-{age:.0f}s"
+    if age < 7200:
+        return f"-{age / 60:.0f}m"
+    if age < 172800:
+        return f"-{age / 3600:.0f}h"
+    return f"-{age / 86400:.0f}d"
+
+def format_rate(value):
+    for unit in ("B/s", "KB/s", "MB/s"):
+        if value < 1024:
+            return f"{value:.1f} {unit}"
+        value /= 1024
+    return f"{value:.1f} GB/s"
+
+# Графики рисуются через blit: линии создаются один раз, фон осей кэшируется
+# после полной отрисовки, а на каждом тике перерисовываются только сами линии.
+# Ось X - секунды относительно текущего момента, поэтому фон не меняется между тиками
+class ChartRenderer:
+    def __init__(self, canvas, specs):
+        self.canvas = canvas
+        self.lines = {}
+        self.window = None
+        self.backgrounds = None
+        for ax, name, label, color in specs:
+            line, = ax.plot([], [], label=label, color=color, animated=True)
+            ax.set_ylim(0, 100)
+            ax.xaxis.set_major_formatter(FuncFormatter(format_age))
+            ax.legend(loc="upper left")
+            self.lines[name] = (ax, line)
+        canvas.mpl_connect("draw_event", self.on_draw)
+
+    def on_draw(self, event):
+        self.backgrounds = {ax: self.canvas.copy_from_bbox(ax.bbox) for ax, _ in self.lines.values()}
+        for ax, line in self.lines.values():
+            ax.draw_artist(line)
+
+    def set_window(self, seconds):
+        if seconds == self.window:
+            return
+        self.window = seconds
+        for ax, _ in self.lines.values():
+            ax.set_xlim(-seconds, 0)
+        self.backgrounds = None
+
+    def update(self, times, columns):
+        now = time.time()
+        start = np.searchsorted(times, now - self.window)
+        visible = times[start:] - now
+        for name, (ax, line) in self.lines.items():
+            x, y = decimate_minmax(visible, columns[name][start:], max(int(ax.bbox.width), 1))
+            line.set_data(x, y)
+        if self.backgrounds is None:
+            # Полная отрисовка (первый тик, смена диапазона или темы); фон сохранит on_draw
+            self.canvas.draw()
+            return
+        for ax, line in self.lines.values():
+            self.canvas.restore_region(self.backgrounds[ax])
+            ax.draw_artist(line)
+            self.canvas.blit(ax.bbox)
+
+# Таблица с обновлением по ключам: строки меняются на месте, вставляются и удаляются
+# только изменения, а в Treeview находятся лишь видимые строки (прокрутка своя),
+# поэтому выделение и позиция прокрутки сохраняются между тиками
+# Биты модификаторов в event.state
+SHIFT_MASK = 0x0001
+CONTROL_MASK = 0x0004
+
+class VirtualTable:
+    def __init__(self, parent, columns, headings):
+        self.frame = ctk.CTkFrame(parent, fg_color="transparent")
+        self.tree = ttk.Treeview(self.frame, columns=columns, show="headings")
+        for column, heading in zip(columns, headings):
+            self.tree.heading(column, text=heading)
+        self.scrollbar = ttk.Scrollbar(self.frame, orient="vertical", command=self.on_scroll)
+        self.tree.pack(side="left", fill="both", expand=True)
+        self.scrollbar.pack(side="right", fill="y")
+        self.row_height = int(ttk.Style().lookup("Treeview", "rowheight") or 20)
+        self.rows = []
+        self.offset = 0
+        self.visible = 20
+        self._values = {}
+        self._selected = set()
+        # Выделение меняет пользователь (щелчок, клавиши) или render, восстанавливая его после прокрутки
+        self._user_input = False
+        self._extend = False
+        self.tree.bind("<Configure>", self.on_resize)
+        self.tree.bind("<<TreeviewSelect>>", self.on_select)
+        self.tree.bind("<ButtonPress-1>", self.on_input)
+        self.tree.bind("<KeyPress>", self.on_input)
+        self.tree.bind("<MouseWheel>", self.on_wheel)
+        self.tree.bind("<Button-4>", self.on_wheel)
+        self.tree.bind("<Button-5>", self.on_wheel)
+
+    @staticmethod
+    def iid(key):
+        return "|".join(map(str, key)) if isinstance(key, tuple) else str(key)
+
+    def set_rows(self, rows):
+        # Дубликаты ключей (например, один сокет в нескольких дескрипторах) Treeview не допускает
+        self.rows = list({self.iid(key): (key, values) for key, values in rows}.values())
+        self.render()
+
+    def selected_keys(self):
+        return [key for key, _ in self.rows if self.iid(key) in self._selected]
+
+    def _scroll_to(self, offset):
+        self.offset = max(0, min(offset, len(self.rows) - self.visible))
+        self.render()
+
+    def on_scroll(self, action, amount, unit=None):
+        if action == "moveto":
+            self._scroll_to(int(float(amount) * len(self.rows)))
+        elif action == "scroll":
+            step = self.visible if unit == "pages" else 1
+            self._scroll_to(self.offset + int(amount) * step)
+
+    def on_wheel(self, event):
+        direction = -1 if event.num == 4 or event.delta > 0 else 1
+        self._scroll_to(self.offset + direction * 3)
+        return "break"
+
+    def on_resize(self, event):
+        # Одна строка уходит под заголовок таблицы
+        self.visible = max(1, event.height // self.row_height - 1)
+        self._scroll_to(self.offset)
+
+    def on_input(self, event):
+        # Привязка виджета срабатывает раньше классовой, которая и меняет выделение
+        self._user_input = True
+        self._extend = bool(event.state & (SHIFT_MASK | CONTROL_MASK))
+
+    def on_select(self, event):
+        if not self._user_input:
+            return
+        self._user_input = False
+        current = set(self.tree.selection())
+        if self._extend:
+            # Ctrl/Shift добавляют к выделению; строки за пределами видимой области сохраняются
+            visible = set(self.tree.get_children())
+            self._selected = {iid for iid in self._selected if iid not in visible} | current
+        else:
+            self._selected = current
+
+    def render(self):
+        self.offset = max(0, min(self.offset, len(self.rows) - self.visible))
+        window = self.rows[self.offset:self.offset + self.visible]
+        desired = [self.iid(key) for key, _ in window]
+        wanted = set(desired)
+        stale = [iid for iid in self.tree.get_children() if iid not in wanted]
+        if stale:
+            self.tree.delete(*stale)
+            for iid in stale:
+                del self._values[iid]
+        for index, (iid, (_, values)) in enumerate(zip(desired, window)):
+            if iid not in self._values:
+                self.tree.insert("", index, iid=iid, values=values)
+            elif self._values[iid] != values:
+                self.tree.item(iid, values=values)
+            self._values[iid] = values
+        if self.tree.get_children() != tuple(desired):
+            for index, iid in enumerate(desired):
+                self.tree.move(iid, "", index)
+        selection = [iid for iid in desired if iid in self._selected]
+        if set(selection) != set(self.tree.selection()):
+            # Восстановление выделения — не ввод пользователя
+            self._user_input = False
+            self.tree.selection_set(selection)
+        if self.rows:
+            self.scrollbar.set(self.offset / len(self.rows), min(1.0, (self.offset + self.visible) / len(self.rows)))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+# Иерархическая таблица с ленивым раскрытием: у свёрнутого узла вместо детей одна заглушка,
+# поэтому в Treeview живут только корни и раскрытые ветви. Первая колонка — колонка дерева
+class TreeTable:
+    def __init__(self, parent, columns, headings):
+        self.frame = ctk.CTkFrame(parent, fg_color="transparent")
+        self.tree = ttk.Treeview(self.frame, columns=columns[1:], show="tree headings")
+        self.tree.heading("#0", text=headings[0])
+        for column, heading in zip(columns[1:], headings[1:]):
+            self.tree.heading(column, text=heading)
+        self.scrollbar = ttk.Scrollbar(self.frame, orient="vertical", command=self.tree.yview)
+        self.tree.configure(yscrollcommand=self.scrollbar.set)
+        self.tree.pack(side="left", fill="both", expand=True)
+        self.scrollbar.pack(side="right", fill="y")
+        self.roots = ()
+        self.children = {}
+        self.describe = None
+        self._open = set()
+        self._keys = {}
+        self._values = {}
+        self.tree.bind("<<TreeviewOpen>>", self.on_open)
+        self.tree.bind("<<TreeviewClose>>", self.on_close)
+
+    @staticmethod
+    def iid(key):
+        return str(key)
+
+    @staticmethod
+    def placeholder(iid):
+        return f"placeholder:{iid}"
+
+    def set_tree(self, roots, children, describe):
+        # describe(key) -> значения строки; вызывается только для видимых узлов
+        self.roots = roots
+        self.children = children
+        self.describe = describe
+        self._sync("", roots)
+
+    def selected_keys(self):
+        return [self._keys[iid] for iid in self.tree.selection() if iid in self._keys]
+
+    def on_open(self, event):
+        # Событие приходит до того, как Treeview отметит узел раскрытым
+        iid = self.tree.focus()
+        if iid in self._keys:
+            key = self._keys[iid]
+            self._open.add(key)
+            self._sync(iid, self.children.get(key, ()))
+
+    def on_close(self, event):
+        iid = self.tree.focus()
+        if iid in self._keys:
+            self._open.discard(self._keys[iid])
+            self._collapse(iid, True)
+
+    def _forget(self, iids):
+        # Удаление элемента Treeview удаляет и его потомков: их записи тоже сбрасываются
+        stack = list(iids)
+        while stack:
+            iid = stack.pop()
+            stack.extend(self.tree.get_children(iid))
+            self._values.pop(iid, None)
+            key = self._keys.pop(iid, None)
+            if key is not None:
+                self._open.discard(key)
+
+    def _remove(self, iids):
+        if iids:
+            self._forget(iids)
+            self.tree.delete(*iids)
+
+    def _collapse(self, iid, has_children):
+        placeholder = self.placeholder(iid)
+        current = self.tree.get_children(iid)
+        if has_children and current == (placeholder,):
+            return
+        self._remove(current)
+        if has_children:
+            self.tree.insert(iid, "end", iid=placeholder)
+
+    def _sync(self, parent, keys):
+        desired = [self.iid(key) for key in keys]
+        wanted = set(desired)
+        self._remove([iid for iid in self.tree.get_children(parent) if iid not in wanted])
+        for index, (iid, key) in enumerate(zip(desired, keys)):
+            values = self.describe(key)
+            if iid not in self._values:
+                self.tree.insert(parent, index, iid=iid, text=values[0], values=values[1:])
+                self._keys[iid] = key
+            else:
+                # Узел сменил родителя (переподчинение процесса): переносится вместе с ветвью
+                if self.tree.parent(iid) != parent:
+                    self.tree.move(iid, parent, index)
+                if self._values[iid] != values:
+                    self.tree.item(iid, text=values[0], values=values[1:])
+            self._values[iid] = values
+            kids = self.children.get(key, ())
+            if key in self._open and kids:
+                self._sync(iid, kids)
+            else:
+                self._collapse(iid, bool(kids))
+        if self.tree.get_children(parent) != tuple(desired):
+            for index, iid in enumerate(desired):
+                self.tree.move(iid, parent, index)
 
 class SystemMonitorApp:
-    def __init__(self, root):
+    def __init__(self, root, metrics_port=None, fleet_port=None, startup_report=False):
         self.root = root
+        # startup_report: вывести отметки старта после первой отрисовки и выйти
+        self.startup_report = startup_report
+        self.first_painted = False
         self.root.title("System Monitor")
         self.root.geometry("1200x800")
-        ctk.set_appearance_mode(THEME)
+        ctk.set_appearance_mode(config["theme"])
         ctk.set_default_color_theme("blue")
 
         # Данные для графиков
-        self.cpu_data = []
-        self.memory_data = []
-        self.disk_data = []
-        self.gpu_data = []
-        self.time_data = []
+        self.history = MetricHistory(config["history_size"])
+        self.process_history = open_process_history()
+        self.store = open_metric_store()
+        # Данные выбранного диапазона из хранилища: (время, {метрика: значения})
+        self.range_var = ctk.StringVar(value="live")
+        self.range_data = None
+        self.range_loaded = 0.0
 
         # Переменные для интерфейса
-        self.update_interval_var = ctk.StringVar(value=str(UPDATE_INTERVAL))
-        self.cpu_threshold_var = ctk.StringVar(value=str(CPU_THRESHOLD))
-        self.memory_threshold_var = ctk.StringVar(value=str(MEMORY_THRESHOLD))
-        self.disk_threshold_var = ctk.StringVar(value=str(DISK_THRESHOLD))
-        self.gpu_threshold_var = ctk.StringVar(value=str(GPU_THRESHOLD))
-        self.gpu_memory_threshold_var = ctk.StringVar(value=str(GPU_MEMORY_THRESHOLD))
-        self.theme_var = ctk.StringVar(value=THEME)
-        self.language_var = ctk.StringVar(value=LANGUAGE)
-
-        # Уведомления
-        self.notifications = []
+        self.update_interval_var = ctk.StringVar()
+        self.cpu_threshold_var = ctk.StringVar()
+        self.memory_threshold_var = ctk.StringVar()
+        self.disk_threshold_var = ctk.StringVar()
+        self.gpu_threshold_var = ctk.StringVar()
+        self.gpu_memory_threshold_var = ctk.StringVar()
+        self.theme_var = ctk.StringVar()
+        self.language_var = ctk.StringVar()
+        # Конфигурация, с которой синхронизированы тема и поля настроек
+        self.applied_config = config
+        self.refresh_settings_vars()
+
+        # Уведомления: журнал событий на диске, вкладка показывает одну страницу из него
+        self.journal = open_event_journal()
+        self.notification_metric_var = ctk.StringVar(value="All")
+        self.notification_range_var = ctk.StringVar(value="all")
+        self.notifications_page = 0
+        # Очистка скрывает уже показанные события, но не удаляет их из журнала
+        self.notifications_cleared = None
+
+        # Время отрисовки последнего тика в UI-потоке (мс)
+        self.ui_tick_time = 0.0
+        self.ui_tick_max = 0.0
+        self.ui_stages = {}
+        # Оверлей профилирования (F12): стадии тика и собственная нагрузка монитора
+        self.overlay = None
+        self.own_process = psutil.Process()
+
+        # Сборщик снимков удалённых агентов; source - имя просматриваемого хоста (None - этот компьютер)
+        self.fleet = start_fleet_collector(config["fleet_port"] if fleet_port is None else fleet_port)
+        self.source = None
+        self.source_seen = None
+        self.fleet_rendered = 0.0
 
         self.setup_ui()
+        mark_startup("window")
+        # Оповещения приходят из потока сбора; UI забирает их из очереди на своём тике
+        self.alert_events = queue.Queue()
+        self.dispatcher = NotificationDispatcher()
+        self.dispatcher.add_sink(self.journal.append if self.journal is not None else log_alert)
+        self.dispatcher.add_sink(desktop_alert)
+        self.dispatcher.add_sink(self.alert_events.put)
+        self.notifier = start_notifier()
+        if self.notifier is not None:
+            self.dispatcher.add_sink(self.notifier.submit)
+        self.dispatcher.start()
+        self.engine = CollectorEngine(
+            config["update_interval"],
+            store=self.store,
+            alerts=AlertEngine(build_alert_rules()),
+            dispatcher=self.dispatcher,
+            process_history=self.process_history,
+            process_tree=ProcessTree(),
+            first_paint=True,
+            watcher=ConfigWatcher()
+        )
+        self.engine.start()
+        mark_startup("engine")
+        self.exporter = start_exporter(self.engine, config["metrics_port"] if metrics_port is None else metrics_port)
+        self.on_tab_change()
+        self.shipper = open_log_shipper(self.report_upload_progress)
+        if self.shipper is not None and config["ship_interval"] > 0:
+            self.shipper.start(config["ship_interval"])
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
         self.update_system_info()
 
+    def on_close(self):
+        if self.exporter is not None:
+            self.exporter.stop()
+        self.engine.stop()
+        if self.notifier is not None:
+            self.notifier.stop()
+        if self.shipper is not None:
+            self.shipper.stop()
+        if self.fleet is not None:
+            self.fleet.stop()
+        if self.journal is not None:
+            self.journal.close()
+        self.root.destroy()
+
     def setup_ui(self):
         # Вкладки
-        self.tab_control = ctk.CTkTabview(self.root)
+        self.tab_control = ctk.CTkTabview(self.root, command=self.on_tab_change)
         self.tab_control.add(translate("overview"))
         self.tab_control.add(translate("processes"))
         self.tab_control.add(translate("network"))
+        self.tab_control.add(translate("disks"))
         self.tab_control.add(translate("notifications"))
         self.tab_control.add(translate("settings"))
         self.tab_control.add(translate("system_info"))
+        if self.fleet is not None:
+            self.tab_control.add(translate("fleet"))
         self.tab_control.pack(fill="both", expand=True)
 
-        # Вкладка Overview
-        self.setup_overview_tab(self.tab_control.tab(translate("overview")))
-        # Вкладка Processes
-        self.setup_processes_tab(self.tab_control.tab(translate("processes")))
-        # Вкладка Network
-        self.setup_network_tab(self.tab_control.tab(translate("network")))
-        # Вкладка Notifications
-        self.setup_notifications_tab(self.tab_control.tab(translate("notifications")))
-        # Вкладка Settings
-        self.setup_settings_tab(self.tab_control.tab(translate("settings")))
-        # Вкладка System Info
-        self.setup_system_info_tab(self.tab_control.tab(translate("system_info")))
+        # Вкладка Overview видна при запуске; остальные строятся при первом открытии:
+        # (построение, отрисовка снимка)
+        self.tab_builders = {
+            "overview": (self.setup_overview_tab, None),
+            "processes": (self.setup_processes_tab, self.render_processes),
+            "network": (self.setup_network_tab, self.render_network),
+            "disks": (self.setup_disks_tab, self.render_disks),
+            "notifications": (self.setup_notifications_tab, None),
+            "settings": (self.setup_settings_tab, None),
+            "system_info": (self.setup_system_info_tab, self.render_schedule),
+            "fleet": (self.setup_fleet_tab, None),
+        }
+        self.tab_renderers = {}
+        self.built_tabs = set()
+        self.shown_snapshot = None
+        self.build_tab("overview")
+
+    def build_tab(self, name):
+        if name in self.built_tabs:
+            return
+        setup, render = self.tab_builders[name]
+        setup(self.tab_control.tab(translate(name)))
+        self.built_tabs.add(name)
+        if render is not None:
+            self.tab_renderers[name] = render
+            # Новая вкладка сразу показывает последний снимок, не дожидаясь следующего
+            if self.shown_snapshot is not None:
+                render(self.shown_snapshot)
+
+    def on_tab_change(self):
+        visible = self.tab_control.get()
+        for name in self.tab_builders:
+            if translate(name) != visible:
+                continue
+            # Скрытые вкладки не перерисовываются: при открытии они догоняют последний снимок
+            if name in self.tab_renderers and self.shown_snapshot is not None:
+                self.tab_renderers[name](self.shown_snapshot)
+            self.build_tab(name)
+        # Экспортёру нужны все метрики, поэтому при нём ничего не приостанавливается
+        paused = set()
+        if self.exporter is None:
+            for tab, names in TAB_COLLECTORS.items():
+                if translate(tab) != visible:
+                    paused.update(names)
+            paused.difference_update(config["background_collectors"])
+        self.engine.set_paused(paused)
 
     def setup_overview_tab(self, tab):
         # Сетка для плиток
@@ -300,6 +4280,14 @@ class SystemMonitorApp:
         self.cpu_progress = ctk.CTkProgressBar(cpu_frame, orientation="horizontal")
         self.cpu_progress.pack(fill="x", padx=10, pady=5)
         self.cpu_progress.set(0)
+        self.cpu_split_label = ctk.CTkLabel(cpu_frame, text="usr 0% · sys 0% · iowait 0% · steal 0%", font=("Arial", 11))
+        self.cpu_split_label.pack()
+        # Тепловая полоса загрузки по ядрам
+        self.cpu_heat_canvas = ctk.CTkCanvas(cpu_frame, height=40, highlightthickness=0, bg="gray20" if config["theme"] == "dark" else "gray85")
+        self.cpu_heat_canvas.pack(fill="x", padx=10, pady=5)
+        self.cpu_heat_cells = []
+        self.cpu_heat_colors = []
+        self.cpu_heat_canvas.bind("<Configure>", lambda event: self.layout_cpu_heat_strip(len(self.cpu_heat_cells)))
 
         # Плитка Memory
         memory_frame = ctk.CTkFrame(tab, corner_radius=10)
@@ -341,57 +4329,286 @@ class SystemMonitorApp:
         self.canvas.get_tk_widget().grid(row=1, column=0, columnspan=4, padx=10, pady=10, sticky="nsew")
 
         # Настройка стиля графиков
-        style.use("dark_background" if THEME == "dark" else "classic")
-        self.cpu_plot.set_title(translate("cpu_usage"), color="white" if THEME == "dark" else "black")
-        self.cpu_plot.set_ylabel("CPU (%)", color="white" if THEME == "dark" else "black")
+        style.use("dark_background" if config["theme"] == "dark" else "classic")
+        self.cpu_plot.set_title(translate("cpu_usage"), color="white" if config["theme"] == "dark" else "black")
+        self.cpu_plot.set_ylabel("CPU (%)", color="white" if config["theme"] == "dark" else "black")
         self.cpu_plot.grid(True, linestyle="--", alpha=0.6)
-        self.memory_plot.set_title(translate("memory_usage"), color="white" if THEME == "dark" else "black")
-        self.memory_plot.set_ylabel("Memory (%)", color="white" if THEME == "dark" else "black")
+        self.memory_plot.set_title(translate("memory_usage"), color="white" if config["theme"] == "dark" else "black")
+        self.memory_plot.set_ylabel("Memory (%)", color="white" if config["theme"] == "dark" else "black")
         self.memory_plot.grid(True, linestyle="--", alpha=0.6)
-        self.disk_plot.set_title(translate("disk_usage"), color="white" if THEME == "dark" else "black")
-        self.disk_plot.set_ylabel("Disk (%)", color="white" if THEME == "dark" else "black")
+        self.disk_plot.set_title(translate("disk_usage"), color="white" if config["theme"] == "dark" else "black")
+        self.disk_plot.set_ylabel("Disk (%)", color="white" if config["theme"] == "dark" else "black")
         self.disk_plot.grid(True, linestyle="--", alpha=0.6)
-        self.gpu_plot.set_title(translate("gpu_usage"), color="white" if THEME == "dark" else "black")
-        self.gpu_plot.set_ylabel("GPU (%)", color="white" if THEME == "dark" else "black")
+        self.gpu_plot.set_title(translate("gpu_usage"), color="white" if config["theme"] == "dark" else "black")
+        self.gpu_plot.set_ylabel("GPU (%)", color="white" if config["theme"] == "dark" else "black")
         self.gpu_plot.grid(True, linestyle="--", alpha=0.6)
+        self.renderer = ChartRenderer(self.canvas, [
+            (self.cpu_plot, "cpu", "CPU (%)", "cyan"),
+            (self.memory_plot, "memory", "Memory (%)", "lime"),
+            (self.disk_plot, "disk", "Disk (%)", "magenta"),
+            (self.gpu_plot, "gpu", "GPU (%)", "orange")
+        ])
 
-        # Кнопка для сохранения данных
+        # Выбор диапазона истории, сохранение данных и отправка журналов в облако
+        range_menu = ctk.CTkOptionMenu(tab, values=list(HISTORY_RANGES), variable=self.range_var, command=self.change_range)
+        range_menu.grid(row=2, column=0, columnspan=2, pady=10)
         save_button = ctk.CTkButton(tab, text=translate("save_data"), command=self.save_data, corner_radius=10)
-        save_button.grid(row=2, column=0, columnspan=4, pady=10)
+        save_button.grid(row=2, column=2, pady=10)
+        self.cloud_button = ctk.CTkButton(tab, text=translate("send_to_cloud"), command=self.send_to_cloud, corner_radius=10)
+        self.cloud_button.grid(row=2, column=3, pady=10)
+
+        # Время UI-потока на тик
+        self.ui_tick_label = ctk.CTkLabel(tab, text="UI: 0.0 ms", font=("Arial", 10))
+        self.ui_tick_label.grid(row=3, column=0, columnspan=4, sticky="e", padx=10)
+        self.ui_tick_label.bind("<Button-1>", lambda event: self.toggle_overlay())
+        self.ui_tick_color = self.ui_tick_label.cget("text_color")
+        self.shown_collection_error = None
+        self.root.bind("<F12>", lambda event: self.toggle_overlay())
+
+    def layout_cpu_heat_strip(self, count):
+        canvas = self.cpu_heat_canvas
+        canvas.delete("all")
+        self.cpu_heat_cells = []
+        self.cpu_heat_colors = []
+        if not count:
+            return
+        # На машинах с большим числом ядер полоса переносится на несколько строк
+        columns = min(count, HEAT_STRIP_COLUMNS)
+        rows = -(-count // columns)
+        width = max(canvas.winfo_width(), columns)
+        cell_width = width / columns
+        cell_height = max(4, 40 // rows)
+        canvas.configure(height=cell_height * rows)
+        for i in range(count):
+            row, column = divmod(i, columns)
+            x = column * cell_width
+            y = row * cell_height
+            self.cpu_heat_cells.append(canvas.create_rectangle(x, y, x + cell_width - 1, y + cell_height - 1, width=0, fill=heat_color(0)))
+            self.cpu_heat_colors.append(heat_color(0))
+
+    def update_cpu_heat_strip(self, per_cpu):
+        if len(per_cpu) != len(self.cpu_heat_cells):
+            self.layout_cpu_heat_strip(len(per_cpu))
+        for i, value in enumerate(per_cpu):
+            color = heat_color(value)
+            # Перекрашиваем только изменившиеся ячейки
+            if color != self.cpu_heat_colors[i]:
+                self.cpu_heat_canvas.itemconfigure(self.cpu_heat_cells[i], fill=color)
+                self.cpu_heat_colors[i] = color
+
+    def change_range(self, value):
+        self.range_data = None
+        self.range_loaded = 0.0
+
+    def range_bounds(self, range_name=None):
+        end = time.time()
+        return end - HISTORY_RANGES[range_name or self.range_var.get()], end
+
+    def load_range_async(self):
+        # Чтение из SQLite выполняется вне UI-потока
+        self.range_loaded = time.monotonic()
+        start, end = self.range_bounds()
+
+        def load():
+            try:
+                self.store.flush()
+                times, columns = self.store.load_range(start, end)
+                self.range_data = (times, columns)
+            except sqlite3.Error as e:
+                logging.error(f"Error reading metric store: {e}")
+
+        threading.Thread(target=load, daemon=True).start()
+
+    def chart_data(self):
+        # Хранилище содержит историю только этого компьютера
+        if self.range_var.get() != "live" and self.store is not None and self.source is None:
+            if time.monotonic() - self.range_loaded > RANGE_REFRESH_INTERVAL:
+                self.load_range_async()
+            if self.range_data is not None:
+                return self.range_data
+        return self.history.times(), {name: self.history.column(name) for name in MetricHistory.columns}
+
+    def chart_window(self):
+        return HISTORY_RANGES[self.range_var.get()] or config["chart_window"]
 
     def setup_processes_tab(self, tab):
+        # Вид: топ процессов, дерево процессов с суммами по поддеревьям или иерархия cgroup
+        self.process_view_var = ctk.StringVar(value="Top")
+        view_button = ctk.CTkSegmentedButton(tab, values=list(PROCESS_VIEWS), variable=self.process_view_var, command=self.change_process_view)
+        view_button.pack(pady=5)
+        views = ctk.CTkFrame(tab, fg_color="transparent")
+        views.pack(fill="both", expand=True)
+
         # Таблица процессов
-        self.process_tree = ttk.Treeview(tab, columns=("PID", "Name", "CPU", "Memory"), show="headings")
-        self.process_tree.heading("PID", text="PID")
-        self.process_tree.heading("Name", text=translate("processes"))
-        self.process_tree.heading("CPU", text="CPU (%)")
-        self.process_tree.heading("Memory", text="Memory (MB)")
-        self.process_tree.pack(fill="both", expand=True)
+        self.process_table = VirtualTable(views, ("PID", "Name", "CPU", "Memory"), ("PID", translate("processes"), "CPU (%)", "Memory (MB)"))
+        self.process_table.tree.bind("<<TreeviewSelect>>", lambda event: self.update_process_chart(), add="+")
+
+        # Дерево процессов: собственное потребление и суммы по поддереву
+        columns = ("Name", "PID", "CPU", "Memory", "IO", "Tree CPU", "Tree Memory", "Tree IO", "Descendants")
+        headings = (
+            translate("processes"), "PID", "CPU (%)", "Memory (MB)", "IO (MB/s)",
+            "Tree CPU (%)", "Tree Memory (MB)", "Tree IO (MB/s)", "Descendants"
+        )
+        self.process_tree_table = TreeTable(views, columns, headings)
+        self.process_tree_table.tree.bind("<<TreeviewSelect>>", lambda event: self.update_process_chart(), add="+")
+
+        # Иерархия cgroup: у каждой группы суммы с учётом вложенных групп
+        columns = ("Cgroup", "CPU", "Memory", "IO", "Processes")
+        self.cgroup_table = TreeTable(views, columns, ("Cgroup", "CPU (%)", "Memory (MB)", "IO (MB/s)", "Processes"))
+        self.process_views = {"Top": self.process_table, "Tree": self.process_tree_table, "Cgroups": self.cgroup_table}
+        self.process_table.frame.pack(fill="both", expand=True)
+
+        # История выбранного процесса
+        self.process_figure = Figure(figsize=(10, 2.2), dpi=100)
+        self.process_lines = {}
+        specs = (
+            (("cpu", "cyan"),), (("memory", "lime"),), (("io", "magenta"),), (("fds", "orange"), ("threads", "yellow"))
+        )
+        titles = ("CPU (%)", "RSS (MB)", "IO (MB/s)", "FDs / Threads")
+        for n, (lines, title) in enumerate(zip(specs, titles)):
+            ax = self.process_figure.add_subplot(1, len(specs), n + 1)
+            ax.set_title(title, fontsize=9)
+            ax.tick_params(labelsize=8)
+            ax.xaxis.set_major_formatter(FuncFormatter(format_age))
+            for name, color in lines:
+                self.process_lines[name] = ax.plot([], [], color=color, label=name)[0]
+        self.process_figure.tight_layout()
+        self.process_canvas = FigureCanvasTkAgg(self.process_figure, tab)
+        self.process_canvas.get_tk_widget().pack(fill="x", padx=10)
+
+        # Кнопки завершения процесса и всего его поддерева
+        buttons = ctk.CTkFrame(tab, fg_color="transparent")
+        buttons.pack(pady=10)
+        terminate_button = ctk.CTkButton(buttons, text=translate("terminate_process"), command=self.terminate_process, corner_radius=10)
+        terminate_button.pack(side="left", padx=5)
+        terminate_tree_button = ctk.CTkButton(
+            buttons, text=translate("terminate_tree"), command=lambda: self.terminate_process(subtree=True), corner_radius=10
+        )
+        terminate_tree_button.pack(side="left", padx=5)
+
+    def change_process_view(self, value):
+        for view in self.process_views.values():
+            view.frame.pack_forget()
+        self.process_views[value].frame.pack(fill="both", expand=True)
+        if self.shown_snapshot is not None:
+            self.render_processes(self.shown_snapshot)
+
+    def selected_pids(self):
+        view = self.process_view_var.get()
+        return self.process_views[view].selected_keys() if view != "Cgroups" else []
 
-        # Кнопка для завершения процесса
-        terminate_button = ctk.CTkButton(tab, text=translate("terminate_process"), command=self.terminate_process, corner_radius=10)
-        terminate_button.pack(pady=10)
+    def update_process_chart(self):
+        keys = self.selected_pids()
+        pid = keys[0] if keys else None
+        series = self.process_history.series(pid) if pid is not None and self.source is None else None
+        if series is None:
+            for line in self.process_lines.values():
+                line.set_data([], [])
+            self.process_figure.suptitle(f"PID {pid} has no history yet" if pid is not None else "", fontsize=9)
+        else:
+            times, columns = series
+            age = times - time.time()
+            for name, line in self.process_lines.items():
+                line.set_data(age, columns[name])
+            for ax in self.process_figure.axes:
+                ax.relim()
+                ax.autoscale_view()
+            self.process_figure.suptitle(f"{self.process_history.tracked().get(pid)} (PID {pid})", fontsize=9)
+        self.process_canvas.draw_idle()
 
     def setup_network_tab(self, tab):
+        # Скорости интерфейсов
+        columns = ("Interface", "RX", "TX", "RX pkt/s", "TX pkt/s", "Errors/s")
+        self.interface_table = VirtualTable(tab, columns, columns)
+        self.interface_table.tree.configure(height=4)
+        self.interface_table.frame.pack(fill="x")
+
+        # Счётчики состояний TCP и агрегаты по процессам и удалённым хостам
+        self.tcp_states_label = ctk.CTkLabel(tab, text="", font=("Arial", 12))
+        self.tcp_states_label.pack(pady=5)
+        aggregates = ctk.CTkFrame(tab, fg_color="transparent")
+        aggregates.pack(fill="x")
+        self.connections_by_pid_table = VirtualTable(aggregates, ("PID", "Name", "Sockets"), ("PID", translate("processes"), "Sockets"))
+        self.connections_by_pid_table.tree.configure(height=6)
+        self.connections_by_pid_table.frame.pack(side="left", fill="both", expand=True)
+        self.connections_by_remote_table = VirtualTable(aggregates, ("Remote Host", "Sockets"), ("Remote Host", "Sockets"))
+        self.connections_by_remote_table.tree.configure(height=6)
+        self.connections_by_remote_table.frame.pack(side="left", fill="both", expand=True)
+
         # Таблица сетевых соединений
-        self.network_tree = ttk.Treeview(tab, columns=("Local Address", "Remote Address", "Status", "PID"), show="headings")
-        self.network_tree.heading("Local Address", text="Local Address")
-        self.network_tree.heading("Remote Address", text="Remote Address")
-        self.network_tree.heading("Status", text="Status")
-        self.network_tree.heading("PID", text="PID")
-        self.network_tree.pack(fill="both", expand=True)
+        columns = ("Local Address", "Remote Address", "Status", "PID")
+        self.network_table = VirtualTable(tab, columns, columns)
+        self.network_table.frame.pack(fill="both", expand=True)
+        self.network_tree = self.network_table.tree
+
+    def setup_disks_tab(self, tab):
+        # Ёмкость всех разделов, включая сетевые
+        columns = ("Mount", "Device", "Type", "Used (GB)", "Total (GB)", "Usage (%)")
+        self.mount_table = VirtualTable(tab, columns, columns)
+        self.mount_table.tree.configure(height=8)
+        self.mount_table.frame.pack(fill="both", expand=True)
+
+        # Ввод-вывод по устройствам
+        columns = ("Device", "r/s", "w/s", "Read", "Write", "await (ms)", "Util (%)", "Queue")
+        self.disk_io_table = VirtualTable(tab, columns, columns)
+        self.disk_io_table.frame.pack(fill="both", expand=True)
 
     def setup_notifications_tab(self, tab):
-        # Список уведомлений
-        self.notifications_listbox = ctk.CTkTextbox(tab, wrap="none")
-        self.notifications_listbox.pack(fill="both", expand=True)
+        # Фильтр по метрике и диапазону времени; выборку делает индекс журнала
+        filters = ctk.CTkFrame(tab, fg_color="transparent")
+        filters.pack(fill="x", pady=5)
+        ctk.CTkLabel(filters, text=translate("filter_notifications") + ":").pack(side="left", padx=10)
+        ctk.CTkOptionMenu(
+            filters, values=list(NOTIFICATION_FILTERS), variable=self.notification_metric_var, command=self.filter_notifications
+        ).pack(side="left", padx=5)
+        ctk.CTkOptionMenu(
+            filters, values=list(NOTIFICATION_RANGES), variable=self.notification_range_var, command=self.filter_notifications
+        ).pack(side="left", padx=5)
 
-        # Кнопки для управления уведомлениями
-        clear_button = ctk.CTkButton(tab, text=translate("clear_notifications"), command=self.clear_notifications, corner_radius=10)
-        clear_button.pack(pady=10)
+        # Список уведомлений: одна страница журнала, от новых к старым
+        columns = ("Time", "Severity", "Metric", "Message", "Value", "Threshold")
+        self.notifications_table = VirtualTable(tab, columns, columns)
+        self.notifications_table.frame.pack(fill="both", expand=True)
 
-        filter_button = ctk.CTkButton(tab, text=translate("filter_notifications"), command=self.filter_notifications, corner_radius=10)
-        filter_button.pack(pady=10)
+        # Листание страниц и очистка
+        controls = ctk.CTkFrame(tab, fg_color="transparent")
+        controls.pack(pady=10)
+        ctk.CTkButton(controls, text="< Newer", width=80, command=lambda: self.turn_notifications_page(-1)).pack(side="left", padx=5)
+        self.notifications_page_label = ctk.CTkLabel(controls, text="")
+        self.notifications_page_label.pack(side="left", padx=10)
+        ctk.CTkButton(controls, text="Older >", width=80, command=lambda: self.turn_notifications_page(1)).pack(side="left", padx=5)
+        clear_button = ctk.CTkButton(controls, text=translate("clear_notifications"), command=self.clear_notifications, corner_radius=10)
+        clear_button.pack(side="left", padx=20)
+        self.show_notifications()
+
+    def show_notifications(self):
+        if self.journal is None:
+            self.notifications_page_label.configure(text="Event journal is unavailable, alerts are written to the log")
+            return
+        page_size = config["notifications_page_size"]
+        span = NOTIFICATION_RANGES[self.notification_range_var.get()]
+        start = time.time() - span if span else None
+        if self.notifications_cleared is not None:
+            start = max(start or 0.0, self.notifications_cleared)
+        metrics = NOTIFICATION_FILTERS[self.notification_metric_var.get()]
+        events, total = self.journal.query(metrics, start, None, self.notifications_page * page_size, page_size)
+        pages = max(1, -(-total // page_size))
+        if self.notifications_page >= pages:
+            # После очистки или смены фильтра страниц могло стать меньше
+            self.notifications_page = pages - 1
+            events, total = self.journal.query(metrics, start, None, self.notifications_page * page_size, page_size)
+        self.notifications_table.set_rows([
+            ((event.timestamp, event.key, event.severity), (
+                datetime.fromtimestamp(event.timestamp).strftime("%Y-%m-%d %H:%M:%S"), event.severity, event.metric,
+                f"{event.title}: {event.message}", event.value, event.threshold
+            ))
+            for event in events
+        ])
+        self.notifications_page_label.configure(text=f"Page {self.notifications_page + 1} of {pages} · {total} events")
+
+    def turn_notifications_page(self, step):
+        self.notifications_page = max(0, self.notifications_page + step)
+        self.show_notifications()
 
     def setup_settings_tab(self, tab):
         # Настройки порогов и интервала обновления
@@ -421,207 +4638,607 @@ class SystemMonitorApp:
             "Python Version": platform.python_version(),
             "CPU Cores": psutil.cpu_count(logical=False),
             "Logical CPUs": psutil.cpu_count(logical=True),
-            "Total Memory": f"{psutil.virtual_memory().total / (1024 ** 3):.2f} GB",
-            "Total Disk": f"{psutil.disk_usage('/').total / (1024 ** 3):.2f} GB"
+            "Total Memory": f"{psutil.virtual_memory().total / (1024 ** 3):.2f} GB"
         }
         for i, (key, value) in enumerate(system_info.items()):
             ctk.CTkLabel(tab, text=f"{key}: {value}", font=("Arial", 14)).grid(row=i, column=0, padx=10, pady=5, sticky="w")
 
+        # Фактический темп коллекторов: целевой интервал, достигнутая частота, дрожание и стоимость
+        tab.grid_columnconfigure(0, weight=1)
+        tab.grid_rowconfigure(len(system_info), weight=1)
+        columns = ("Collector", "Interval (s)", "Rate (Hz)", "Jitter (ms)", "Cost (ms)", "Backoff")
+        self.collector_table = VirtualTable(tab, columns, columns)
+        self.collector_table.frame.grid(row=len(system_info), column=0, padx=10, pady=10, sticky="nsew")
+
+    def setup_fleet_tab(self, tab):
+        self.fleet_label = ctk.CTkLabel(tab, text="Showing: this computer", font=("Arial", 14))
+        self.fleet_label.pack(pady=5)
+        columns = ("Host", "Status", "CPU (%)", "Memory (%)", "Disk (%)", "GPU (%)", "Last Seen", "Received")
+        self.fleet_table = VirtualTable(tab, columns, columns)
+        self.fleet_table.frame.pack(fill="both", expand=True)
+        # Двойной щелчок или кнопка переключают остальные вкладки на выбранный хост
+        self.fleet_table.tree.bind("<Double-1>", lambda event: self.show_selected_host())
+        buttons = ctk.CTkFrame(tab, fg_color="transparent")
+        buttons.pack(pady=10)
+        ctk.CTkButton(buttons, text="Show Selected Host", command=self.show_selected_host, corner_radius=10).pack(side="left", padx=5)
+        ctk.CTkButton(buttons, text="Show This Computer", command=lambda: self.select_source(None), corner_radius=10).pack(side="left", padx=5)
+
+    def show_selected_host(self):
+        keys = self.fleet_table.selected_keys()
+        if keys:
+            self.select_source(keys[0])
+
+    def select_source(self, name):
+        self.source = name
+        self.source_seen = None
+        # История графиков начинается заново: снимки другого хоста не смешиваются с текущими
+        self.history = MetricHistory(config["history_size"])
+        self.range_var.set("live")
+        self.change_range("live")
+        self.root.title(f"System Monitor - {name}" if name else "System Monitor")
+        self.fleet_label.configure(text=f"Showing: {name}" if name else "Showing: this computer")
+
+    def render_fleet(self):
+        now = time.time()
+        rows = []
+        for host in self.fleet.snapshot_hosts():
+            snapshot = host.latest
+            if snapshot is None:
+                continue
+            mem = snapshot.memory['percent'] if snapshot.memory else None
+            disk = snapshot.disk['percent'] if snapshot.disk else None
+            gpu = gpu_average(snapshot.gpus)
+            rows.append((host.name, (
+                host.name,
+                "online" if host.connected else "offline",
+                "N/A" if snapshot.cpu is None else snapshot.cpu,
+                "N/A" if mem is None else mem,
+                "N/A" if disk is None else disk,
+                "N/A" if gpu is None else f"{gpu:.1f}",
+                f"{now - host.last_seen:.0f} s ago",
+                f"{host.bytes / 1024:.0f} KB"
+            )))
+        self.fleet_table.set_rows(sorted(rows))
+
+    def settings_vars(self):
+        return {
+            "cpu_threshold": self.cpu_threshold_var,
+            "memory_threshold": self.memory_threshold_var,
+            "disk_threshold": self.disk_threshold_var,
+            "gpu_threshold": self.gpu_threshold_var,
+            "gpu_memory_threshold": self.gpu_memory_threshold_var,
+            "update_interval": self.update_interval_var,
+            "theme": self.theme_var,
+            "language": self.language_var
+        }
+
+    def refresh_settings_vars(self):
+        for key, var in self.settings_vars().items():
+            var.set(str(config[key]))
+
     def save_settings(self):
-        global CPU_THRESHOLD, MEMORY_THRESHOLD, DISK_THRESHOLD, GPU_THRESHOLD, GPU_MEMORY_THRESHOLD, UPDATE_INTERVAL, THEME, LANGUAGE
-        CPU_THRESHOLD = int(self.cpu_threshold_var.get())
-        MEMORY_THRESHOLD = int(self.memory_threshold_var.get())
-        DISK_THRESHOLD = int(self.disk_threshold_var.get())
-        GPU_THRESHOLD = int(self.gpu_threshold_var.get())
-        GPU_MEMORY_THRESHOLD = int(self.gpu_memory_threshold_var.get())
-        UPDATE_INTERVAL = int(self.update_interval_var.get())
-        THEME = self.theme_var.get()
-        LANGUAGE = self.language_var.get()
-        ctk.set_appearance_mode(THEME)
-        self.update_plots_theme()
-        config.update({
-            "cpu_threshold": CPU_THRESHOLD,
-            "memory_threshold": MEMORY_THRESHOLD,
-            "disk_threshold": DISK_THRESHOLD,
-            "gpu_threshold": GPU_THRESHOLD,
-            "gpu_memory_threshold": GPU_MEMORY_THRESHOLD,
-            "update_interval": UPDATE_INTERVAL,
-            "theme": THEME,
-            "language": LANGUAGE
-        })
-        with open("config.json", "w") as f:
-            json.dump(config, f, indent=4)
-        messagebox.showinfo(translate("settings_saved"), "Settings have been saved successfully.")
+        # Файл проверяется по схеме и пишется атомарно; применяет его движок на границе
+        # тика, как и любую внешнюю правку config.json
+        raw = config_to_json(config)
+        try:
+            for key, var in self.settings_vars().items():
+                value = var.get().strip()
+                raw[key] = value if key in ("theme", "language") else json.loads(value)
+            values, _ = parse_config(raw, strict=True)
+            save_config(values)
+        except (ValueError, OSError) as e:
+            messagebox.showerror(translate("error"), f"Settings were not saved: {e}")
+            return
+        self.engine.wake()
+        note = " The language applies after a restart." if values["language"] != LANGUAGE else ""
+        messagebox.showinfo(translate("settings_saved"), f"Settings have been saved successfully.{note}")
+
+    def apply_config(self, values):
+        # Вызывается в UI-потоке, когда движок перешёл на новую конфигурацию
+        previous, self.applied_config = self.applied_config, values
+        if values["theme"] != previous["theme"]:
+            ctk.set_appearance_mode(values["theme"])
+            self.update_plots_theme()
+        self.refresh_settings_vars()
+        self.on_tab_change()
 
     def update_plots_theme(self):
-        self.cpu_plot.set_title(translate("cpu_usage"), color="white" if THEME == "dark" else "black")
-        self.cpu_plot.set_ylabel("CPU (%)", color="white" if THEME == "dark" else "black")
-        self.memory_plot.set_title(translate("memory_usage"), color="white" if THEME == "dark" else "black")
-        self.memory_plot.set_ylabel("Memory (%)", color="white" if THEME == "dark" else "black")
-        self.disk_plot.set_title(translate("disk_usage"), color="white" if THEME == "dark" else "black")
-        self.disk_plot.set_ylabel("Disk (%)", color="white" if THEME == "dark" else "black")
-        self.gpu_plot.set_title(translate("gpu_usage"), color="white" if THEME == "dark" else "black")
-        self.gpu_plot.set_ylabel("GPU (%)", color="white" if THEME == "dark" else "black")
+        self.cpu_plot.set_title(translate("cpu_usage"), color="white" if config["theme"] == "dark" else "black")
+        self.cpu_plot.set_ylabel("CPU (%)", color="white" if config["theme"] == "dark" else "black")
+        self.memory_plot.set_title(translate("memory_usage"), color="white" if config["theme"] == "dark" else "black")
+        self.memory_plot.set_ylabel("Memory (%)", color="white" if config["theme"] == "dark" else "black")
+        self.disk_plot.set_title(translate("disk_usage"), color="white" if config["theme"] == "dark" else "black")
+        self.disk_plot.set_ylabel("Disk (%)", color="white" if config["theme"] == "dark" else "black")
+        self.gpu_plot.set_title(translate("gpu_usage"), color="white" if config["theme"] == "dark" else "black")
+        self.gpu_plot.set_ylabel("GPU (%)", color="white" if config["theme"] == "dark" else "black")
         self.canvas.draw()
 
+    def next_snapshot(self):
+        if self.source is None:
+            return self.engine.latest()
+        # Агент присылает снимки пачками: промежуточные попадают только в историю графиков
+        snapshots = self.fleet.snapshots_since(self.source, self.source_seen)
+        if not snapshots:
+            return None
+        for snapshot in snapshots[:-1]:
+            self.record_history(snapshot)
+        self.source_seen = snapshots[-1].timestamp
+        return snapshots[-1]
+
     def update_system_info(self):
-        # Получение данных
-        cpu = get_cpu_usage()
-        mem = get_memory_usage()
-        disk = get_disk_usage()
-        gpu = get_gpu_usage()
-        temp = get_cpu_temperature()
-        processes = get_top_processes()
-        connections = get_network_connections()
+        if self.engine.config is not self.applied_config:
+            self.apply_config(self.engine.config)
+        # UI-поток только отрисовывает последний готовый снимок
+        if "fleet" in self.built_tabs and time.monotonic() - self.fleet_rendered >= 1.0:
+            self.fleet_rendered = time.monotonic()
+            self.render_fleet()
+        snapshot = self.next_snapshot()
+        if snapshot is not None:
+            started = time.perf_counter()
+            self.render_snapshot(snapshot)
+            self.show_alert_events()
+            self.ui_tick_time = (time.perf_counter() - started) * 1000
+            self.ui_tick_max = max(self.ui_tick_max, self.ui_tick_time)
+            self.ui_tick_label.configure(text=f"UI: {self.ui_tick_time:.1f} ms (max {self.ui_tick_max:.1f} ms)")
+            if self.ui_tick_time > UI_TICK_BUDGET_MS:
+                logging.warning(f"UI tick took {self.ui_tick_time:.1f} ms (budget {UI_TICK_BUDGET_MS} ms)")
+            if self.overlay is not None:
+                self.render_overlay(snapshot)
+            if not self.first_painted:
+                self.finish_first_paint()
+
+        # Пока тики сбора падают, новых снимков нет: строка состояния говорит об этом явно
+        error = self.engine.last_error if self.source is None else None
+        if error != self.shown_collection_error:
+            self.shown_collection_error = error
+            if error is not None:
+                self.ui_tick_label.configure(text=f"Collection failing: {error}", text_color="red")
+            else:
+                self.ui_tick_label.configure(text_color=self.ui_tick_color)
+
+        # Планирование следующего опроса
+        self.root.after(UI_POLL_INTERVAL, self.update_system_info)
+
+    def finish_first_paint(self):
+        self.first_painted = True
+        self.root.update_idletasks()
+        mark_startup("first_paint")
+        logging.info(f"GUI first paint in {STARTUP_MARKS['first_paint']:.0f} ms, RSS {resident_memory():.1f} MB")
+        if self.startup_report:
+            for stage, elapsed in STARTUP_MARKS.items():
+                print(f"{stage:<12} {elapsed:>8.1f} ms")
+            self.root.after(0, self.on_close)
+
+    def toggle_overlay(self):
+        if self.overlay is not None:
+            self.overlay.destroy()
+            self.overlay = None
+            return
+        self.overlay = ctk.CTkLabel(self.root, text="", font=("Courier", 11), justify="left", anchor="nw",
+                                    fg_color=("gray85", "gray17"), corner_radius=6)
+        self.overlay.place(relx=1.0, rely=0.0, x=-10, y=40, anchor="ne")
+        self.overlay.bind("<Button-1>", lambda event: self.toggle_overlay())
+        # Первый вызов cpu_percent только запоминает точку отсчёта
+        self.own_process.cpu_percent()
+
+    def render_overlay(self, snapshot):
+        lines = ["Collectors (ms)"]
+        for name, duration in snapshot.durations.items():
+            lines.append(f"  {name:<12} {duration * 1000:>8.2f}")
+        lines.append("UI (ms)")
+        for name, duration in self.ui_stages.items():
+            lines.append(f"  {name:<12} {duration:>8.2f}")
+        lines.append(f"  {'total':<12} {self.ui_tick_time:>8.2f}")
+        try:
+            with self.own_process.oneshot():
+                cpu = self.own_process.cpu_percent()
+                rss = self.own_process.memory_info().rss / (1024 ** 2)
+                threads = self.own_process.num_threads()
+            lines.append(f"Monitor: CPU {cpu:.1f}% · RSS {rss:.1f} MB · {threads} threads")
+        except psutil.Error as e:
+            logging.error(f"Error reading monitor usage: {e}")
+        self.overlay.configure(text="\n".join(lines))
+
+    def render_snapshot(self, snapshot):
+        cpu = snapshot.cpu or 0.0
+        mem = snapshot.memory or {'percent': 0.0}
+        disk = snapshot.disk or {'percent': 0.0}
+
+        # Время каждой стадии отрисовки для оверлея профилирования
+        self.ui_stages = {}
+        mark = time.perf_counter()
 
         # Обновление меток
         self.cpu_usage_label.configure(text=f"CPU Usage: {cpu}%")
         self.cpu_progress.set(cpu / 100)
+        if snapshot.cpu_stats:
+            stats = snapshot.cpu_stats
+            self.cpu_split_label.configure(text=f"usr {stats['user']}% · sys {stats['system']}% · iowait {stats['iowait']}% · steal {stats['steal']}%")
+            self.update_cpu_heat_strip(stats['per_cpu'])
         self.memory_usage_label.configure(text=f"Memory Usage: {mem['percent']}%")
         self.memory_progress.set(mem['percent'] / 100)
         self.disk_usage_label.configure(text=f"Disk Usage: {disk['percent']}%")
         self.disk_progress.set(disk['percent'] / 100)
-        if gpu:
-            self.gpu_usage_label.configure(text=f"GPU Usage: {gpu['usage']:.1f}%")
-            self.gpu_progress.set(gpu['usage'] / 100)
+        gpu_usage = gpu_average(snapshot.gpus)
+        if gpu_usage is not None:
+            # При нескольких устройствах плитка и график показывают среднюю загрузку
+            count = len(snapshot.gpus)
+            suffix = f" ({count} GPUs, avg)" if count > 1 else ""
+            self.gpu_usage_label.configure(text=f"GPU Usage: {gpu_usage:.1f}%{suffix}")
+            self.gpu_progress.set(gpu_usage / 100)
+
+        mark = self.end_stage("labels", mark)
 
         # Обновление графиков
-        self.time_data.append(datetime.now())
-        self.cpu_data.append(cpu)
-        self.memory_data.append(mem['percent'])
-        self.disk_data.append(disk['percent'])
-        if gpu:
-            self.gpu_data.append(gpu['usage'])
-
-        if len(self.time_data) > 10:
-            self.time_data.pop(0)
-            self.cpu_data.pop(0)
-            self.memory_data.pop(0)
-            self.disk_data.pop(0)
-            if gpu:
-                self.gpu_data.pop(0)
-
-        self.cpu_plot.clear()
-        self.cpu_plot.plot(self.time_data, self.cpu_data, label="CPU (%)", color="cyan")
-        self.cpu_plot.legend()
-        self.cpu_plot.grid(True, linestyle="--", alpha=0.6)
+        self.record_history(snapshot)
+        # Пропуски GPU хранятся как NaN и отображаются разрывами линии
+        times, columns = self.chart_data()
+        self.renderer.set_window(self.chart_window())
+        self.renderer.update(times, columns)
+        mark = self.end_stage("charts", mark)
 
-        self.memory_plot.clear()
-        self.memory_plot.plot(self.time_data, self.memory_data, label="Memory (%)", color="lime")
-        self.memory_plot.legend()
-        self.memory_plot.grid(True, linestyle="--", alpha=0.6)
+        # Обновляется только видимая вкладка, и только если она уже построена
+        visible = self.tab_control.get()
+        for name, render in self.tab_renderers.items():
+            if translate(name) != visible:
+                continue
+            render(snapshot)
+            mark = self.end_stage(name, mark)
+        self.shown_snapshot = snapshot
 
-        self.disk_plot.clear()
-        self.disk_plot.plot(self.time_data, self.disk_data, label="Disk (%)", color="magenta")
-        self.disk_plot.legend()
-        self.disk_plot.grid(True, linestyle="--", alpha=0.6)
+    def end_stage(self, name, started):
+        now = time.perf_counter()
+        self.ui_stages[name] = (now - started) * 1000
+        return now
 
-        if gpu:
-            self.gpu_plot.clear()
-            self.gpu_plot.plot(self.time_data, self.gpu_data, label="GPU (%)", color="orange")
-            self.gpu_plot.legend()
-            self.gpu_plot.grid(True, linestyle="--", alpha=0.6)
+    def render_processes(self, snapshot):
+        # Заполняется только показанный вид; остальные догоняют при переключении
+        view = self.process_view_var.get()
+        if view == "Top":
+            self.process_table.set_rows([
+                (proc['pid'], (proc['pid'], proc['name'], f"{proc['cpu']:.1f}", f"{proc['memory']:.1f}"))
+                for proc in snapshot.processes or ()
+            ])
+        elif view == "Tree":
+            self.render_process_tree(snapshot.process_tree)
+        else:
+            self.render_cgroups(snapshot.cgroups)
+        # Вызывается только для открытой вкладки, поэтому график не рисуется впустую
+        if self.selected_pids():
+            self.update_process_chart()
 
-        self.canvas.draw()
+    def render_process_tree(self, tree):
+        if tree is None:
+            self.process_tree_table.set_tree((), {}, None)
+            return
+        nodes = tree['nodes']
 
-        # Обновление таблицы процессов
-        self.process_tree.delete(*self.process_tree.get_children())
-        for proc in processes:
-            self.process_tree.insert("", "end", values=(proc['pid'], proc['name'], f"{proc['cpu']:.1f}", f"{proc['memory']:.1f}"))
+        def describe(pid):
+            node = nodes[pid]
+            return (
+                node.name, pid, f"{node.cpu:.1f}", f"{node.memory:.1f}", f"{node.io:.2f}",
+                f"{node.total_cpu:.1f}", f"{node.total_memory:.1f}", f"{node.total_io:.2f}", node.descendants
+            )
 
-        # Обновление таблицы сетевых соединений
-        self.network_tree.delete(*self.network_tree.get_children())
-        for conn in connections:
-            self.network_tree.insert("", "end", values=(
-                conn['local_address'], conn['remote_address'], conn['status'], conn['pid']
-            ))
+        self.process_tree_table.set_tree(tree['roots'], tree['children'], describe)
 
-        # Проверка порогов и уведомления
-        alerts = check_thresholds(cpu, mem['percent'], disk['percent'], gpu)
-        for title, message in alerts:
-            notify(title, message)
-            self.notifications.append(f"{datetime.now()} - {title}: {message}")
-            self.notifications_listbox.insert("end", f"{datetime.now()} - {title}: {message}\n")
+    def render_cgroups(self, groups):
+        groups = groups or {}
+        children = {}
+        for path in groups:
+            if path != "/":
+                children.setdefault(cgroup_parent(path), []).append(path)
+        by_cpu = lambda path: -groups[path]['cpu']
+        children = {path: tuple(sorted(kids, key=by_cpu)) for path, kids in children.items()}
+        roots = tuple(sorted((path for path in groups if path == "/" or cgroup_parent(path) not in groups), key=by_cpu))
 
-        # Планирование следующего обновления
-        self.root.after(int(self.update_interval_var.get()), self.update_system_info)
+        def describe(path):
+            group = groups[path]
+            return (
+                cgroup_label(path), f"{group['cpu']:.1f}", f"{group['memory']:.1f}", f"{group['io']:.2f}", group['processes']
+            )
+
+        self.cgroup_table.set_tree(roots, children, describe)
+
+    def render_disks(self, snapshot):
+        if snapshot.mounts is not None:
+            self.mount_table.set_rows([
+                (mount['mount'], (
+                    mount['mount'] + (" (stale)" if mount['stale'] else ""), mount['device'], mount['fstype'],
+                    f"{mount['used']:.1f}", f"{mount['total']:.1f}", f"{mount['percent']:.1f}"
+                ))
+                for mount in snapshot.mounts
+            ])
+        if snapshot.disk_io is not None:
+            self.disk_io_table.set_rows([
+                (name, (
+                    name, f"{io['reads']:.0f}", f"{io['writes']:.0f}", format_rate(io['read_bytes']), format_rate(io['write_bytes']),
+                    f"{io['await']:.2f}", f"{io['util']:.1f}", "N/A" if io['queue'] is None else f"{io['queue']:.2f}"
+                ))
+                for name, io in sorted(snapshot.disk_io.items())
+            ])
+
+    def render_schedule(self, snapshot):
+        if not snapshot.schedule:
+            return
+        rows = []
+        for name, stats in snapshot.schedule.items():
+            if stats['paused']:
+                rate, jitter = "paused", ""
+            else:
+                rate = "N/A" if stats['rate'] is None else f"{stats['rate']:.3f}"
+                jitter = "N/A" if stats['jitter'] is None else f"{stats['jitter'] * 1000:.1f}"
+            rows.append((name, (name, f"{stats['interval']:g}", rate, jitter, f"{stats['cost'] * 1000:.1f}", f"x{stats['backoff']}")))
+        self.collector_table.set_rows(rows)
+
+    def record_history(self, snapshot):
+        self.history.append(
+            snapshot.timestamp.timestamp(),
+            cpu=snapshot.cpu,
+            memory=snapshot.memory['percent'] if snapshot.memory else None,
+            disk=snapshot.disk['percent'] if snapshot.disk else None,
+            gpu=gpu_average(snapshot.gpus)
+        )
+
+    def render_network(self, snapshot):
+        # Таблица сетевых соединений
+        rows = []
+        for conn in snapshot.connections or ():
+            values = (conn['local_address'], conn['remote_address'], conn['status'], conn['pid'])
+            rows.append((values, values))
+        self.network_table.set_rows(rows)
+        network = snapshot.network
+        if not network:
+            return
+        self.interface_table.set_rows([
+            (name, (
+                name, format_rate(nic['rx']), format_rate(nic['tx']),
+                f"{nic['rx_packets']:.0f}", f"{nic['tx_packets']:.0f}", f"{nic['errors']:.1f}"
+            ))
+            for name, nic in sorted(network['interfaces'].items())
+        ])
+        states = network['states']
+        summary = " · ".join(f"{state} {count}" for state, count in sorted(states.items(), key=lambda item: -item[1]))
+        self.tcp_states_label.configure(
+            text=f"TCP sockets: {network['total']} (TIME_WAIT {states.get('TIME_WAIT', 0)}, SYN_SENT {states.get('SYN_SENT', 0)})  {summary}"
+        )
+        self.connections_by_pid_table.set_rows([
+            (pid, ("?" if pid is None else pid, name or "?", count)) for pid, name, count in network['by_pid']
+        ])
+        self.connections_by_remote_table.set_rows([(remote, (remote, count)) for remote, count in network['by_remote']])
+
+    def show_alert_events(self):
+        # События уже записаны в журнал: пачка из очереди перечитывает страницу один раз
+        # и только если та показывает самые новые
+        received = False
+        while True:
+            try:
+                self.alert_events.get_nowait()
+            except queue.Empty:
+                break
+            received = True
+        if received and "notifications" in self.built_tabs and self.notifications_page == 0:
+            self.show_notifications()
 
     def save_data(self):
-        # Сохранение данных в файл
-        filename = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV files", "*.csv"), ("JSON files", "*.json")])
-        if filename:
-            if filename.endswith(".csv"):
-                with open(filename, "w", newline="") as f:
-                    writer = csv.writer(f)
-                    writer.writerow(["Time", "CPU (%)", "Memory (%)", "Disk (%)", "GPU (%)"])
-                    for i in range(len(self.time_data)):
-                        writer.writerow([
-                            self.time_data[i],
-                            self.cpu_data[i],
-                            self.memory_data[i],
-                            self.disk_data[i],
-                            self.gpu_data[i] if self.gpu_data else "N/A"
-                        ])
-            elif filename.endswith(".json"):
-                data = {
-                    "time": [str(t) for t in self.time_data],
-                    "cpu": self.cpu_data,
-                    "memory": self.memory_data,
-                    "disk": self.disk_data,
-                    "gpu": self.gpu_data if self.gpu_data else []
-                }
-                with open(filename, "w") as f:
-                    json.dump(data, f, indent=4)
-            messagebox.showinfo(translate("data_saved"), "Data has been saved successfully.")
+        # Диалог экспорта: диапазон, набор метрик и формат (по расширению файла)
+        window = ctk.CTkToplevel(self.root)
+        window.title(translate("save_data"))
+        window.geometry("300x320")
+
+        ctk.CTkLabel(window, text="Range:").pack(pady=5)
+        range_var = ctk.StringVar(value=self.range_var.get())
+        ctk.CTkOptionMenu(window, values=list(HISTORY_RANGES), variable=range_var).pack(pady=5)
+        ctk.CTkLabel(window, text="Metrics:").pack(pady=5)
+        metric_vars = {}
+        for name in MetricHistory.columns:
+            metric_vars[name] = ctk.BooleanVar(value=True)
+            ctk.CTkCheckBox(window, text=name, variable=metric_vars[name]).pack(anchor="w", padx=80, pady=2)
+
+        def export():
+            metrics = [name for name, var in metric_vars.items() if var.get()]
+            if not metrics:
+                return
+            filename = filedialog.asksaveasfilename(
+                parent=window,
+                defaultextension=".csv",
+                filetypes=[(label, f"*{extension}") for label, extension in EXPORT_FORMATS]
+            )
+            if not filename:
+                return
+            try:
+                check_export_path(filename)
+            except ValueError as e:
+                messagebox.showerror(translate("error"), str(e), parent=window)
+                return
+            window.destroy()
+            self.export_async(filename, range_var.get(), metrics)
+
+        ctk.CTkButton(window, text=translate("save_data"), command=export, corner_radius=10).pack(pady=10)
+
+    def export_async(self, filename, range_name, metrics):
+        # Буфер в памяти копируется в UI-потоке; чтение хранилища и запись файла идут в фоне
+        rows = None
+        if range_name == "live" or self.store is None:
+            columns = [self.history.column(name).tolist() for name in metrics]
+            rows = zip(self.history.times().tolist(), *columns)
+
+        def export():
+            try:
+                if rows is None:
+                    start, end = self.range_bounds(range_name)
+                    source = store_rows(self.store, start, end, metrics)
+                else:
+                    source = rows
+                count = export_history(source, filename, metrics)
+            except Exception as e:
+                logging.error(f"Error exporting data to {filename}: {e}")
+                self.root.after(0, lambda error=e: messagebox.showerror(translate("error"), f"Failed to save data: {error}"))
+                return
+            self.root.after(0, lambda: messagebox.showinfo(translate("data_saved"), f"{count} rows have been saved to {filename}."))
+
+        threading.Thread(target=export, daemon=True).start()
 
     def clear_notifications(self):
-        self.notifications_listbox.delete("1.0", "end")
-        self.notifications = []
-
-    def filter_notifications(self):
-        filter_window = ctk.CTkToplevel(self.root)
-        filter_window.title("Filter Notifications")
-        filter_window.geometry("300x200")
-
-        ctk.CTkLabel(filter_window, text="Filter by type:").pack(pady=10)
-        filter_type = ctk.CTkOptionMenu(filter_window, values=["CPU", "Memory", "Disk", "GPU"])
-        filter_type.pack(pady=10)
-
-        def apply_filter():
-            filter_text = filter_type.get()
-            self.notifications_listbox.delete("1.0", "end")
-            for note in self.notifications:
-                if filter_text in note:
-                    self.notifications_listbox.insert("end", note + "\n")
-
-        ctk.CTkButton(filter_window, text="Apply", command=apply_filter).pack(pady=10)
-
-    def terminate_process(self):
-        # Завершение выбранного процесса
-        selected_item = self.process_tree.selection()
-        if selected_item:
-            pid = int(self.process_tree.item(selected_item, "values")[0])
+        self.notifications_cleared = time.time()
+        self.notifications_page = 0
+        self.show_notifications()
+
+    def filter_notifications(self, value=None):
+        self.notifications_page = 0
+        self.show_notifications()
+
+    def terminate_process(self, subtree=False):
+        if self.source is not None:
+            messagebox.showerror(translate("error"), f"Processes of {self.source} cannot be terminated from here.")
+            return
+        if subtree:
+            self.terminate_subtrees(self.selected_pids())
+            return
+        # Завершение выбранных процессов: PID берётся из ключа строки, а не из её текущего положения,
+        # и процесс сверяется со снимком по времени запуска
+        pids = self.selected_pids()
+        if not pids or not self.confirm_terminate(translate("terminate_process"), pids):
+            return
+        for pid in pids:
             try:
-                psutil.Process(pid).terminate()
+                proc = verified_process(pid, self.snapshot_create_time(pid))
+                if proc is None:
+                    messagebox.showerror(translate("error"), f"Process {pid} has exited; its PID now belongs to another process.")
+                    continue
+                proc.terminate()
                 messagebox.showinfo(translate("process_terminated"), f"Process {pid} terminated successfully.")
             except psutil.NoSuchProcess:
                 messagebox.showerror(translate("error"), "Process not found.")
             except psutil.AccessDenied:
                 messagebox.showerror(translate("error"), "Access denied.")
 
+    def snapshot_process(self, pid):
+        # (имя, время запуска) процесса в показанном снимке
+        snapshot = self.shown_snapshot
+        if snapshot is None:
+            return None, None
+        if snapshot.process_tree is not None and pid in snapshot.process_tree['nodes']:
+            node = snapshot.process_tree['nodes'][pid]
+            return node.name, node.create_time
+        for proc in snapshot.processes or ():
+            if proc['pid'] == pid:
+                return proc['name'], proc.get('create_time')
+        return None, None
+
+    def snapshot_create_time(self, pid):
+        return self.snapshot_process(pid)[1]
+
+    def confirm_terminate(self, title, pids, limit=20):
+        lines = [f"{pid} {self.snapshot_process(pid)[0] or '?'}" for pid in pids[:limit]]
+        if len(pids) > limit:
+            lines.append(f"... and {len(pids) - limit} more")
+        return messagebox.askyesno(title, f"Terminate {len(pids)} processes?\n\n" + "\n".join(lines))
+
+    def terminate_subtrees(self, pids):
+        tree = self.shown_snapshot.process_tree if self.shown_snapshot is not None else None
+        if tree is None:
+            messagebox.showerror(translate("error"), "The process tree is not available yet.")
+            return
+        # Поддеревья берутся из показанного снимка, дети завершаются раньше родителей
+        targets = {}
+        for pid in pids:
+            for member in subtree_pids(tree, pid):
+                if member in tree['nodes']:
+                    targets[member] = tree['nodes'][member].create_time
+        if not targets:
+            return
+        if not self.confirm_terminate(translate("terminate_tree"), list(targets)):
+            return
+        terminated = 0
+        denied = []
+        for pid, create_time in targets.items():
+            try:
+                # PID мог достаться другому процессу после снимка
+                proc = verified_process(pid, create_time)
+                if proc is None:
+                    continue
+                proc.terminate()
+                terminated += 1
+            except psutil.NoSuchProcess:
+                continue
+            except psutil.AccessDenied:
+                denied.append(pid)
+        if denied:
+            messagebox.showerror(translate("error"), f"Terminated {terminated} processes; access denied for PID {', '.join(map(str, denied))}.")
+        else:
+            messagebox.showinfo(translate("process_terminated"), f"Terminated {terminated} processes.")
+
     def send_to_cloud(self):
-        # Отправка данных в облако (AWS S3)
-        def upload_to_s3():
+        # Досылка новых записей журналов в S3; сама отправка идёт вне UI-потока
+        if self.shipper is None:
+            messagebox.showerror(translate("error"), "Cloud upload is not configured: set s3_bucket in config.json.")
+            return
+
+        def upload():
             try:
-                s3 = boto3.client('s3', aws_access_key_id=config["aws_access_key"], aws_secret_access_key=config["aws_secret_key"])
-                s3.upload_file('system_monitor.log', 'your-bucket-name', 'system_monitor.log')
-                messagebox.showinfo("Success", "Data has been sent to the cloud.")
+                summary = self.shipper.ship()
             except Exception as e:
-                messagebox.showerror("Error", f"Failed to send data to the cloud: {e}")
+                logging.error(f"Error shipping logs: {e}")
+                self.root.after(0, lambda error=e: self.finish_upload(None, error))
+                return
+            self.root.after(0, lambda: self.finish_upload(summary, None))
+
+        self.cloud_button.configure(state="disabled")
+        threading.Thread(target=upload, daemon=True).start()
 
-        threading.Thread(target=upload_to_s3).start()
+    def report_upload_progress(self, key, sent, size, rate):
+        # Вызывается из потоков boto3; виджет обновляется в UI-потоке
+        percent = 100 * sent // max(size, 1)
+        self.root.after(0, lambda: self.cloud_button.configure(text=f"{translate('send_to_cloud')} {percent}% · {rate:.1f} MB/s"))
+
+    def finish_upload(self, summary, error):
+        self.cloud_button.configure(state="normal", text=translate("send_to_cloud"))
+        if error is not None:
+            messagebox.showerror(translate("error"), f"Failed to send data to the cloud: {error}")
+        elif summary is None:
+            messagebox.showinfo(translate("send_to_cloud"), "An upload is already in progress.")
+        elif not summary["objects"]:
+            messagebox.showinfo(translate("send_to_cloud"), "Nothing new to send.")
+        else:
+            messagebox.showinfo(
+                translate("send_to_cloud"),
+                f"Sent {summary['bytes'] / 1024:.0f} KB in {summary['objects']} objects "
+                f"({summary['compressed'] / 1024:.0f} KB compressed, {summary['throughput']:.2f} MB/s)."
+            )
 
 if __name__ == "__main__":
-    root = ctk.CTk()
-    app = SystemMonitorApp(root)
-    root.mainloop()
+    parser = argparse.ArgumentParser(description="System Monitor Pro")
+    parser.add_argument("--benchmark-backends", action="store_true", help="compare psutil and /proc collectors on synthetic process tables")
+    parser.add_argument("--benchmark", metavar="PATH", help="benchmark collectors and chart rendering on synthetic loads, write JSON results to PATH ('-' for stdout) and exit")
+    parser.add_argument("--daemon", action="store_true", help="run headless: collect at update_interval without the GUI")
+    parser.add_argument("--output", help="append samples as NDJSON to this file ('-' for stdout) in daemon mode")
+    parser.add_argument("--samples", type=int, help="stop the daemon after this many samples")
+    parser.add_argument("--metrics-port", type=int, help="serve Prometheus metrics on this port (overrides metrics_port, 0 disables)")
+    parser.add_argument("--agent", metavar="HOST:PORT", help="run headless and stream snapshots to a fleet collector")
+    parser.add_argument("--agent-name", help="host name reported by --agent (default: agent_name or the machine name)")
+    parser.add_argument("--fleet-port", type=int, help="accept agents on this port and show them on the Fleet tab (overrides fleet_port, 0 disables)")
+    parser.add_argument("--export", metavar="PATH", help="export stored history to PATH (.parquet, .arrow, .csv[.gz|.zst], .ndjson[.gz|.zst]) and exit")
+    parser.add_argument("--range", choices=[name for name in HISTORY_RANGES if HISTORY_RANGES[name]], default="24h", help="time range for --export")
+    parser.add_argument("--metrics", help="comma-separated metrics for --export (default: all)")
+    parser.add_argument("--startup-time", action="store_true", help="print GUI startup stages up to the first painted frame and exit")
+    args = parser.parse_args()
+    if args.benchmark_backends:
+        benchmark_backends()
+    elif args.benchmark:
+        run_benchmarks(args.benchmark)
+    elif args.export:
+        try:
+            count = run_export(args.export, args.range, args.metrics.split(",") if args.metrics else None)
+        except ValueError as e:
+            parser.error(str(e))
+        print(f"Exported {count} rows to {args.export}")
+    elif args.daemon or args.agent:
+        run_daemon(args.output, args.samples, args.metrics_port, args.agent, args.agent_name)
+    else:
+        mark_startup("imports")
+        load_gui_modules()
+        mark_startup("gui_modules")
+        root = ctk.CTk()
+        app = SystemMonitorApp(root, args.metrics_port, args.fleet_port, args.startup_time)
+        root.mainloop()